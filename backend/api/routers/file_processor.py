@@ -20,6 +20,7 @@ sys.path.insert(0, str(src_dir))
 from file_processor.summary_generator import SummaryGenerator
 from file_processor.parallel_reader import ParallelFileReader
 from file_processor.content_analyzer import ContentAnalyzer
+from file_processor.line_index import line_index_manager
 from tools.data_file_tools import DataFileTools
 
 logger = logging.getLogger(__name__)
@@ -49,6 +50,14 @@ class FileEditRequest(BaseModel):
     new_content: str = Field(..., description="新內容")
 
 
+class FileLinesRequest(BaseModel):
+    """文件行範圍讀取請求"""
+    file_path: str = Field(..., description="文件路徑")
+    start_line: int = Field(..., description="開始行號")
+    end_line: int = Field(..., description="結束行號")
+    encoding: str = Field(default="utf-8", description="文件編碼")
+
+
 class FileCreateRequest(BaseModel):
     """文件創建請求"""
     file_path: str = Field(..., description="文件路徑")
@@ -128,6 +137,41 @@ async def read_file_parallel(request: FileAnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/read-lines")
+async def read_file_lines(request: FileLinesRequest):
+    """讀取文件指定行範圍（使用行索引，只讀取該範圍）"""
+    try:
+        # 檢查文件是否存在
+        if not os.path.exists(request.file_path):
+            raise HTTPException(status_code=404, detail=f"文件不存在: {request.file_path}")
+
+        total_lines = line_index_manager.line_count(request.file_path)
+
+        # 驗證行號範圍
+        if request.start_line < 1 or request.end_line < request.start_line or request.start_line > total_lines:
+            raise HTTPException(status_code=400, detail="無效的行號範圍")
+
+        end_line = min(request.end_line, total_lines)
+        content = line_index_manager.read_text(
+            request.file_path, request.start_line, end_line, request.encoding
+        )
+
+        return {
+            "success": True,
+            "file_path": request.file_path,
+            "start_line": request.start_line,
+            "end_line": end_line,
+            "total_lines": total_lines,
+            "content": content
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"讀取文件行範圍失敗 {request.file_path}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/edit")
 async def edit_file(request: FileEditRequest):
     """編輯文件指定行範圍"""
@@ -161,6 +205,7 @@ async def edit_file(request: FileEditRequest):
         # 寫回文件
         with open(request.file_path, 'w', encoding='utf-8') as f:
             f.writelines(updated_lines)
+        line_index_manager.invalidate(request.file_path)
         
         logger.info(f"文件編輯完成: {request.file_path}")
         
@@ -252,8 +297,11 @@ async def get_file_info(file_path: str):
         # 計算行數（僅對文本文件）
         line_count = 0
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                line_count = sum(1 for _ in f)
+            if os.path.isfile(file_path):
+                with open(file_path, 'rb') as f:
+                    is_binary = b'\x00' in f.read(8192)
+                if not is_binary:
+                    line_count = line_index_manager.line_count(file_path)
         except:
             pass
         
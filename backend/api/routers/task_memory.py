@@ -6,9 +6,12 @@ Task Memory API 路由
 
 import os
 import sys
+import json
+import functools
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import logging
 
@@ -18,7 +21,8 @@ src_dir = current_dir.parent.parent / "src"
 sys.path.insert(0, str(src_dir))
 
 from task_memory.task_memory_manager import TaskMemoryManager
-from task_memory.session_storage import SessionStorage
+from task_memory.item_processor import process_single_item
+from task_memory.session_storage import create_session_storage
 from task_memory.progress_tracker import ProgressTracker, TaskStatus
 
 logger = logging.getLogger(__name__)
@@ -27,7 +31,7 @@ router = APIRouter()
 
 # 全局實例
 task_memory_manager = TaskMemoryManager()
-session_storage = SessionStorage()
+session_storage = create_session_storage()
 progress_tracker = ProgressTracker()
 
 
@@ -38,6 +42,20 @@ class CreateTaskRequest(BaseModel):
     items: List[Any] = Field(..., description="要處理的項目列表")
     batch_size: int = Field(default=10, description="批次大小")
     task_type: str = Field(default="batch_processing", description="任務類型")
+    task_description: Optional[str] = Field(default=None, description="任務描述（用於查找可恢復任務）")
+
+
+class FindResumableTaskRequest(BaseModel):
+    """查找可恢復任務請求"""
+    session_id: str = Field(..., description="會話ID")
+    task_description: str = Field(..., description="任務描述")
+
+
+class ResumeBatchTaskRequest(BaseModel):
+    """恢復批次任務請求"""
+    session_id: str = Field(..., description="會話ID")
+    task_id: str = Field(..., description="任務ID")
+    processing_instruction: str = Field(default="", description="每個項目的處理指令（與批次處理工具相同）")
 
 
 class UpdateProgressRequest(BaseModel):
@@ -132,7 +150,8 @@ async def create_task(request: CreateTaskRequest):
             request.session_id,
             request.task_id,
             request.items,
-            request.batch_size
+            request.batch_size,
+            task_description=request.task_description
         )
         
         return {
@@ -203,6 +222,51 @@ async def set_task_status(request: TaskStatusRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/tasks/find-resumable")
+async def find_resumable_task(request: FindResumableTaskRequest):
+    """依任務描述查找可恢復的任務"""
+    try:
+        task_info = task_memory_manager.find_resumable_task(
+            request.session_id,
+            request.task_description
+        )
+        
+        return {
+            "success": True,
+            "found": task_info is not None,
+            "task_info": task_info
+        }
+        
+    except Exception as e:
+        logger.error(f"查找可恢復任務失敗 {request.session_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/tasks/resume")
+async def resume_batch_task(request: ResumeBatchTaskRequest):
+    """恢復中斷的批次任務：已寫入結果日誌的項目不再處理，從下一個未處理的項目繼續"""
+    try:
+        logger.info(f"恢復批次任務: {request.session_id}/{request.task_id}")
+
+        final_results = await task_memory_manager.resume_batch_task(
+            request.session_id,
+            request.task_id,
+            functools.partial(process_single_item, instruction=request.processing_instruction)
+        )
+
+        return {
+            "success": True,
+            "final_results": final_results,
+            "message": "批次任務已完成"
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"恢復批次任務失敗 {request.session_id}/{request.task_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/tasks/{session_id}/{task_id}")
 async def get_task_status(session_id: str, task_id: str):
     """獲取任務狀態"""
@@ -303,6 +367,31 @@ async def load_temp_data(session_id: str, data_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/results/{session_id}/{log_id}")
+async def load_result_log(session_id: str, log_id: str, offset: int = 0,
+                          limit: Optional[int] = 100, stream: bool = False):
+    """讀取追加式結果日誌（分頁，或以 JSON Lines 串流完整內容）"""
+    try:
+        if stream:
+            return StreamingResponse(
+                (json.dumps(record, ensure_ascii=False) + "\n"
+                 for record in session_storage.iter_result_log(session_id, log_id)),
+                media_type="application/x-ndjson"
+            )
+
+        records = session_storage.load_result_log(session_id, log_id, offset, limit)
+        return {
+            "success": True,
+            "offset": offset,
+            "count": len(records),
+            "records": records
+        }
+
+    except Exception as e:
+        logger.error(f"讀取結果日誌失敗 {session_id}/{log_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.delete("/sessions/{session_id}")
 async def cleanup_session(session_id: str):
     """清理會話"""
@@ -164,6 +164,10 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
+    import multiprocessing
+
+    # 打包後的執行檔使用進程池（段落分析、批次處理）時需要
+    multiprocessing.freeze_support()
 
     # 檢查規則目錄
     # rules_dir = Path(__file__).parent.parent / "data" / "rules"
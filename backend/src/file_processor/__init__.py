@@ -7,5 +7,6 @@
 from .parallel_reader import ParallelFileReader
 from .content_analyzer import ContentAnalyzer
 from .summary_generator import SummaryGenerator
+from .line_index import LineIndexManager, line_index_manager
 
-__all__ = ['ParallelFileReader', 'ContentAnalyzer', 'SummaryGenerator']
+__all__ = ['ParallelFileReader', 'ContentAnalyzer', 'SummaryGenerator', 'LineIndexManager', 'line_index_manager']
@@ -8,15 +8,36 @@ import re
 import json
 import csv
 import io
-from typing import Dict, List, Any, Optional
+from collections import Counter
+from typing import Dict, List, Any, Optional, TextIO
 from pathlib import Path
 import logging
 
+from .parallel_reader import ParallelFileReader
+from .stream_stats import ColumnTypeStats, JsonStreamReader, ReservoirSample, ValueProfile
+
 logger = logging.getLogger(__name__)
 
+# 數據文件串流分析的統計量上限
+MAX_JSON_KEYS = 100        # 每個物件保留結構的鍵數
+MAX_JSON_DEPTH = 8         # 保留結構的最大巢狀深度
+MAX_TRACKED_KEYS = 1000    # 鍵頻率統計追蹤的不同鍵數
+MAX_PROFILED_KEYS = 100    # JSONL 中建立值統計的鍵數
+MAX_SAMPLE_ITEMS = 5       # 蓄水池樣本大小
+TYPE_CHUNK_SIZE = 8192     # 列類型向量化判斷的分塊大小
+
+# 列類型推斷的預設信心門檻：非空值必須全部符合才判定為該類型，
+# 避免少數無法解析的值讓整列被誤判為數字或 ID
+DEFAULT_TYPE_CONFIDENCE = 1.0
+
 
 class ContentAnalyzer:
     """內容分析器"""
+
+    def __init__(self, type_confidence: float = DEFAULT_TYPE_CONFIDENCE):
+        # 列類型推斷的信心門檻（1.0 表示整列都必須符合）
+        self.type_confidence = type_confidence
+
     def analyze_segment(self, segment: Dict[str, Any], file_path: str = "") -> Dict[str, Any]:
         """
         分析文件段落
@@ -436,116 +457,252 @@ class ContentAnalyzer:
         
         return complexity
     
-    def analyze_data_file(self, file_path: str, content: str) -> Dict[str, Any]:
-        """分析數據文件"""
+    def analyze_data_file(self, file_path: str, content: Optional[str] = None) -> Dict[str, Any]:
+        """
+        分析數據文件
+
+        記錄以串流方式逐筆處理，只保留固定大小的統計量（樣本、近似去重計數、類型直方圖）。
+        未提供 content 時直接從文件串流讀取，數 GB 的文件也能在固定記憶體內完成分析。
+        """
         file_ext = Path(file_path).suffix.lower()
-        
+
+        if file_ext not in ['.json', '.jsonl', '.csv', '.tsv']:
+            return {'error': f'不支持的數據文件格式: {file_ext}'}
+
+        if content is not None:
+            return self._analyze_data_stream(io.StringIO(content), file_ext)
+
+        encoding = ParallelFileReader().detect_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+            return self._analyze_data_stream(f, file_ext)
+
+    def _analyze_data_stream(self, stream: TextIO, file_ext: str) -> Dict[str, Any]:
         if file_ext == '.json':
-            return self._analyze_json(content)
+            return self._analyze_json(stream)
         elif file_ext == '.jsonl':
-            return self._analyze_jsonl(content)
-        elif file_ext in ['.csv', '.tsv']:
-            return self._analyze_csv(content, file_ext)
+            return self._analyze_jsonl(stream)
         else:
-            return {'error': f'不支持的數據文件格式: {file_ext}'}
+            return self._analyze_csv(stream, file_ext)
     
-    def _analyze_json(self, content: str) -> Dict[str, Any]:
-        """分析JSON文件"""
+    def _analyze_json(self, stream: TextIO) -> Dict[str, Any]:
+        """分析JSON文件（陣列與物件逐個元素解析）"""
+        reader = JsonStreamReader(stream)
         try:
-            data = json.loads(content)
-            
-            def analyze_structure(obj, path="root"):
-                if isinstance(obj, dict):
-                    return {
-                        'type': 'object',
-                        'keys': list(obj.keys()),
-                        'key_count': len(obj),
-                        'nested': {k: analyze_structure(v, f"{path}.{k}") for k, v in obj.items()}
-                    }
-                elif isinstance(obj, list):
-                    return {
-                        'type': 'array',
-                        'length': len(obj),
-                        'item_types': list(set(type(item).__name__ for item in obj[:10])),
-                        'sample_items': obj[:3] if obj else []
-                    }
-                else:
-                    return {
-                        'type': type(obj).__name__,
-                        'value': obj if len(str(obj)) < 100 else str(obj)[:100] + "..."
-                    }
-            
+            structure = self._stream_json_value(reader, 0)
+            if reader.peek():
+                raise ValueError(f"JSON 格式錯誤：多餘的內容（第 {reader.chars_read} 字符附近）")
+
             return {
                 'format': 'json',
-                'structure': analyze_structure(data),
-                'size_bytes': len(content),
+                'structure': structure,
+                'size_bytes': reader.chars_read,
                 'valid': True
             }
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             return {
                 'format': 'json',
                 'valid': False,
                 'error': str(e)
             }
+
+    def _stream_json_value(self, reader: JsonStreamReader, depth: int) -> Dict[str, Any]:
+        """串流分析當前位置的 JSON 值"""
+        next_char = reader.peek()
+        if next_char == '[':
+            return self._stream_json_array(reader)
+        elif next_char == '{':
+            return self._stream_json_object(reader, depth)
+        return self._summarize_json_value(reader.read_value(), depth)
+
+    def _stream_json_object(self, reader: JsonStreamReader, depth: int) -> Dict[str, Any]:
+        """串流分析物件：逐個鍵處理，只保留前 MAX_JSON_KEYS 個鍵的結構"""
+        keys = []
+        nested = {}
+        key_count = 0
+
+        for key in reader.iter_object_keys():
+            key_count += 1
+            value_structure = self._stream_json_value(reader, depth + 1)
+            if len(keys) < MAX_JSON_KEYS:
+                keys.append(key)
+                if depth < MAX_JSON_DEPTH:
+                    nested[key] = value_structure
+
+        return {
+            'type': 'object',
+            'keys': keys,
+            'key_count': key_count,
+            'nested': nested
+        }
+
+    def _stream_json_array(self, reader: JsonStreamReader) -> Dict[str, Any]:
+        """串流分析陣列：逐個元素更新類型直方圖、樣本與鍵頻率"""
+        length = 0
+        head = []
+        item_types = Counter()
+        item_keys = Counter()
+        sample = ReservoirSample(MAX_SAMPLE_ITEMS)
+
+        for item in reader.iter_array():
+            length += 1
+            item_types[type(item).__name__] += 1
+            if len(head) < 3:
+                head.append(item)
+            sample.add(item)
+            if isinstance(item, dict):
+                for key in item:
+                    if key in item_keys or len(item_keys) < MAX_TRACKED_KEYS:
+                        item_keys[key] += 1
+
+        structure = {
+            'type': 'array',
+            'length': length,
+            'item_types': list(item_types),
+            'sample_items': head,
+            'item_type_counts': dict(item_types),
+            'random_sample': sample.items
+        }
+        if item_keys:
+            structure['item_key_counts'] = dict(item_keys.most_common(MAX_JSON_KEYS))
+        return structure
+
+    def _summarize_json_value(self, obj: Any, depth: int) -> Dict[str, Any]:
+        """分析已解析的 JSON 值（鍵數與深度有上限）"""
+        if isinstance(obj, dict):
+            return {
+                'type': 'object',
+                'keys': list(obj.keys())[:MAX_JSON_KEYS],
+                'key_count': len(obj),
+                'nested': {
+                    k: self._summarize_json_value(v, depth + 1)
+                    for k, v in list(obj.items())[:MAX_JSON_KEYS]
+                } if depth < MAX_JSON_DEPTH else {}
+            }
+        elif isinstance(obj, list):
+            return {
+                'type': 'array',
+                'length': len(obj),
+                'item_types': list(set(type(item).__name__ for item in obj[:10])),
+                'sample_items': obj[:3] if obj else []
+            }
+        else:
+            return {
+                'type': type(obj).__name__,
+                'value': obj if len(str(obj)) < 100 else str(obj)[:100] + "..."
+            }
     
-    def _analyze_jsonl(self, content: str) -> Dict[str, Any]:
-        """分析JSONL文件"""
-        lines = content.strip().split('\n')
+    def _analyze_jsonl(self, stream: TextIO) -> Dict[str, Any]:
+        """分析JSONL文件（逐行串流，統計量大小固定）"""
+        total_lines = 0
+        pending_blank_lines = 0
         valid_lines = 0
+        invalid_lines = 0
         sample_objects = []
-        all_keys = set()
-        
-        for i, line in enumerate(lines[:100]):  # 只分析前100行
+        sample = ReservoirSample(MAX_SAMPLE_ITEMS)
+        key_counts = Counter()
+        key_profiles: Dict[str, ValueProfile] = {}
+
+        for line in stream:
+            # 與原本 strip 後再切行的計數一致：首尾的空行不計入
+            if not line.strip():
+                if total_lines:
+                    pending_blank_lines += 1
+                continue
+            total_lines += pending_blank_lines + 1
+            pending_blank_lines = 0
+
             try:
                 obj = json.loads(line)
-                valid_lines += 1
-                if len(sample_objects) < 3:
-                    sample_objects.append(obj)
-                if isinstance(obj, dict):
-                    all_keys.update(obj.keys())
             except json.JSONDecodeError:
+                invalid_lines += 1
                 continue
-        
+
+            valid_lines += 1
+            if len(sample_objects) < 3:
+                sample_objects.append(obj)
+            sample.add(obj)
+
+            if isinstance(obj, dict):
+                for key, value in obj.items():
+                    if key in key_counts or len(key_counts) < MAX_TRACKED_KEYS:
+                        key_counts[key] += 1
+                    profile = key_profiles.get(key)
+                    if profile is None and len(key_profiles) < MAX_PROFILED_KEYS:
+                        profile = key_profiles[key] = ValueProfile()
+                    if profile is not None:
+                        profile.add(value)
+
+        common_keys = [key for key, _ in key_counts.most_common()]
         return {
             'format': 'jsonl',
-            'total_lines': len(lines),
+            'total_lines': total_lines,
             'valid_lines': valid_lines,
+            'invalid_lines': invalid_lines,
             'sample_objects': sample_objects,
-            'common_keys': list(all_keys),
-            'key_count': len(all_keys)
+            'random_sample': sample.items,
+            'common_keys': common_keys,
+            'key_count': len(common_keys),
+            'key_frequency': dict(key_counts.most_common(MAX_JSON_KEYS)),
+            'key_stats': {key: profile.to_dict() for key, profile in key_profiles.items()}
         }
     
-    def _analyze_csv(self, content: str, file_ext: str) -> Dict[str, Any]:
-        """分析CSV文件"""
+    def _analyze_csv(self, stream: TextIO, file_ext: str) -> Dict[str, Any]:
+        """分析CSV文件（逐行串流，每列只保留固定大小的統計量）"""
         delimiter = '\t' if file_ext == '.tsv' else ','
         
         try:
-            reader = csv.reader(io.StringIO(content), delimiter=delimiter)
-            rows = list(reader)
+            reader = csv.reader(stream, delimiter=delimiter)
+            headers = next(reader, None)
             
-            if not rows:
+            if headers is None:
                 return {'format': 'csv', 'error': '空文件'}
             
-            headers = rows[0]
-            data_rows = rows[1:]
+            column_count = len(headers)
+            profiles = [ValueProfile() for _ in headers]
+            type_stats = [ColumnTypeStats() for _ in headers]
+            pending = [[] for _ in headers]   # 待向量化判斷類型的值
+            row_count = 0
+
+            for row in reader:
+                row_count += 1
+                row_len = len(row)
+                for i in range(column_count):
+                    value = row[i] if i < row_len else ''
+                    profiles[i].add(value)
+                    pending[i].append(value)
+
+                if row_count % TYPE_CHUNK_SIZE == 0:
+                    for i in range(column_count):
+                        type_stats[i].update(pending[i])
+                        pending[i] = []
+
+            for i in range(column_count):
+                type_stats[i].update(pending[i])
             
-            # 分析列類型
+            # 以整列統計推斷列類型
             column_types = {}
+            type_confidence = {}
             sample_data = {}
+            column_stats = {}
             
             for i, header in enumerate(headers):
-                column_values = [row[i] if i < len(row) else '' for row in data_rows[:100]]
-                column_types[header] = self._detect_column_type(column_values)
-                sample_data[header] = column_values[:3]
+                column_types[header], type_confidence[header] = type_stats[i].infer(
+                    self.type_confidence, profiles[i].distinct.estimate(), profiles[i].distinct.relative_error
+                )
+                sample_data[header] = profiles[i].head
+                column_stats[header] = {**profiles[i].to_dict(), 'type_counts': type_stats[i].counts()}
             
             return {
                 'format': 'csv',
                 'columns': headers,
                 'column_count': len(headers),
-                'row_count': len(data_rows),
+                'row_count': row_count,
                 'column_types': column_types,
+                'column_type_confidence': type_confidence,
+                'type_confidence_threshold': self.type_confidence,
                 'sample_data': sample_data,
+                'column_stats': column_stats,
                 'delimiter': delimiter
             }
             
@@ -556,66 +713,33 @@ class ContentAnalyzer:
             }
     
     def _detect_column_type(self, values: List[str]) -> str:
-        """檢測列的數據類型"""
-        non_empty_values = [v for v in values if v.strip()]
-
-        if not non_empty_values:
-            return 'empty'
-
-        # 檢查是否為數字
-        numeric_count = 0
-        numeric_values = []
-        for value in non_empty_values:
-            try:
-                num_val = float(value)
-                numeric_values.append(num_val)
-                numeric_count += 1
-            except ValueError:
-                pass
-
-        if numeric_count == len(non_empty_values):
-            # 檢查是否為整數
-            integer_count = 0
-            for value in non_empty_values:
-                try:
-                    int(value)
-                    integer_count += 1
-                except ValueError:
-                    pass
-
-            if integer_count == len(non_empty_values):
-                # 檢查是否為ID類型
-                unique_ratio = len(set(non_empty_values)) / len(non_empty_values)
-                all_positive = all(float(v) > 0 for v in non_empty_values)
-                avg_value = sum(numeric_values) / len(numeric_values) if numeric_values else 0
-                has_large_values = avg_value > 1000
-
-                # ID判斷條件：高唯一性 + 正整數 + 較大數值
-                if unique_ratio > 0.9 and all_positive and has_large_values:
-                    return 'id'
-                else:
-                    return 'integer'
-            else:
-                return 'float'
-
-        # 檢查是否為布爾值
-        boolean_values = {'true', 'false', '1', '0', 'yes', 'no', 'y', 'n'}
-        if all(v.lower() in boolean_values for v in non_empty_values):
-            return 'boolean'
-        
-        # 檢查是否為日期
-        date_patterns = [
-            r'\d{4}-\d{2}-\d{2}',
-            r'\d{2}/\d{2}/\d{4}',
-            r'\d{2}-\d{2}-\d{4}'
-        ]
-        
-        date_count = 0
-        for value in non_empty_values:
-            if any(re.match(pattern, value) for pattern in date_patterns):
-                date_count += 1
-        
-        if date_count > len(non_empty_values) * 0.8:
-            return 'date'
-        
-        return 'string'
+        """檢測列的數據類型（規則與整列串流推斷相同）"""
+        stats = ColumnTypeStats()
+        stats.update(values)
+        distinct_count = len(set(v for v in values if v.strip()))
+        column_type, _ = stats.infer(self.type_confidence, distinct_count)
+        return column_type
+
+
+# 進程池工作函數：每個工作進程只建立一次分析器
+_worker_analyzer: Optional[ContentAnalyzer] = None
+
+
+def analyze_segments_batch(segments: List[Dict[str, Any]], file_path: str = "") -> List[Dict[str, Any]]:
+    """
+    分析一批段落（供進程池調用，需為模塊級函數才能被 pickle）
+
+    子段落的關鍵詞與內容類型也在此計算，避免回到事件循環中做 CPU 工作。
+    """
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = ContentAnalyzer()
+
+    analyses = []
+    for segment in segments:
+        analysis = _worker_analyzer.analyze_segment(segment, file_path)
+        for sub_seg in analysis.get('sub_segments') or []:
+            sub_seg['keywords'] = _worker_analyzer._extract_keywords(sub_seg['content'])
+            sub_seg['content_type'] = _worker_analyzer._detect_content_type(sub_seg['content'], file_path)
+        analyses.append(analysis)
+    return analyses
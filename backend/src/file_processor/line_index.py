@@ -0,0 +1,264 @@
+"""
+行偏移索引
+
+為文件建立「每行起始位元組偏移」索引，配合 mmap 隨機讀取任意行範圍，
+讀取第 1,000,000–1,000,100 行只需觸及這 100 行，而不必讀取整個文件。
+
+索引建立一次後持久化到 global_cache，並以文件大小與修改時間判斷是否失效；
+磁碟上的索引檔數量有上限，保存新索引時清除來源已不存在或最久未使用的索引檔。
+支持換行位元組 0x0A 不會出現在多位元組字符中的編碼（utf-8、gbk、big5、latin-1）。
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 索引檔頭：魔數、文件大小、修改時間(ns)、行數、來源路徑長度（其後為 utf-8 來源路徑）
+_HEADER = struct.Struct("<8sQqQI")
+_MAGIC = b"LIDX0002"
+_SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class LineIndex:
+    """單一文件的行偏移索引"""
+
+    def __init__(self, path: Path, size: int, mtime_ns: int, offsets: np.ndarray):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # offsets[i] 為第 i+1 行的起始偏移，最後一個元素為文件大小
+        self.offsets = offsets
+
+    @property
+    def line_count(self) -> int:
+        """行數（與逐行迭代 / readlines 的計數相同）"""
+        return len(self.offsets) - 1
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+    @classmethod
+    def build(cls, path: Path) -> "LineIndex":
+        """掃描文件建立索引（分塊讀取，記憶體只與行數相關）"""
+        stat = path.stat()
+        parts = [np.zeros(1, dtype=np.int64)]
+        position = 0
+
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0A)
+                if len(newlines):
+                    parts.append(newlines.astype(np.int64) + (position + 1))
+                position += len(chunk)
+
+        offsets = np.concatenate(parts)
+        # 最後一行沒有換行結尾時補上文件大小作為結束偏移
+        if offsets[-1] != position:
+            offsets = np.append(offsets, np.int64(position))
+
+        return cls(path, position, stat.st_mtime_ns, offsets)
+
+    def save(self, index_file: Path) -> None:
+        """原子寫入索引檔"""
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{index_file.name}.", suffix=".tmp", dir=str(index_file.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                source = str(self.path).encode("utf-8")
+                f.write(_HEADER.pack(_MAGIC, self.size, self.mtime_ns, self.line_count, len(source)))
+                f.write(source)
+                f.write(self.offsets.astype("<i8").tobytes())
+            os.replace(temp_name, index_file)
+        except BaseException:
+            try:
+                os.unlink(temp_name)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def read_header(f) -> Optional[Tuple[str, int, int, int]]:
+        """讀取索引檔頭與來源路徑，格式不符時返回 None"""
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            return None
+        magic, size, mtime_ns, line_count, source_length = _HEADER.unpack(header)
+        source = f.read(source_length)
+        if magic != _MAGIC or len(source) != source_length:
+            return None
+        return source.decode("utf-8", errors="replace"), size, mtime_ns, line_count
+
+    @classmethod
+    def load(cls, path: Path, index_file: Path, stat: os.stat_result) -> Optional["LineIndex"]:
+        """讀取持久化索引，文件已變更或索引損壞時返回 None"""
+        try:
+            with open(index_file, "rb") as f:
+                header = cls.read_header(f)
+                if header is None:
+                    return None
+                _, size, mtime_ns, line_count = header
+                if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                    return None
+                offsets = np.fromfile(f, dtype="<i8")
+        except (OSError, ValueError):
+            return None
+
+        if len(offsets) != line_count + 1:
+            return None
+        return cls(path, size, mtime_ns, offsets.astype(np.int64, copy=False))
+
+
+class LineIndexManager:
+    """
+    行索引管理器
+
+    在記憶體中保留最近使用的索引，並持久化到磁碟供重啟後沿用。
+    磁碟上最多保留 max_disk_entries 個索引檔（以修改時間記錄最近使用）。
+    文件處理路由與本地文件工具共用同一個實例。
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = Path("task_memory") / "global_cache" / "line_index",
+                 max_cached: int = 32, max_disk_entries: int = 256):
+        self.cache_dir = Path(cache_dir)
+        self.max_cached = max_cached
+        self.max_disk_entries = max_disk_entries
+        self._indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_file(self, key: str) -> Path:
+        return self.cache_dir / f"{hashlib.md5(key.encode('utf-8')).hexdigest()}.idx"
+
+    def get_index(self, file_path: Union[str, Path]) -> LineIndex:
+        """取得文件的行索引，文件變更後自動重建"""
+        path = Path(file_path).resolve()
+        key = str(path)
+        stat = path.stat()
+
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None and index.matches(stat):
+                self._indexes.move_to_end(key)
+                return index
+
+        index_file = self._index_file(key)
+        index = LineIndex.load(path, index_file, stat)
+        if index is None:
+            index = LineIndex.build(path)
+            try:
+                index.save(index_file)
+                self._prune_disk_cache()
+            except OSError as e:
+                logger.warning(f"⚠️ 行索引持久化失敗 {path}: {e}")
+            logger.debug(f"建立行索引 {path}: {index.line_count} 行")
+        else:
+            # 更新修改時間作為最近使用記錄
+            try:
+                os.utime(index_file)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_cached:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _prune_disk_cache(self) -> None:
+        """刪除來源已不存在、已變更或格式不符的索引檔，並只保留最近使用的 max_disk_entries 個"""
+        entries = []
+        for index_file in self.cache_dir.glob("*.idx"):
+            try:
+                with open(index_file, "rb") as f:
+                    header = LineIndex.read_header(f)
+                used_ns = index_file.stat().st_mtime_ns
+            except OSError:
+                continue
+
+            stale = header is None
+            if not stale:
+                source, size, mtime_ns, _ = header
+                try:
+                    source_stat = os.stat(source)
+                    stale = source_stat.st_size != size or source_stat.st_mtime_ns != mtime_ns
+                except OSError:
+                    stale = True
+
+            if stale:
+                self._remove_index_file(index_file)
+            else:
+                entries.append((used_ns, index_file))
+
+        entries.sort(reverse=True)
+        for _, index_file in entries[self.max_disk_entries:]:
+            self._remove_index_file(index_file)
+
+    @staticmethod
+    def _remove_index_file(index_file: Path) -> None:
+        try:
+            index_file.unlink()
+        except OSError:
+            pass
+
+    def invalidate(self, file_path: Union[str, Path]) -> None:
+        """文件被改寫後主動丟棄索引"""
+        key = str(Path(file_path).resolve())
+        with self._lock:
+            self._indexes.pop(key, None)
+        self._remove_index_file(self._index_file(key))
+
+    def line_count(self, file_path: Union[str, Path]) -> int:
+        """文件行數"""
+        return self.get_index(file_path).line_count
+
+    def read_lines(self, file_path: Union[str, Path], start_line: int, end_line: int,
+                   encoding: str = "utf-8", keepends: bool = False) -> List[str]:
+        """
+        讀取行範圍（1-based，包含 end_line）
+
+        超出文件末尾的部分會被截斷；換行符與 readlines 一樣統一為 '\\n'。
+        """
+        index = self.get_index(file_path)
+        start_line = max(1, start_line)
+        end_line = min(end_line, index.line_count)
+        if end_line < start_line:
+            return []
+
+        begin = int(index.offsets[start_line - 1])
+        end = int(index.offsets[end_line])
+
+        with open(index.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = mm[begin:end]
+
+        ends_with_newline = data.endswith(b"\n")
+        lines = data.decode(encoding, errors="replace").replace("\r\n", "\n").split("\n")
+        # 範圍內最後一行以換行結尾時 split 會多出一個空字串
+        if ends_with_newline:
+            lines.pop()
+        if keepends:
+            return [line + "\n" for line in lines[:-1]] + [lines[-1] + "\n" if ends_with_newline else lines[-1]]
+        return lines
+
+    def read_text(self, file_path: Union[str, Path], start_line: int, end_line: int,
+                  encoding: str = "utf-8") -> str:
+        """讀取行範圍並以 '\\n' 連接"""
+        return "\n".join(self.read_lines(file_path, start_line, end_line, encoding))
+
+
+# 全局實例（文件處理路由與本地文件工具共用）
+line_index_manager = LineIndexManager()
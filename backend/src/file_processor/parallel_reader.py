@@ -2,22 +2,31 @@
 平行文件分段讀取器
 
 支持大文件的分段讀取，包含 overlap 機制避免內容斷裂。
+
+文件只讀取一次：先以檔頭樣本檢測編碼，再逐行串流並即時切出分段，
+記憶體中只保留當前分段與前後重疊的行，峰值記憶體與文件大小無關。
 """
 
 import asyncio
-import os
+import codecs
+from collections import deque
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
-import concurrent.futures
+from typing import Dict, Any, Optional, Iterable, Iterator, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 編碼檢測樣本大小與候選編碼（依序嘗試，latin-1 可解碼任意位元組作為最後手段）
+ENCODING_SAMPLE_SIZE = 64 * 1024
+CANDIDATE_ENCODINGS = ['utf-8', 'gbk', 'big5', 'latin-1']
+
 
 class FileSegment:
     """文件段落"""
-    
-    def __init__(self, start_line: int, end_line: int, content: str, overlap_start: int = 0, overlap_end: int = 0):
+
+    def __init__(self, start_line: int, end_line: int, content: str, overlap_start: int = 0, overlap_end: int = 0,
+                 segment_id: int = 0):
+        self.segment_id = segment_id
         self.start_line = start_line
         self.end_line = end_line
         self.content = content
@@ -26,6 +35,70 @@ class FileSegment:
         self.actual_start = start_line + overlap_start
         self.actual_end = end_line - overlap_end
 
+    @property
+    def line_count(self) -> int:
+        return self.end_line - self.start_line + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為 read_file_parallel 返回的分段格式"""
+        return {
+            "segment_id": self.segment_id,
+            "start_line": self.start_line,
+            "end_line": self.end_line,
+            "actual_start": self.actual_start,
+            "actual_end": self.actual_end,
+            "content": self.content,
+            "line_count": self.line_count,
+            "has_overlap": self.overlap_start > 0 or self.overlap_end > 0,
+            "overlap_info": {
+                "start_overlap": self.overlap_start,
+                "end_overlap": self.overlap_end
+            }
+        }
+
+
+class _LineWindow:
+    """
+    串流行窗口
+
+    按需從文件讀取行（1-based 行號），並可釋放不再需要的前段行。
+    行的切分與 content.split('\\n') 一致：文件以換行結尾（或為空）時最後有一個空行。
+    """
+
+    def __init__(self, handle):
+        self._iter = iter(handle)
+        self._lines: deque = deque()
+        self._first = 1
+        self._last_has_newline = False
+        self.raw_lines = 0   # 實際讀到的行數（與逐行迭代計數相同）
+        self.eof = False
+
+    def ensure(self, line_no: int) -> bool:
+        """確保指定行已讀入窗口，行不存在時返回 False"""
+        while self._first + len(self._lines) <= line_no:
+            if self.eof:
+                return False
+            try:
+                raw = next(self._iter)
+            except StopIteration:
+                self.eof = True
+                if self.raw_lines == 0 or self._last_has_newline:
+                    self._lines.append('')
+                continue
+            self.raw_lines += 1
+            self._last_has_newline = raw.endswith('\n')
+            self._lines.append(raw[:-1] if self._last_has_newline else raw)
+        return True
+
+    def get(self, line_no: int) -> str:
+        return self._lines[line_no - self._first]
+
+    def release_before(self, line_no: int) -> None:
+        """釋放行號小於 line_no 的行"""
+        while self._first < line_no and self._lines:
+            self._lines.popleft()
+            self._first += 1
+
 
 class ParallelFileReader:
     """平行文件讀取器"""
@@ -34,11 +107,12 @@ class ParallelFileReader:
         self.min_lines = min_lines  # 最少行數
         self.min_chars = min_chars  # 最少字符數
         self.overlap = overlap
+        # 保留參數以維持介面相容；分段在單次串流中完成，不再使用執行緒池
         self.max_workers = max_workers
 
         # 向後兼容
         self.chunk_size = min_lines
-    
+
     async def read_file_parallel(self, file_path: str) -> Dict[str, Any]:
         """
         平行讀取文件並分段處理
@@ -55,14 +129,17 @@ class ParallelFileReader:
             if not file_path_obj.exists():
                 raise FileNotFoundError(f"文件不存在: {file_path}")
 
-            # 獲取文件基本信息
-            file_info = await self._get_file_info(file_path_obj)
+            def read_sync():
+                stats: Dict[str, Any] = {}
+                segments = [segment.to_dict() for segment in self.iter_segments(file_path_obj, stats=stats)]
+                return stats, segments
 
-            # 讀取並分段處理文件
-            segments = await self._process_file_segments(file_path_obj)
+            # 編碼檢測、行數統計與分段在同一次讀取中完成
+            loop = asyncio.get_running_loop()
+            stats, segments = await loop.run_in_executor(None, read_sync)
 
             return {
-                "file_info": file_info,
+                "file_info": self._build_file_info(file_path_obj, stats),
                 "segments": segments,
                 "total_segments": len(segments),
                 "processing_time": 0  # 將在調用處計算
@@ -71,79 +148,131 @@ class ParallelFileReader:
         except Exception as e:
             logger.error(f"讀取文件失敗 {original_path}: {e}")
             raise
-    
-    async def _get_file_info(self, file_path: Path) -> Dict[str, Any]:
-        """獲取文件基本信息"""
+
+    def iter_segments(self, file_path: Union[str, Path], encoding: Optional[str] = None,
+                      stats: Optional[Dict[str, Any]] = None) -> Iterator[FileSegment]:
+        """
+        串流讀取文件並逐個產生分段
+
+        分段規則：每段至少 min_lines 行，字符數不足 min_chars 時繼續加行，
+        前後各帶 overlap 行重疊。只保留當前分段與重疊行，適合超大文件。
+
+        Args:
+            file_path: 文件路徑
+            encoding: 指定編碼，未指定時以檔頭樣本檢測
+            stats: 可選的字典，迭代結束後填入 encoding 與 lines
+
+        Yields:
+            FileSegment
+        """
+        file_path = Path(file_path)
+        encoding = encoding or self.detect_encoding(file_path)
+
+        # 樣本之後仍可能出現無法解碼的位元組，以替換字符處理而不中斷串流
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            window = _LineWindow(f)
+            yield from self._iter_window_segments(window)
+
+        if stats is not None:
+            stats["encoding"] = encoding
+            stats["lines"] = window.raw_lines
+
+    def iter_line_segments(self, lines: Iterable[str], first_line: int = 1,
+                           start_line: Optional[int] = None) -> Iterator[FileSegment]:
+        """
+        從文件中間的某一行開始，以相同的分段規則繼續分段
+
+        用於文件局部變更後只重新分段受影響的區域：從原有分段的起始行重新開始時，
+        切出的分段與從頭讀取整個文件完全相同。
+
+        Args:
+            lines: 從 first_line 開始直到文件末尾的行（保留換行符），按需迭代
+            first_line: lines 第一行在文件中的行號
+            start_line: 第一個分段的起始行（不含前重疊），默認為 first_line
+
+        Yields:
+            FileSegment（行號為文件中的行號）
+        """
+        window = _LineWindow(lines)
+        yield from self._iter_window_segments(window, first_line - 1, (start_line or first_line) - first_line + 1)
+
+    def _iter_window_segments(self, window: _LineWindow, line_offset: int = 0,
+                              current_start: int = 1) -> Iterator[FileSegment]:
+        """從行窗口逐個切出分段（窗口行號加上 line_offset 即為文件行號）"""
+        segment_id = 0
+
+        while window.ensure(current_start):
+            # 從最少行數開始
+            current_end = current_start
+            char_count = len(window.get(current_start))
+            while current_end - current_start + 1 < self.min_lines and window.ensure(current_end + 1):
+                current_end += 1
+                char_count += len(window.get(current_end))
+
+            # 如果字符數不足且還有更多行，繼續添加行
+            while char_count < self.min_chars and window.ensure(current_end + 1):
+                current_end += 1
+                char_count += len(window.get(current_end))
+
+            # 計算重疊
+            overlap_start = self.overlap if current_start + line_offset > 1 else 0
+            overlap_end = self.overlap if window.ensure(current_end + 1) else 0
+
+            # 調整實際讀取範圍
+            read_start = max(1, current_start - overlap_start)
+            read_end = current_end
+            while read_end < current_end + overlap_end and window.ensure(read_end + 1):
+                read_end += 1
+
+            segment_id += 1
+            content = '\n'.join(window.get(n) for n in range(read_start, read_end + 1))
+            yield FileSegment(read_start + line_offset, read_end + line_offset, content,
+                              overlap_start, overlap_end, segment_id)
+
+            # 下一段從當前段結束後開始（減去重疊），至少前進一行防止無限循環
+            current_start = max(current_end + 1 - overlap_end, current_start + 1)
+            window.release_before(current_start - self.overlap)
+
+    def detect_encoding(self, file_path: Union[str, Path], sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+        """
+        以檔頭樣本檢測文件編碼
+
+        使用增量解碼器，樣本在多位元組字符中間截斷不會誤判。
+        """
+        with open(file_path, 'rb') as f:
+            sample = f.read(sample_size)
+
+        if sample.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+
+        for encoding in CANDIDATE_ENCODINGS:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                decoder.decode(sample, final=False)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+
+        return 'utf-8'
+
+    def _build_file_info(self, file_path: Path, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """組合文件基本信息（行數與編碼來自同一次串流讀取）"""
         stat = file_path.stat()
-        
-        # 計算總行數
-        total_lines = await self._count_lines(file_path)
-        
-        # 檢測文件編碼
-        encoding = await self._detect_encoding(file_path)
-        
+
         return {
             "path": str(file_path),
             "name": file_path.name,
             "size": stat.st_size,
-            "lines": total_lines,
-            "encoding": encoding,
+            "lines": stats.get("lines", 0),
+            "encoding": stats.get("encoding", "utf-8"),
             "type": self._detect_file_type(file_path),
             "modified": stat.st_mtime
         }
-    
-    async def _count_lines(self, file_path: Path) -> int:
-        """計算文件總行數"""
-        def count_lines_sync():
-            try:
-                # 優先使用 UTF-8
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return sum(1 for _ in f)
-            except UnicodeDecodeError:
-                # 如果 UTF-8 失敗，嘗試其他編碼
-                for encoding in ['gbk', 'big5', 'latin-1']:
-                    try:
-                        with open(file_path, 'r', encoding=encoding) as f:
-                            return sum(1 for _ in f)
-                    except UnicodeDecodeError:
-                        continue
-
-                # 最後使用 UTF-8 with replace
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    return sum(1 for _ in f)
-
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, count_lines_sync)
-    
-    async def _detect_encoding(self, file_path: Path) -> str:
-        """檢測文件編碼"""
-        def detect_encoding_sync():
-            # 優先返回 UTF-8，確保統一編碼
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    f.read(1000)
-                return 'utf-8'
-            except UnicodeDecodeError:
-                # 如果不是 UTF-8，嘗試檢測實際編碼但仍返回 utf-8
-                try:
-                    import chardet
-                    with open(file_path, 'rb') as f:
-                        raw_data = f.read(10000)
-                        result = chardet.detect(raw_data)
-                        detected = result.get('encoding', 'utf-8')
-                        # 記錄檢測到的編碼，但統一返回 utf-8
-                        logger.debug(f"檢測到編碼 {detected}，統一使用 utf-8")
-                        return 'utf-8'
-                except ImportError:
-                    return 'utf-8'
-
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, detect_encoding_sync)
-    
+
     def _detect_file_type(self, file_path: Path) -> str:
         """檢測文件類型"""
         ext = file_path.suffix.lower()
-        
+
         if ext in ['.txt', '.md', '.py', '.js', '.ts', '.html', '.css', '.json', '.xml', '.yaml', '.yml']:
             return 'text'
         elif ext in ['.csv', '.tsv']:
@@ -154,142 +283,10 @@ class ParallelFileReader:
             return 'excel'
         else:
             return 'unknown'
-    
-    async def _process_file_segments(self, file_path: Path) -> List[Dict[str, Any]]:
-        """處理文件分段"""
-        # 讀取完整文件內容
-        content = await self._read_file_content(file_path)
-        lines = content.split('\n')
-        total_lines = len(lines)
-        
-        # 總是進行分段處理，即使文件較小也要按邏輯分段
-        # 這樣可以提供更詳細的分析結果
-        
-        # 計算分段
-        segments_info = self._calculate_segments(total_lines, lines)
-        
-        # 並行處理各個分段
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            tasks = []
-            for i, (start, end, overlap_start, overlap_end) in enumerate(segments_info):
-                task = executor.submit(
-                    self._process_segment,
-                    i + 1,
-                    lines,
-                    start,
-                    end,
-                    overlap_start,
-                    overlap_end
-                )
-                tasks.append(task)
-            
-            segments = []
-            for future in concurrent.futures.as_completed(tasks):
-                segment = future.result()
-                segments.append(segment)
-        
-        # 按 segment_id 排序
-        segments.sort(key=lambda x: x['segment_id'])
-        
-        return segments
-    
-    def _calculate_segments(self, total_lines: int, lines: List[str]) -> List[Tuple[int, int, int, int]]:
-        """
-        動態計算分段信息
-
-        Args:
-            total_lines: 總行數
-            lines: 所有行的內容
-
-        Returns:
-            分段信息列表 (start, end, overlap_start, overlap_end)
-        """
-        segments = []
-        current_start = 1
-
-        while current_start <= total_lines:
-            # 從最少行數開始
-            current_end = min(current_start + self.min_lines - 1, total_lines)
-
-            # 計算當前段落的字符數
-            segment_lines = lines[current_start-1:current_end]
-            char_count = sum(len(line) for line in segment_lines)
-
-            # 如果字符數不足且還有更多行，繼續添加行
-            while char_count < self.min_chars and current_end < total_lines:
-                current_end += 1
-                if current_end <= total_lines:
-                    char_count += len(lines[current_end-1])
-
-            # 計算重疊
-            overlap_start = self.overlap if current_start > 1 else 0
-            overlap_end = self.overlap if current_end < total_lines else 0
-
-            # 調整實際讀取範圍
-            read_start = max(1, current_start - overlap_start)
-            read_end = min(total_lines, current_end + overlap_end)
-
-            segments.append((read_start, read_end, overlap_start, overlap_end))
-
-            # 下一段從當前段結束後開始（減去重疊）
-            current_start = current_end + 1 - overlap_end
-
-            # 防止無限循環
-            if current_start <= current_end - overlap_end:
-                current_start = current_end + 1
-
-        return segments
-    
-    def _process_segment(self, segment_id: int, lines: List[str], start: int, end: int, 
-                        overlap_start: int, overlap_end: int) -> Dict[str, Any]:
-        """處理單個分段"""
-        # 提取分段內容（注意行號是1-based，但list是0-based）
-        segment_lines = lines[start-1:end]
-        content = '\n'.join(segment_lines)
-        
-        return {
-            "segment_id": segment_id,
-            "start_line": start,
-            "end_line": end,
-            "actual_start": start + overlap_start,
-            "actual_end": end - overlap_end,
-            "content": content,
-            "line_count": len(segment_lines),
-            "has_overlap": overlap_start > 0 or overlap_end > 0,
-            "overlap_info": {
-                "start_overlap": overlap_start,
-                "end_overlap": overlap_end
-            }
-        }
-    
-    async def _read_file_content(self, file_path: Path) -> str:
-        """讀取文件內容"""
-        def read_file_sync():
-            # 優先使用 UTF-8 編碼
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                # 嘗試其他編碼
-                for enc in ['gbk', 'big5', 'latin-1']:
-                    try:
-                        with open(file_path, 'r', encoding=enc) as f:
-                            content = f.read()
-                            # 轉換為 UTF-8
-                            return content
-                    except UnicodeDecodeError:
-                        continue
-
-                # 如果都失敗，使用 errors='replace' 替換無法解碼的字符
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    return f.read()
-
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, read_file_sync)
 
 
 # 便利函數
 async def read_file_parallel(file_path: str, chunk_size: int = 1000, overlap: int = 100) -> Dict[str, Any]:
     """便利函數：平行讀取文件"""
-    reader = ParallelFileReader(chunk_size=chunk_size, overlap=overlap)
+    reader = ParallelFileReader(min_lines=chunk_size, overlap=overlap)
     return await reader.read_file_parallel(file_path)
@@ -2,20 +2,175 @@
 智能摘要生成器
 
 生成更合理的文件分段和 YAML 格式摘要。
+
+文件逐行串流處理：段落邊界、關鍵詞、段落摘要與關鍵點都在讀取時增量計算，
+記憶體中只保留當前段落的統計量與有界的全局匯總，超大的 Markdown 或日誌文件
+也不需要整個讀入。
 """
 
 import re
-import yaml
+import asyncio
+import bisect
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 
+from .stream_stats import DistinctCounter, HeavyHitters
+
 logger = logging.getLogger(__name__)
 
+# 摘要中列出明細的段落數上限（總段落數與各項統計仍涵蓋整個文件）
+MAX_DETAILED_SECTIONS = 500
+# 單一段落詞頻統計保留的詞數、全局關鍵詞去重計數的精確範圍
+SECTION_KEYWORD_CAPACITY = 2000
+KEYWORD_DISTINCT_K = 4096
+# 詞頻統計前暫存的字符數（批量切詞比逐行切詞快得多）
+KEYWORD_BUFFER_CHARS = 256 * 1024
+
+STOP_WORDS = {'的', '是', '在', '有', '和', '與', '或', '但', '如果', '因為', '所以', '這', '那', '我', '你', '他', '她', '它'}
+_WORD_PATTERN = re.compile(r'\b\w+\b')
+_SENTENCE_DELIMITERS = re.compile(r'[。！？]')
+_NUMBERED_POINT = re.compile(r'^[\d\w]+[\.、：]\s*(.+)')
+_BULLET_POINT = re.compile(r'^[-*]\s*(.+)')
+
+
+class _SectionAccumulator:
+    """
+    單一段落的增量統計
+
+    不保存段落全文，只保留生成摘要所需的開頭內容、摘要句、關鍵點與有界詞頻。
+    """
+
+    def __init__(self, start_line: int, title: str = '', section_type: str = 'content'):
+        self.start_line = start_line
+        self.end_line = start_line
+        self.title = title
+        self.section_type = section_type
+        self.line_count = 0
+        self.content_chars = 0          # 等同 '\n'.join(content_lines) 的長度
+        self.head_lines: List[str] = []  # 內容不足 50 字符時直接作為摘要
+        self.summary_sentences: List[str] = []
+        self.summary_length = 0
+        self.summary_done = False
+        self.key_points: List[str] = []
+        self.keywords = HeavyHitters(SECTION_KEYWORD_CAPACITY)
+        self._pending_lines: List[str] = []
+        self._pending_chars = 0
+
+    def add_line(self, line_no: int, line: str, use_as_title: bool = True) -> None:
+        """加入一行（已去除首尾空白）"""
+        if use_as_title and not self.title and line:
+            # 如果還沒有標題，用第一行非空內容作為標題
+            self.title = line[:50] + ('...' if len(line) > 50 else '')
+
+        self.end_line = line_no
+        if self.content_chars < 50:
+            self.head_lines.append(line)
+        self.content_chars += len(line) + (1 if self.line_count else 0)
+        self.line_count += 1
+
+        # 換行本身是句子分隔符，逐行切句與整段切句的結果相同
+        if not self.summary_done:
+            for sentence in _SENTENCE_DELIMITERS.split(line):
+                sentence = sentence.strip()
+                if sentence and self.summary_length + len(sentence) < 100:
+                    self.summary_sentences.append(sentence)
+                    self.summary_length += len(sentence)
+                elif self.summary_sentences:
+                    self.summary_done = True
+                    break
+
+        if len(self.key_points) < 5:
+            match = _NUMBERED_POINT.match(line) or _BULLET_POINT.match(line)
+            if match:
+                self.key_points.append(match.group(1).strip())
+
+        if line:
+            self._pending_lines.append(line)
+            self._pending_chars += len(line)
+            if self._pending_chars >= KEYWORD_BUFFER_CHARS:
+                self._count_pending_words()
+
+    def _count_pending_words(self) -> None:
+        """對暫存的行批量切詞並更新詞頻（單詞不會跨行，合併切詞與逐行切詞結果相同）"""
+        if not self._pending_lines:
+            return
+        words = _WORD_PATTERN.findall('\n'.join(self._pending_lines).lower())
+        self.keywords.update([word for word in words if len(word) > 1 and word not in STOP_WORDS])
+        self._pending_lines = []
+        self._pending_chars = 0
+
+    def summary(self) -> str:
+        """生成段落摘要"""
+        # 如果內容很短，直接返回
+        if self.content_chars < 50:
+            return '\n'.join(self.head_lines).strip()
+
+        summary = '。'.join(self.summary_sentences)
+        if summary and not summary.endswith('。'):
+            summary += '。'
+
+        return summary or self.title
+
+    def top_keywords(self) -> List[str]:
+        """段落中最常見的 10 個詞"""
+        self._count_pending_words()
+        return [word for word, count in self.keywords.most_common(10)]
+
+
+class _SummaryAccumulator:
+    """整個文件的有界匯總"""
+
+    def __init__(self):
+        self.total_lines = 0
+        self.size = 0
+        self.total_chars = 0
+        self.total_sections = 0
+        self.section_lines = 0
+        self.section_types: Dict[str, int] = {}
+        self.sections: List[Dict[str, Any]] = []
+        self.keyword_counter = DistinctCounter(KEYWORD_DISTINCT_K)
+        self.first_keywords: List[str] = []   # 字典序最小的 20 個關鍵詞
+
+    def add_line(self, raw_line: str) -> None:
+        self.total_lines += 1
+        self.size += len(raw_line.encode('utf-8'))
+        self.total_chars += len(raw_line)
+
+    def add_section(self, section: _SectionAccumulator) -> None:
+        self.total_sections += 1
+        line_count = section.end_line - section.start_line + 1
+        self.section_lines += line_count
+        self.section_types[section.section_type] = self.section_types.get(section.section_type, 0) + 1
+
+        for keyword in section.top_keywords():
+            self.keyword_counter.add(keyword)
+            position = bisect.bisect_left(self.first_keywords, keyword)
+            if position < len(self.first_keywords) and self.first_keywords[position] == keyword:
+                continue
+            if position < 20:
+                self.first_keywords.insert(position, keyword)
+                del self.first_keywords[20:]
+
+        if len(self.sections) < MAX_DETAILED_SECTIONS:
+            self.sections.append({
+                'section_number': self.total_sections,
+                'line_range': f"{section.start_line}-{section.end_line}",
+                'title': section.title,
+                'section_type': section.section_type,
+                'line_count': line_count,
+                'summary': section.summary(),
+                'key_points': section.key_points
+            })
+
+    @property
+    def average_section_length(self) -> float:
+        return self.section_lines / self.total_sections if self.total_sections else 0
+
 
 class SmartSummaryGenerator:
     """智能摘要生成器"""
-    
+
     def __init__(self):
         self.section_patterns = [
             r'^#\s+(.+)',           # Markdown 標題
@@ -28,32 +183,29 @@ class SmartSummaryGenerator:
             r'^第\d+[項條章節]\s*[:：]?\s*(.+)',  # 中文編號
             r'^[一二三四五六七八九十]+[、．]\s*(.+)',  # 中文數字編號
         ]
-    
+        # 合併為單一正則：各分支依序嘗試，結果與逐個模式匹配相同
+        self._section_regex = re.compile('|'.join(f'(?:{pattern})' for pattern in self.section_patterns))
+
     async def generate_smart_summary(self, file_path: str) -> Dict[str, Any]:
         """
         生成智能文件摘要
-        
+
         Args:
             file_path: 文件路徑
-            
+
         Returns:
             YAML 格式的智能摘要
         """
         start_time = datetime.now()
-        
+
         try:
-            # 讀取文件內容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            lines = content.split('\n')
-            
-            # 智能分段
-            sections = self._smart_segmentation(lines)
-            
+            # 串流讀取與分段在執行緒中完成，不阻塞事件循環
+            loop = asyncio.get_running_loop()
+            accumulator = await loop.run_in_executor(None, self._scan_file, file_path)
+
             # 生成 YAML 格式摘要
-            summary = self._generate_yaml_summary(file_path, lines, sections)
-            
+            summary = self._generate_yaml_summary(file_path, accumulator)
+
             # 添加處理時間
             end_time = datetime.now()
             summary['processing_info'] = {
@@ -61,263 +213,122 @@ class SmartSummaryGenerator:
                 'generated_at': end_time.isoformat(),
                 'generator_version': 'smart_v1.0'
             }
-            
+
             return summary
-            
+
         except Exception as e:
             logger.error(f"生成智能摘要失敗 {file_path}: {e}")
             raise
-    
-    def _smart_segmentation(self, lines: List[str]) -> List[Dict[str, Any]]:
+
+    def _scan_file(self, file_path: str) -> _SummaryAccumulator:
         """
-        智能分段邏輯
-        
-        Args:
-            lines: 文件行列表
-            
-        Returns:
-            分段結果列表
+        逐行讀取文件並完成分段與統計
+
+        行的切分與 content.split('\\n') 一致：文件以換行結尾（或為空）時最後有一個空行。
         """
-        sections = []
-        current_section = {
-            'start_line': 1,
-            'end_line': 1,
-            'title': '',
-            'content_lines': [],
-            'section_type': 'content'
-        }
-        
-        for i, line in enumerate(lines, 1):
-            line = line.strip()
-            
-            # 檢查是否是新的段落標題
-            section_match = self._match_section_pattern(line)
-            
-            if section_match and len(current_section['content_lines']) > 0:
-                # 結束當前段落
-                current_section['end_line'] = i - 1
-                current_section['content'] = '\n'.join(current_section['content_lines'])
-                sections.append(current_section.copy())
-                
-                # 開始新段落
-                current_section = {
-                    'start_line': i,
-                    'end_line': i,
-                    'title': section_match['title'],
-                    'content_lines': [line],
-                    'section_type': section_match['type']
-                }
-            else:
-                # 繼續當前段落
-                if not current_section['title'] and line:
-                    # 如果還沒有標題，用第一行非空內容作為標題
-                    current_section['title'] = line[:50] + ('...' if len(line) > 50 else '')
-                
-                current_section['content_lines'].append(line)
-                current_section['end_line'] = i
-        
+        accumulator = _SummaryAccumulator()
+        current_section = _SectionAccumulator(start_line=1)
+        line_no = 0
+        ends_with_newline = True
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for raw_line in f:
+                ends_with_newline = raw_line.endswith('\n')
+                line_no += 1
+                current_section = self._process_line(
+                    accumulator, current_section, line_no, raw_line[:-1] if ends_with_newline else raw_line
+                )
+
+        if ends_with_newline:
+            current_section = self._process_line(accumulator, current_section, line_no + 1, '')
+
         # 添加最後一個段落
-        if current_section['content_lines']:
-            current_section['content'] = '\n'.join(current_section['content_lines'])
-            sections.append(current_section)
-        
-        # 合併過短的段落
-        return self._merge_short_sections(sections)
-    
+        if current_section.line_count:
+            accumulator.add_section(current_section)
+
+        return accumulator
+
+    def _process_line(self, accumulator: _SummaryAccumulator, current_section: _SectionAccumulator,
+                      line_no: int, raw_line: str) -> _SectionAccumulator:
+        """
+        智能分段邏輯（逐行）
+
+        遇到段落標題且當前段落已有內容時結束當前段落，返回新的當前段落。
+        """
+        accumulator.add_line(raw_line)
+        line = raw_line.strip()
+
+        # 檢查是否是新的段落標題
+        section_match = self._match_section_pattern(line)
+
+        if section_match and current_section.line_count > 0:
+            # 結束當前段落，開始新段落
+            accumulator.add_section(current_section)
+            current_section = _SectionAccumulator(line_no, section_match['title'], section_match['type'])
+            current_section.add_line(line_no, line, use_as_title=False)
+        else:
+            # 繼續當前段落
+            current_section.add_line(line_no, line)
+
+        return current_section
+
     def _match_section_pattern(self, line: str) -> Optional[Dict[str, str]]:
         """匹配段落模式"""
-        for pattern in self.section_patterns:
-            match = re.match(pattern, line)
-            if match:
-                return {
-                    'title': match.group(1).strip(),
-                    'type': 'header'
-                }
-        
-        # 檢查空行（可能是段落分隔）
-        if not line.strip():
-            return None
-        
+        match = self._section_regex.match(line)
+        if match:
+            title = next(group for group in match.groups() if group is not None)
+            return {
+                'title': title.strip(),
+                'type': 'header'
+            }
+
         return None
-    
-    def _merge_short_sections(self, sections: List[Dict[str, Any]], min_lines: int = 3) -> List[Dict[str, Any]]:
-        """合併過短的段落"""
-        if not sections:
-            return sections
-        
-        merged_sections = []
-        current_merged = sections[0].copy()
-        
-        for i in range(1, len(sections)):
-            section = sections[i]
-            current_lines = current_merged['end_line'] - current_merged['start_line'] + 1
-            
-            if current_lines < min_lines and section['section_type'] == 'content':
-                # 合併到當前段落
-                current_merged['end_line'] = section['end_line']
-                current_merged['content_lines'].extend(section['content_lines'])
-                current_merged['content'] = '\n'.join(current_merged['content_lines'])
-                
-                # 更新標題（如果當前沒有好的標題）
-                if len(current_merged['title']) < 20 and len(section['title']) > len(current_merged['title']):
-                    current_merged['title'] = section['title']
-            else:
-                # 保存當前段落，開始新段落
-                merged_sections.append(current_merged)
-                current_merged = section.copy()
-        
-        # 添加最後一個段落
-        merged_sections.append(current_merged)
-        
-        return merged_sections
-    
-    def _generate_yaml_summary(self, file_path: str, lines: List[str], sections: List[Dict[str, Any]]) -> Dict[str, Any]:
+
+    def _generate_yaml_summary(self, file_path: str, accumulator: _SummaryAccumulator) -> Dict[str, Any]:
         """生成 YAML 格式摘要"""
-        
-        # 提取關鍵詞
-        all_keywords = set()
-        for section in sections:
-            keywords = self._extract_keywords(section['content'])
-            all_keywords.update(keywords)
-        
+
         # 構建摘要結構
         summary = {
             'file_info': {
                 'path': file_path,
                 'type': 'text',
-                'size': sum(len(line.encode('utf-8')) for line in lines),
-                'total_lines': len(lines),
+                'size': accumulator.size,
+                'total_lines': accumulator.total_lines,
                 'encoding': 'utf-8'
             },
             'document_structure': {
-                'total_sections': len(sections),
-                'section_types': self._count_section_types(sections),
-                'average_section_length': sum(s['end_line'] - s['start_line'] + 1 for s in sections) / len(sections) if sections else 0
+                'total_sections': accumulator.total_sections,
+                'section_types': dict(accumulator.section_types),
+                'average_section_length': accumulator.average_section_length
             },
-            'content_sections': [],
+            'content_sections': accumulator.sections,
             'keywords_summary': {
-                'unique_keywords': sorted(list(all_keywords))[:20],  # 只保留前20個關鍵詞
-                'total_unique_keywords': len(all_keywords)
+                'unique_keywords': list(accumulator.first_keywords),  # 只保留前20個關鍵詞
+                'total_unique_keywords': accumulator.keyword_counter.estimate()
             },
             'reading_estimate': {
-                'total_words': self._count_words(lines),
-                'estimated_reading_time_minutes': self._estimate_reading_time(lines),
-                'complexity_level': self._assess_complexity(sections)
+                # 中文按字符計算，英文按單詞計算（簡化處理）
+                'total_words': accumulator.total_chars,
+                # 假設每分鐘閱讀 300 個中文字符
+                'estimated_reading_time_minutes': accumulator.total_chars / 300,
+                'complexity_level': self._assess_complexity(accumulator.average_section_length)
             }
         }
-        
-        # 添加段落詳情
-        for i, section in enumerate(sections, 1):
-            section_summary = {
-                'section_number': i,
-                'line_range': f"{section['start_line']}-{section['end_line']}",
-                'title': section['title'],
-                'section_type': section['section_type'],
-                'line_count': section['end_line'] - section['start_line'] + 1,
-                'summary': self._generate_section_summary(section),
-                'key_points': self._extract_key_points(section)
-            }
-            summary['content_sections'].append(section_summary)
-        
+
+        # 段落過多時只列出前面的段落明細
+        if accumulator.total_sections > len(accumulator.sections):
+            summary['document_structure']['omitted_sections'] = accumulator.total_sections - len(accumulator.sections)
+
         return summary
-    
-    def _extract_keywords(self, content: str) -> List[str]:
-        """提取關鍵詞"""
-        # 簡單的關鍵詞提取邏輯
-        import re
-        
-        # 移除標點符號，分割單詞
-        words = re.findall(r'\b\w+\b', content.lower())
-        
-        # 過濾停用詞和短詞
-        stop_words = {'的', '是', '在', '有', '和', '與', '或', '但', '如果', '因為', '所以', '這', '那', '我', '你', '他', '她', '它'}
-        keywords = [word for word in words if len(word) > 1 and word not in stop_words]
-        
-        # 統計詞頻，返回最常見的詞
-        from collections import Counter
-        word_counts = Counter(keywords)
-        return [word for word, count in word_counts.most_common(10)]
-    
-    def _count_section_types(self, sections: List[Dict[str, Any]]) -> Dict[str, int]:
-        """統計段落類型"""
-        type_counts = {}
-        for section in sections:
-            section_type = section['section_type']
-            type_counts[section_type] = type_counts.get(section_type, 0) + 1
-        return type_counts
-    
-    def _count_words(self, lines: List[str]) -> int:
-        """統計單詞數"""
-        total_chars = sum(len(line) for line in lines)
-        # 中文按字符計算，英文按單詞計算
-        return total_chars  # 簡化處理
-    
-    def _estimate_reading_time(self, lines: List[str]) -> float:
-        """估算閱讀時間（分鐘）"""
-        total_chars = sum(len(line) for line in lines)
-        # 假設每分鐘閱讀 300 個中文字符
-        return total_chars / 300
-    
-    def _assess_complexity(self, sections: List[Dict[str, Any]]) -> str:
+
+    def _assess_complexity(self, avg_section_length: float) -> str:
         """評估複雜度"""
-        avg_section_length = sum(s['end_line'] - s['start_line'] + 1 for s in sections) / len(sections) if sections else 0
-        
         if avg_section_length > 10:
             return 'high'
         elif avg_section_length > 5:
             return 'medium'
         else:
             return 'low'
-    
-    def _generate_section_summary(self, section: Dict[str, Any]) -> str:
-        """生成段落摘要"""
-        content = section['content']
-        title = section['title']
-        
-        # 如果內容很短，直接返回
-        if len(content) < 50:
-            return content.strip()
-        
-        # 提取前幾句話作為摘要
-        sentences = re.split(r'[。！？\n]', content)
-        summary_sentences = []
-        total_length = 0
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if sentence and total_length + len(sentence) < 100:
-                summary_sentences.append(sentence)
-                total_length += len(sentence)
-            elif summary_sentences:
-                break
-        
-        summary = '。'.join(summary_sentences)
-        if summary and not summary.endswith('。'):
-            summary += '。'
-        
-        return summary or title
-    
-    def _extract_key_points(self, section: Dict[str, Any]) -> List[str]:
-        """提取關鍵點"""
-        content = section['content']
-        
-        # 查找列表項目
-        key_points = []
-        lines = content.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            # 匹配各種列表格式
-            if re.match(r'^[\d\w]+[\.、：]\s*(.+)', line):
-                match = re.match(r'^[\d\w]+[\.、：]\s*(.+)', line)
-                if match:
-                    key_points.append(match.group(1).strip())
-            elif re.match(r'^[-*]\s*(.+)', line):
-                match = re.match(r'^[-*]\s*(.+)', line)
-                if match:
-                    key_points.append(match.group(1).strip())
-        
-        return key_points[:5]  # 最多返回5個關鍵點
 
 
 # 全局實例
@@ -0,0 +1,383 @@
+"""
+串流統計
+
+在逐筆讀取記錄時維護固定大小的統計量（蓄水池抽樣、近似去重計數、高頻項、類型直方圖），
+記憶體用量與記錄總數無關，供數據文件分析使用。另提供單一 JSON 文件的增量解析，
+以及以 pandas 向量化分塊更新的整列類型統計。
+"""
+
+import re
+import json
+import math
+import heapq
+import random
+import hashlib
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import pandas as pd
+
+_HASH_SPACE = 2 ** 64
+# 欄位去重計數在不同值不超過此數量時保持精確（每列最多保留此數量的哈希值）
+DISTINCT_EXACT_LIMIT = 4096
+
+
+def _stable_hash(value: Any) -> int:
+    """64 位元穩定哈希（不受 PYTHONHASHSEED 影響，同一文件每次分析結果相同）"""
+    text = value if isinstance(value, str) else repr(value)
+    digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class ReservoirSample:
+    """
+    蓄水池抽樣：從任意長度的串流中均勻抽取 k 筆
+
+    使用 Algorithm L 直接計算下一個被替換的位置，隨機數只在替換時產生，
+    大部分記錄只需一次比較。
+    """
+
+    def __init__(self, k: int = 5, seed: Optional[int] = 0):
+        self.k = k
+        self.seen = 0
+        self.items: List[Any] = []
+        self._random = random.Random(seed)
+        self._weight = 1.0
+        self._next_index = 0
+
+    def _uniform(self) -> float:
+        # (0, 1) 區間，避免 log(0)
+        return self._random.random() or 1e-300
+
+    def _schedule_next(self) -> None:
+        self._weight *= math.exp(math.log(self._uniform()) / self.k)
+        skip = math.floor(math.log(self._uniform()) / math.log1p(-self._weight)) if self._weight < 1.0 else 0
+        self._next_index = self.seen + skip + 1
+
+    def add(self, item: Any) -> None:
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+            if len(self.items) == self.k:
+                self._schedule_next()
+            return
+        if self.seen == self._next_index:
+            self.items[self._random.randrange(self.k)] = item
+            self._schedule_next()
+
+
+class DistinctCounter:
+    """
+    近似去重計數（KMV：保留最小的 k 個哈希值）
+
+    不同值少於 k 個（或不超過 exact_limit 個）時為精確值，之後相對誤差約 1/sqrt(k)。
+    """
+
+    def __init__(self, k: int = 256, exact_limit: int = 0):
+        self.k = k
+        self.exact_limit = exact_limit
+        self._heap: List[int] = []   # 取負值實現最大堆
+        self._members = set()
+        self._exact: Optional[set] = set() if exact_limit > k else None
+
+    @property
+    def relative_error(self) -> float:
+        """估計值的相對標準誤差（精確計數時為 0）"""
+        if self._exact is not None or len(self._heap) < self.k:
+            return 0.0
+        return 1 / math.sqrt(self.k)
+
+    def add(self, value: Any) -> None:
+        h = _stable_hash(value)
+        if self._exact is not None:
+            self._exact.add(h)
+            if len(self._exact) > self.exact_limit:
+                self._exact = None
+        if h in self._members:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -h)
+            self._members.add(h)
+        elif h < -self._heap[0]:
+            removed = -heapq.heapreplace(self._heap, -h)
+            self._members.discard(removed)
+            self._members.add(h)
+
+    def estimate(self) -> int:
+        if self._exact is not None:
+            return len(self._exact)
+        if len(self._heap) < self.k:
+            return len(self._heap)
+        kth_smallest = -self._heap[0]
+        return int((self.k - 1) * _HASH_SPACE / (kth_smallest + 1))
+
+
+class HeavyHitters:
+    """
+    高頻項統計（有界的 Counter）
+
+    不同項數超過 capacity 的兩倍時只保留計數最高的 capacity 項，
+    不同項數未超過此上限時結果與 Counter.most_common 完全相同。
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts: Counter = Counter()
+
+    def update(self, items: Sequence[Any]) -> None:
+        self.counts.update(items)
+        if len(self.counts) > 2 * self.capacity:
+            self.counts = Counter(dict(self.counts.most_common(self.capacity)))
+
+    def most_common(self, n: int) -> List[Tuple[Any, int]]:
+        return self.counts.most_common(n)
+
+
+class ValueProfile:
+    """單一欄位（CSV 列或 JSON 鍵）的串流統計"""
+
+    def __init__(self, sample_size: int = 5, distinct_k: int = 256, head_size: int = 3):
+        self.count = 0
+        self.empty_count = 0
+        self.head: List[Any] = []          # 前幾個值（保持與原有 sample_data 相同的語義）
+        self.head_size = head_size
+        self.sample = ReservoirSample(sample_size)
+        self.distinct = DistinctCounter(distinct_k, DISTINCT_EXACT_LIMIT)
+        self.type_counts: Counter = Counter()
+
+    def add(self, value: Any, type_name: Optional[str] = None) -> None:
+        self.count += 1
+        if len(self.head) < self.head_size:
+            self.head.append(value)
+
+        if value is None or (isinstance(value, str) and not value.strip()):
+            self.empty_count += 1
+            self.type_counts['empty'] += 1
+            return
+
+        self.type_counts[type_name or type(value).__name__] += 1
+        self.sample.add(value)
+        self.distinct.add(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'empty_count': self.empty_count,
+            'approx_distinct': self.distinct.estimate(),
+            'type_counts': dict(self.type_counts),
+            'sample': list(self.sample.items)
+        }
+
+
+# 類型推斷的判定規則（與 ContentAnalyzer 原本逐值判斷的規則一致）
+BOOLEAN_VALUES = ['true', 'false', '1', '0', 'yes', 'no', 'y', 'n']
+_INTEGER_PATTERN = r'\s*[+-]?\d+\s*'
+_DATE_PATTERN = r'\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}|\d{2}-\d{2}-\d{4}'
+# 日期列沿用原本「超過 80% 為日期」的寬鬆門檻
+DATE_TYPE_THRESHOLD = 0.8
+# ID 列的唯一值比例門檻；去重數為近似值時放寬兩個標準誤差，避免估計偏低時誤判
+ID_UNIQUE_RATIO = 0.9
+
+
+class ColumnTypeStats:
+    """
+    整列類型統計
+
+    以分塊方式累積整列的值類型計數（空值、整數、浮點數、布林、日期、字串），
+    每塊用 pandas 向量化判斷，可覆蓋整個文件而不只是前幾行。
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.empty = 0
+        self.integer = 0
+        self.float = 0
+        self.boolean_like = 0   # 值屬於布林集合（包含數字 0/1）
+        self.date = 0
+        self.integer_min: Optional[float] = None
+        self.integer_sum = 0.0
+
+    def update(self, values: Sequence[str]) -> None:
+        """以一塊值更新計數"""
+        if not len(values):
+            return
+        series = pd.Series(values, dtype=object)
+        self.total += len(series)
+
+        non_empty = series[series.str.strip() != '']
+        self.empty += len(series) - len(non_empty)
+        if non_empty.empty:
+            return
+
+        # 數字判斷後，其餘檢查只在需要的子集上進行
+        numbers = pd.to_numeric(non_empty, errors='coerce')
+        is_numeric = numbers.notna()
+        numeric_strings = non_empty[is_numeric]
+        others = non_empty[~is_numeric]
+
+        is_integer = numeric_strings.str.fullmatch(_INTEGER_PATTERN).astype(bool)
+        integer_count = int(is_integer.sum())
+        self.integer += integer_count
+        self.float += len(numeric_strings) - integer_count
+
+        if integer_count:
+            integers = numbers[is_numeric][is_integer]
+            chunk_min = float(integers.min())
+            self.integer_min = chunk_min if self.integer_min is None else min(self.integer_min, chunk_min)
+            self.integer_sum += float(integers.sum())
+
+        if len(others):
+            self.boolean_like += int(others.str.lower().isin(BOOLEAN_VALUES).sum())
+            self.date += int(others.str.match(_DATE_PATTERN).astype(bool).sum())
+        self.boolean_like += int(numeric_strings.isin(['0', '1']).sum())
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            'empty': self.empty,
+            'integer': self.integer,
+            'float': self.float,
+            'boolean_like': self.boolean_like,
+            'date': self.date,
+            'other': max(0, self.total - self.empty - self.integer - self.float - self.boolean_like - self.date)
+        }
+
+    def infer(self, confidence: float = 1.0, distinct_count: Optional[int] = None,
+              distinct_error: float = 0.0) -> Tuple[str, float]:
+        """
+        推斷列類型
+
+        Args:
+            confidence: 非空值中至少有此比例符合才判定為該類型（1.0 表示必須全部符合）
+            distinct_count: 非空值的（近似）去重數，用於判斷 ID 列
+            distinct_error: distinct_count 的相對標準誤差（精確值為 0）
+
+        Returns:
+            (類型, 符合該類型的非空值比例)
+        """
+        non_empty = self.total - self.empty
+        if non_empty == 0:
+            return 'empty', 1.0
+
+        numeric_ratio = (self.integer + self.float) / non_empty
+        integer_ratio = self.integer / non_empty
+        if numeric_ratio >= confidence:
+            if integer_ratio >= confidence:
+                # ID判斷條件：高唯一性 + 正整數 + 較大數值
+                unique_ratio = min(1.0, (distinct_count or 0) / non_empty)
+                average = self.integer_sum / self.integer
+                if unique_ratio > ID_UNIQUE_RATIO * (1 - 2 * distinct_error) and self.integer_min > 0 and average > 1000:
+                    return 'id', integer_ratio
+                return 'integer', integer_ratio
+            return 'float', numeric_ratio
+
+        boolean_ratio = self.boolean_like / non_empty
+        if boolean_ratio >= confidence:
+            return 'boolean', boolean_ratio
+
+        date_ratio = self.date / non_empty
+        if date_ratio >= confidence or date_ratio > DATE_TYPE_THRESHOLD:
+            return 'date', date_ratio
+
+        return 'string', 1.0 - max(numeric_ratio, boolean_ratio, date_ratio)
+
+
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_NUMBER_CHARS = re.compile(r'[0-9.eE+\-]*')
+
+
+class JsonStreamReader:
+    """
+    增量讀取單一 JSON 文件
+
+    陣列與物件可逐個元素解析，緩衝區只需容納當前元素而非整個文件。
+    格式錯誤時拋出 ValueError（json.JSONDecodeError 亦為其子類）。
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = 64 * 1024):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self.chars_read = 0
+
+    def _fill(self, min_size: int = 0) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(max(self._chunk_size, min_size))
+        if not chunk:
+            self._eof = True
+            return False
+        self.chars_read += len(chunk)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳過空白並返回下一個字符，文件結束時返回空字串"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON 格式錯誤：預期 {char!r}，實際為 {found!r}（第 {self.chars_read} 字符附近）")
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        """解析下一個完整的 JSON 值"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # 數字可能在緩衝區邊界被截斷（如 "12.|5"），其後只剩數字字符時需再讀一些確認
+                if self._eof or _NUMBER_CHARS.match(self._buf, end).end() < len(self._buf):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # 每次至少讀入與當前緩衝區等量的內容，避免大型元素被反覆重新解析
+            self._fill(len(self._buf) - self._pos)
+
+    def iter_array(self) -> Iterator[Any]:
+        """逐個產生頂層（或當前位置）陣列的元素"""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def iter_object_keys(self) -> Iterator[str]:
+        """
+        逐個產生當前位置物件的鍵
+
+        調用方在取得每個鍵後必須自行讀取對應的值（read_value、iter_array 等），再繼續迭代。
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            if not isinstance(key, str):
+                raise ValueError(f"JSON 格式錯誤：物件鍵必須為字串（第 {self.chars_read} 字符附近）")
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect('}')
+            return
+
@@ -4,16 +4,58 @@
 生成文件的重點整理表，包括文本文件和數據文件的不同處理方式。
 """
 
+import os
+import atexit
 import asyncio
-from typing import Dict, List, Any, Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterator, AsyncIterator
 from datetime import datetime
 import logging
 
-from .parallel_reader import ParallelFileReader
-from .content_analyzer import ContentAnalyzer
+from .parallel_reader import ParallelFileReader, FileSegment
+from .content_analyzer import ContentAnalyzer, analyze_segments_batch
+from .line_index import line_index_manager
 
 logger = logging.getLogger(__name__)
 
+# 段落分析進程池（全進程共用，延遲建立）
+ANALYSIS_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# 段落數少於此值時在執行緒中直接分析，避免進程間傳輸的開銷
+MIN_SEGMENTS_FOR_POOL = 8
+# 串流分析時每批段落數與同時在途的批數上限（限制記憶體中的段落內容）
+ANALYSIS_BATCH_SEGMENTS = 32
+MAX_PENDING_BATCHES = ANALYSIS_MAX_WORKERS * 2
+# 增量更新重新分段時每次透過行索引讀取的行數
+RESEGMENT_BLOCK_LINES = 1000
+
+_analysis_executor: Optional[ProcessPoolExecutor] = None
+_analysis_executor_lock = threading.Lock()
+
+
+def _get_analysis_executor() -> ProcessPoolExecutor:
+    global _analysis_executor
+    with _analysis_executor_lock:
+        if _analysis_executor is None:
+            _analysis_executor = ProcessPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS)
+        return _analysis_executor
+
+
+def shutdown_analysis_executor() -> None:
+    """關閉段落分析進程池"""
+    global _analysis_executor
+    with _analysis_executor_lock:
+        if _analysis_executor is not None:
+            _analysis_executor.shutdown(wait=False, cancel_futures=True)
+            _analysis_executor = None
+
+
+atexit.register(shutdown_analysis_executor)
+
 
 class SummaryGenerator:
     """摘要生成器"""
@@ -38,21 +80,24 @@ class SummaryGenerator:
         start_time = datetime.now()
         
         try:
-            # 讀取文件並分段
+            # 分段參數（段落在各摘要生成函數中串流讀取）
             self.reader.min_lines = min_lines
             self.reader.min_chars = min_chars
             self.reader.overlap = overlap
-            file_data = await self.reader.read_file_parallel(file_path)
+
+            file_path_obj = Path(file_path)
+            if not file_path_obj.exists():
+                raise FileNotFoundError(f"文件不存在: {file_path}")
             
             # 分析文件類型
-            file_type = file_data['file_info']['type']
+            file_type = self.reader._detect_file_type(file_path_obj)
             
             if file_type in ['csv', 'json', 'excel']:
                 # 數據文件處理
-                summary = await self._generate_data_summary(file_path, file_data)
+                summary = await self._generate_data_summary(file_path_obj)
             else:
                 # 文本文件處理
-                summary = await self._generate_text_summary(file_data)
+                summary = await self._generate_text_summary(file_path_obj)
             
             # 添加處理時間
             end_time = datetime.now()
@@ -65,32 +110,92 @@ class SummaryGenerator:
             logger.error(f"生成文件摘要失敗 {file_path}: {e}")
             raise
     
-    async def _generate_text_summary(self, file_data: Dict[str, Any]) -> Dict[str, Any]:
-        """生成文本文件摘要"""
-        file_info = file_data['file_info']
-        segments = file_data['segments']
-        file_path = file_info.get('path', 'unknown')  # 從 file_info 中獲取路徑
-
-        # 並行分析所有段落
-        analysis_tasks = []
-        for segment in segments:
-            task = asyncio.create_task(self._analyze_segment_async(segment, file_path))
-            analysis_tasks.append(task)
-        
-        segment_analyses = await asyncio.gather(*analysis_tasks)
+    async def _generate_text_summary(self, file_path: Path) -> Dict[str, Any]:
+        """
+        生成文本文件摘要
+
+        段落邊讀邊分批送入進程池分析，每批結果立即整理為摘要段落與統計後釋放，
+        記憶體中只保留有限批數的段落內容。
+        """
+        stats: Dict[str, Any] = {}
+        segment_iter = self.reader.iter_segments(file_path, stats=stats)
+        all_segments = []
+        segment_stats = []
+
+        try:
+            async for segments, segment_analyses in self._iter_analysed_batches(segment_iter, str(file_path)):
+                # 構建摘要 - 展開子段落
+                all_segments.extend(self._expand_segment_analyses(segment_analyses))
+                segment_stats.extend(self._build_segment_stats(segments, segment_analyses))
+        finally:
+            segment_iter.close()
+
+        # 行數與編碼在串流讀取結束後才確定
+        file_info = self.reader._build_file_info(file_path, stats)
+
+        summary = {
+            'file_info': {
+                'path': file_info['path'],
+                'type': 'text',
+                'size': file_info['size'],
+                'lines': file_info['lines'],
+                'encoding': file_info['encoding']
+            },
+            'segments': all_segments,
+            'overall_stats': self._build_overall_stats(segment_stats, len(all_segments), file_info['lines']),
+            # 每個分析段落的統計，供編輯後增量重算整體統計
+            'segment_stats': segment_stats,
+            'segmentation': {
+                'min_lines': self.reader.min_lines,
+                'min_chars': self.reader.min_chars,
+                'overlap': self.reader.overlap
+            }
+        }
         
-        # 生成整體統計
-        total_keywords = set()
-        content_types = {}
+        return summary
+
+    @staticmethod
+    def _build_segment_stats(segments: List[Dict[str, Any]],
+                             segment_analyses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """提取每個分析段落的統計（與展開後的段落數對應）"""
+        return [
+            {
+                'start_line': analysis['start_line'],
+                'end_line': analysis['end_line'],
+                'actual_start': segment['actual_start'],
+                'content_type': analysis['content_type'],
+                'keywords': analysis['keywords'],
+                'complexity': analysis['complexity']['cyclomatic_complexity'],
+                'segment_count': len(analysis.get('sub_segments') or []) or 1
+            }
+            for segment, analysis in zip(segments, segment_analyses)
+        ]
+
+    def _build_overall_stats(self, segment_stats: List[Dict[str, Any]], total_segments: int,
+                             line_count: int) -> Dict[str, Any]:
+        """由分析段落統計生成整體統計（完整生成與增量更新共用）"""
+        keywords: Dict[str, None] = {}
+        content_types: Dict[str, int] = {}
         total_complexity = 0
-        
-        for analysis in segment_analyses:
-            total_keywords.update(analysis['keywords'])
-            content_type = analysis['content_type']
-            content_types[content_type] = content_types.get(content_type, 0) + 1
-            total_complexity += analysis['complexity']['cyclomatic_complexity']
-        
-        # 構建摘要 - 展開子段落
+
+        for stats in segment_stats:
+            for keyword in stats['keywords']:
+                if len(keywords) >= 20:  # 限制關鍵詞數量
+                    break
+                keywords.setdefault(keyword)
+            content_types[stats['content_type']] = content_types.get(stats['content_type'], 0) + 1
+            total_complexity += stats['complexity']
+
+        return {
+            'total_segments': total_segments,
+            'unique_keywords': list(keywords),
+            'content_type_distribution': content_types,
+            'average_complexity': total_complexity / len(segment_stats) if segment_stats else 0,
+            'estimated_reading_time': self._estimate_reading_time(line_count)
+        }
+    
+    def _expand_segment_analyses(self, segment_analyses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """將段落分析結果展開為摘要段落（有子段落時使用子段落）"""
         all_segments = []
         for analysis in segment_analyses:
             if 'sub_segments' in analysis and analysis['sub_segments']:
@@ -101,8 +206,8 @@ class SummaryGenerator:
                         'end_line': sub_seg['end_line'],
                         'summary': sub_seg['summary'],
                         'topic': sub_seg['topic'],
-                        'keywords': self.analyzer._extract_keywords(sub_seg['content']),
-                        'content_type': self.analyzer._detect_content_type(sub_seg['content'], file_path),
+                        'keywords': sub_seg['keywords'],
+                        'content_type': sub_seg['content_type'],
                         'line_count': sub_seg['end_line'] - sub_seg['start_line'] + 1,
                         'char_count': len(sub_seg['content'])
                     })
@@ -119,37 +224,25 @@ class SummaryGenerator:
                     'char_count': analysis['char_count']
                 })
 
-        summary = {
-            'file_info': {
-                'path': file_info['path'],
-                'type': 'text',
-                'size': file_info['size'],
-                'lines': file_info['lines'],
-                'encoding': file_info['encoding']
-            },
-            'segments': all_segments,
-            'overall_stats': {
-                'total_segments': len(all_segments),
-                'unique_keywords': list(total_keywords)[:20],  # 限制關鍵詞數量
-                'content_type_distribution': content_types,
-                'average_complexity': total_complexity / len(segments) if segments else 0,
-                'estimated_reading_time': self._estimate_reading_time(file_info['lines'])
-            }
-        }
-        
-        return summary
-    
-    async def _generate_data_summary(self, file_path: str, file_data: Dict[str, Any]) -> Dict[str, Any]:
+        return all_segments
+
+    async def _generate_data_summary(self, file_path: Path) -> Dict[str, Any]:
         """生成數據文件摘要"""
-        file_info = file_data['file_info']
-        
-        # 讀取文件內容進行數據分析
-        content = ""
-        for segment in file_data['segments']:
-            content += segment['content']
+        stats: Dict[str, Any] = {}
+
+        def scan_segments():
+            # 只保留段落的行範圍，段落內容不需要
+            return [
+                {'start_line': segment.start_line, 'end_line': segment.end_line, 'line_count': segment.line_count}
+                for segment in self.reader.iter_segments(file_path, stats=stats)
+            ]
+
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(None, scan_segments)
+        file_info = self.reader._build_file_info(file_path, stats)
         
-        # 分析數據結構
-        data_analysis = self.analyzer.analyze_data_file(file_path, content)
+        # 分析數據結構（分析器直接從文件串流讀取，不需拼接段落內容）
+        data_analysis = await loop.run_in_executor(None, self.analyzer.analyze_data_file, str(file_path))
         
         # 構建數據文件摘要
         summary = {
@@ -170,7 +263,7 @@ class SummaryGenerator:
                     'content_type': 'data',
                     'line_count': segment['line_count']
                 }
-                for segment in file_data['segments']
+                for segment in segments
             ]
         }
         
@@ -225,11 +318,94 @@ class SummaryGenerator:
         else:
             return structure.get('value')
     
-    async def _analyze_segment_async(self, segment: Dict[str, Any], file_path: str = "") -> Dict[str, Any]:
-        """異步分析段落"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.analyzer.analyze_segment, segment, file_path)
-    
+    async def _iter_analysed_batches(self, segments: Iterator[FileSegment],
+                                     file_path: str = "") -> AsyncIterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        串流分析段落
+
+        段落在執行緒中逐批讀取並送入進程池，同時在途的批數有上限，
+        按段落順序產生 (段落列表, 分析結果列表)。少量段落或進程池不可用時改在執行緒中分析。
+        """
+        loop = asyncio.get_running_loop()
+
+        def next_batch() -> List[Dict[str, Any]]:
+            return [segment.to_dict() for segment in islice(segments, ANALYSIS_BATCH_SEGMENTS)]
+
+        batch = await loop.run_in_executor(None, next_batch)
+        if len(batch) < MIN_SEGMENTS_FOR_POOL:
+            if batch:
+                yield batch, await loop.run_in_executor(None, analyze_segments_batch, batch, file_path)
+            return
+
+        executor: Optional[ProcessPoolExecutor] = _get_analysis_executor()
+        pending: deque = deque()
+        exhausted = False
+
+        def fall_back(error: Exception) -> None:
+            nonlocal executor
+            if executor is not None:
+                logger.warning(f"⚠️ 段落分析進程池不可用，改用執行緒分析: {error}")
+                shutdown_analysis_executor()
+                executor = None
+
+        def submit(segment_batch: List[Dict[str, Any]]) -> asyncio.Future:
+            try:
+                return loop.run_in_executor(executor, analyze_segments_batch, segment_batch, file_path)
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                fall_back(e)
+                return loop.run_in_executor(None, analyze_segments_batch, segment_batch, file_path)
+
+        while True:
+            if batch is not None:
+                if batch:
+                    pending.append((batch, submit(batch)))
+                exhausted = len(batch) < ANALYSIS_BATCH_SEGMENTS
+                batch = None
+            if not exhausted and len(pending) < MAX_PENDING_BATCHES:
+                batch = await loop.run_in_executor(None, next_batch)
+                continue
+            if not pending:
+                return
+
+            done_batch, future = pending.popleft()
+            try:
+                analyses = await future
+            except (BrokenProcessPool, OSError) as e:
+                fall_back(e)
+                analyses = await loop.run_in_executor(None, analyze_segments_batch, done_batch, file_path)
+            yield done_batch, analyses
+
+    async def _analyze_segments(self, segments: List[Dict[str, Any]], file_path: str = "") -> List[Dict[str, Any]]:
+        """
+        分析所有段落
+
+        段落分批送入進程池以利用多核心，事件循環只等待結果；
+        少量段落或進程池不可用時改在執行緒中分析。
+        """
+        if not segments:
+            return []
+
+        loop = asyncio.get_running_loop()
+        if len(segments) < MIN_SEGMENTS_FOR_POOL:
+            return await loop.run_in_executor(None, analyze_segments_batch, segments, file_path)
+
+        # 每個工作進程約分到 4 批，兼顧負載平衡與傳輸次數
+        batch_size = max(1, -(-len(segments) // (ANALYSIS_MAX_WORKERS * 4)))
+        batches = [segments[i:i + batch_size] for i in range(0, len(segments), batch_size)]
+
+        try:
+            executor = _get_analysis_executor()
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, analyze_segments_batch, batch, file_path)
+                for batch in batches
+            ])
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning(f"⚠️ 段落分析進程池不可用，改用執行緒分析: {e}")
+            shutdown_analysis_executor()
+            return await loop.run_in_executor(None, analyze_segments_batch, segments, file_path)
+
+        return [analysis for batch_result in results for analysis in batch_result]
+
     def _estimate_reading_time(self, line_count: int) -> Dict[str, float]:
         """估算閱讀時間"""
         # 假設平均每行10個詞，每分鐘閱讀200詞
@@ -247,53 +423,128 @@ class SummaryGenerator:
     
     async def update_file_summary(self, existing_summary: Dict[str, Any], 
                                  start_line: int, end_line: int, 
-                                 new_content: str) -> Dict[str, Any]:
+                                 new_content: str, file_path: Optional[str] = None) -> Dict[str, Any]:
         """
         更新文件摘要（當文件被編輯後）
+
+        只從第一個受影響的段落重新分段分析，新分段與原有分段對齊後停止，
+        其後的段落按行數變化平移；整體統計由各分析段落的統計重新計算，
+        結果與完整重新生成相同。
+        調用時文件應已寫入新內容，existing_summary 需對應編輯前的文件。
+        數據文件的結構依賴整個文件，仍會完整重新生成。
         
         Args:
             existing_summary: 現有摘要
             start_line: 編輯開始行
             end_line: 編輯結束行
-            new_content: 新內容
+            new_content: 新內容（行數變化以寫入後文件的實際行數為準）
+            file_path: 文件路徑，未提供時使用摘要中的路徑
             
         Returns:
             更新後的摘要
         """
-        # 找到受影響的段落
-        affected_segments = []
-        for i, segment in enumerate(existing_summary.get('segments', [])):
-            if (segment['start_line'] <= end_line and segment['end_line'] >= start_line):
-                affected_segments.append(i)
-        
-        # 重新分析受影響的段落
-        # 這裡簡化處理，實際應該重新讀取文件並分析
-        for segment_idx in affected_segments:
-            segment = existing_summary['segments'][segment_idx]
-            # 創建臨時段落進行分析
-            temp_segment = {
-                'segment_id': segment_idx + 1,
-                'start_line': segment['start_line'],
-                'end_line': segment['end_line'],
-                'content': new_content,  # 簡化：使用新內容
-                'line_count': len(new_content.split('\n'))
-            }
-            
-            # 重新分析
-            analysis = await self._analyze_segment_async(temp_segment, file_path)
-            
-            # 更新摘要
-            existing_summary['segments'][segment_idx].update({
-                'summary': analysis['summary'],
-                'keywords': analysis['keywords'],
-                'content_type': analysis['content_type'],
-                'line_count': analysis['line_count']
-            })
-        
-        # 更新時間戳
-        existing_summary['updated_at'] = datetime.now().isoformat()
-        
-        return existing_summary
+        file_info = existing_summary.get('file_info', {})
+        file_path = file_path or file_info.get('path')
+        segment_stats = existing_summary.get('segment_stats')
+        segments = existing_summary.get('segments', [])
+        segmentation = existing_summary.get('segmentation') or {}
+
+        # 數據文件或缺少分析段落統計的舊摘要無法增量更新，完整重新生成
+        if (file_info.get('type') != 'text' or not segment_stats
+                or sum(stats['segment_count'] for stats in segment_stats) != len(segments)):
+            return await self.generate_file_summary(file_path, **segmentation)
+
+        start_time = datetime.now()
+
+        # 編輯前被替換的行範圍；行數變化以文件實際行數為準
+        # （新內容不以換行結尾時會與下一行相連，因此緊接的下一行也視為受影響）
+        old_lines = file_info.get('lines', end_line)
+        total_lines = line_index_manager.line_count(file_path)
+        replaced_end = min(end_line + 1, old_lines)
+        line_delta = total_lines - old_lines
+
+        # 以分析段落為單位劃分：編輯範圍之前的不變，從第一個受影響的段落重新分段，
+        # 直到新分段與編輯範圍之後的原有分段重新對齊，其餘段落按行數變化平移
+        first = 0
+        while first < len(segment_stats) - 1 and segment_stats[first]['end_line'] < start_line:
+            first += 1
+        last = first
+        while last < len(segment_stats) and segment_stats[last]['start_line'] <= replaced_end:
+            last += 1
+
+        restart = segment_stats[first]['actual_start']
+        if restart > total_lines:
+            return await self.generate_file_summary(file_path, **segmentation)
+
+        reader = ParallelFileReader(**segmentation) if segmentation else self.reader
+        sync_starts = [stats['actual_start'] + line_delta for stats in segment_stats[last:]]
+        loop = asyncio.get_running_loop()
+        new_segments, synced = await loop.run_in_executor(
+            None, self._resegment, reader, file_path, file_info.get('encoding', 'utf-8'), restart, sync_starts
+        )
+        new_analyses = await self._analyze_segments(new_segments, file_path)
+        last += synced
+
+        def shift(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [
+                {**item, **{key: item[key] + line_delta for key in ('start_line', 'end_line', 'actual_start')
+                            if key in item}}
+                for item in items
+            ]
+
+        before_count = sum(stats['segment_count'] for stats in segment_stats[:first])
+        after_count = sum(stats['segment_count'] for stats in segment_stats[last:])
+        segments = (
+            segments[:before_count]
+            + self._expand_segment_analyses(new_analyses)
+            + shift(segments[len(segments) - after_count:])
+        )
+        segment_stats = (
+            segment_stats[:first]
+            + self._build_segment_stats(new_segments, new_analyses)
+            + shift(segment_stats[last:])
+        )
+
+        end_time = datetime.now()
+        return {
+            **existing_summary,
+            'file_info': {**file_info, 'size': os.path.getsize(file_path), 'lines': total_lines},
+            'segments': segments,
+            'overall_stats': self._build_overall_stats(segment_stats, len(segments), total_lines),
+            'segment_stats': segment_stats,
+            'processing_time': (end_time - start_time).total_seconds(),
+            'updated_at': end_time.isoformat()
+        }
+
+    @staticmethod
+    def _resegment(reader: ParallelFileReader, file_path: str, encoding: str, restart: int,
+                   sync_starts: List[int]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        從 restart 行重新分段，直到與原有分段重新對齊
+
+        新分段的起始行等於某個原有分段（已平移）的起始行時，之後的分段必然相同，停止讀取。
+
+        Returns:
+            (新分段列表, 被新分段取代的原有分段數)
+        """
+        first_line = max(1, restart - reader.overlap)
+        total_lines = line_index_manager.line_count(file_path)
+
+        def iter_lines():
+            for block_start in range(first_line, total_lines + 1, RESEGMENT_BLOCK_LINES):
+                yield from line_index_manager.read_lines(
+                    file_path, block_start, block_start + RESEGMENT_BLOCK_LINES - 1, encoding, keepends=True
+                )
+
+        new_segments = []
+        synced = 0
+        for segment in reader.iter_line_segments(iter_lines(), first_line, restart):
+            while synced < len(sync_starts) and sync_starts[synced] < segment.actual_start:
+                synced += 1
+            if synced < len(sync_starts) and sync_starts[synced] == segment.actual_start:
+                return new_segments, synced
+            new_segments.append(segment.to_dict())
+        return new_segments, len(sync_starts)
 
 
 # 便利函數
@@ -2,10 +2,26 @@
 Task Memory 系統
 
 提供循環任務處理、進度追蹤和暫存數據管理功能。
+
+子模組在首次存取時才導入：task_memory_manager 與 session_storage 導入時會建立模組級實例，
+只導入 item_processor 等輕量子模組（例如進程池的子進程）時不會連帶初始化。
 """
 
-from .task_memory_manager import TaskMemoryManager
-from .session_storage import SessionStorage
-from .progress_tracker import ProgressTracker
+import importlib
+
+_LAZY_EXPORTS = {
+    'TaskMemoryManager': '.task_memory_manager',
+    'SessionStorage': '.session_storage',
+    'ProgressTracker': '.progress_tracker',
+}
 
 __all__ = ['TaskMemoryManager', 'SessionStorage', 'ProgressTracker']
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
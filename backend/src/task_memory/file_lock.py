@@ -0,0 +1,159 @@
+"""
+File Lock
+
+會話存儲使用的檔案鎖與原子寫入。
+
+鎖同時以進程內的 RLock（同進程的執行緒與協程）和作業系統檔案鎖（跨進程）保護，
+寫入先寫到同目錄的暫存檔再以 os.replace 原子替換，讀取端不會看到寫到一半的檔案。
+
+鎖檔集中放在調用方指定的鎖目錄（以目標路徑的哈希命名），取鎖不會在目標位置建立任何目錄；
+POSIX 上釋放時即刪除鎖檔，不會為每個數據文件留下永久的 .lock 檔。
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# 進程內每個路徑一把可重入鎖（同一執行緒可巢狀取得）
+_thread_locks: Dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+_local = threading.local()
+
+
+def _lock_path(key: str, lock_dir: Optional[Path]) -> Path:
+    """鎖檔路徑：未指定鎖目錄時使用系統暫存目錄"""
+    lock_dir = lock_dir or Path(tempfile.gettempdir()) / "task_memory_locks"
+    return lock_dir / f"{hashlib.md5(key.encode('utf-8')).hexdigest()}.lock"
+
+
+def _thread_lock(key: str) -> threading.RLock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.RLock()
+        return lock
+
+
+def _os_lock(handle) -> None:
+    if os.name == "nt":
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK 重試約 10 秒後仍失敗，繼續等待
+                continue
+    else:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+
+
+def _os_unlock(handle) -> None:
+    if os.name == "nt":
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _open_locked(lock_file: Path):
+    """
+    打開並鎖定鎖檔
+
+    其他進程可能在釋放時刪除鎖檔，取得鎖後需確認鎖住的仍是目錄中的同一個檔案，否則重試。
+    """
+    while True:
+        handle = open(lock_file, "a+b")
+        try:
+            _os_lock(handle)
+            if os.name == "nt" or os.fstat(handle.fileno()).st_ino == os.stat(lock_file).st_ino:
+                return handle
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            handle.close()
+            raise
+        handle.close()
+
+
+@contextmanager
+def file_lock(path: Union[str, Path], lock_dir: Optional[Union[str, Path]] = None) -> Iterator[None]:
+    """
+    取得檔案的排他鎖（跨執行緒、協程與進程）
+
+    讀-改-寫的整個流程應在同一個鎖內完成。同一執行緒可重入。
+
+    Args:
+        path: 要保護的目標檔（不需存在，也不會建立其所在目錄）
+        lock_dir: 存放鎖檔的目錄，同一份數據的所有使用者必須使用相同的鎖目錄
+    """
+    path = Path(path)
+    key = str(path.resolve())
+    lock = _thread_lock(key)
+
+    with lock:
+        # 同一執行緒巢狀取得時只需計數，作業系統鎖已持有
+        held = getattr(_local, "held", None)
+        if held is None:
+            held = _local.held = {}
+        if held.get(key):
+            held[key] += 1
+            try:
+                yield
+            finally:
+                held[key] -= 1
+            return
+
+        lock_file = _lock_path(key, Path(lock_dir) if lock_dir else None)
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        handle = _open_locked(lock_file)
+        held[key] = 1
+        try:
+            yield
+        finally:
+            held.pop(key, None)
+            try:
+                # 持鎖時刪除鎖檔，等待中的進程會發現檔案已被替換並重新取鎖
+                if os.name != "nt":
+                    try:
+                        os.unlink(lock_file)
+                    except FileNotFoundError:
+                        pass
+                _os_unlock(handle)
+            finally:
+                handle.close()
+
+
+def atomic_write_text(path: Union[str, Path], text: str) -> None:
+    """以暫存檔寫入後原子替換目標檔"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: Union[str, Path], data: Any, indent: Optional[int] = 2) -> None:
+    """原子寫入 JSON（預設格式與原本的 json.dump 相同；大型資料可傳 indent=None 使用較快的緊湊格式）"""
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=indent))
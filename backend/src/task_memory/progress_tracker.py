@@ -2,18 +2,26 @@
 Progress Tracker
 
 追蹤循環任務的進度和狀態。
+
+進度與檢查點先累積在記憶體中，最多每 flush_interval 秒寫入一次任務狀態檔；
+狀態變更（開始、完成、失敗等）會立即寫入。檢查點只記錄結果日誌的位置，不複製結果內容。
 """
 
 import json
-from typing import Dict, Any, Optional, List
+import time
+import atexit
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 from enum import Enum
 import logging
 
-from .session_storage import SessionStorage
+from .session_storage import SessionStorage, create_session_storage
 
 logger = logging.getLogger(__name__)
 
+# 任務狀態中保留的檢查點數量
+MAX_CHECKPOINTS = 10
+
 
 class TaskStatus(Enum):
     """任務狀態"""
@@ -28,8 +36,14 @@ class TaskStatus(Enum):
 class ProgressTracker:
     """進度追蹤器"""
     
-    def __init__(self, storage: Optional[SessionStorage] = None):
-        self.storage = storage or SessionStorage()
+    def __init__(self, storage: Optional[SessionStorage] = None, flush_interval: float = 1.0):
+        self.storage = storage or create_session_storage()
+        self.flush_interval = flush_interval
+
+        # 尚未寫入的進度變更：(session_id, task_id) -> 待合併的進度、結果與檢查點
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._last_flush: Dict[Tuple[str, str], float] = {}
+        atexit.register(self.flush)
     
     def create_task(self, session_id: str, task_id: str, task_config: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -74,7 +88,8 @@ class ProgressTracker:
             if total_items > 0 and batch_size > 0:
                 task_info["progress"]["total_batches"] = (total_items + batch_size - 1) // batch_size
             
-            # 保存任務狀態
+            # 保存任務狀態（覆蓋同ID任務時捨棄舊的待寫入變更）
+            self._pending.pop((session_id, task_id), None)
             self._save_task_state(session_id, task_id, task_info)
             
             logger.info(f"創建任務: {session_id}/{task_id}")
@@ -91,7 +106,7 @@ class ProgressTracker:
                        error_count: int = None,
                        additional_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """
-        更新任務進度
+        更新任務進度（合併寫入，最多每 flush_interval 秒寫入一次）
         
         Args:
             session_id: 會話ID
@@ -106,36 +121,29 @@ class ProgressTracker:
             更新後的任務信息
         """
         try:
-            task_info = self.get_task_state(session_id, task_id)
-            if not task_info:
+            entry = self._get_pending(session_id, task_id)
+            if entry is None:
                 raise ValueError(f"任務不存在: {task_id}")
             
             # 更新進度
-            progress = task_info["progress"]
-            
-            if processed_items is not None:
-                progress["processed_items"] = processed_items
-            if current_batch is not None:
-                progress["current_batch"] = current_batch
-            if success_count is not None:
-                progress["success_count"] = success_count
-            if error_count is not None:
-                progress["error_count"] = error_count
-            
-            # 計算百分比
-            total_items = progress["total_items"]
-            if total_items > 0:
-                progress["percentage"] = (progress["processed_items"] / total_items) * 100
+            updates = {
+                "processed_items": processed_items,
+                "current_batch": current_batch,
+                "success_count": success_count,
+                "error_count": error_count
+            }
+            entry["progress"].update({key: value for key, value in updates.items() if value is not None})
             
             # 更新時間戳
-            task_info["updated_at"] = datetime.now().isoformat()
+            entry["updated_at"] = datetime.now().isoformat()
             
             # 添加額外數據
             if additional_data:
-                task_info["results"].update(additional_data)
+                entry["results"].update(additional_data)
             
-            # 保存更新
-            self._save_task_state(session_id, task_id, task_info)
+            task_info = self._merge_pending(entry["base"], entry)
+            progress = task_info["progress"]
+            self._maybe_flush(session_id, task_id)
             
             logger.debug(f"更新任務進度: {session_id}/{task_id} - {progress['percentage']:.1f}%")
             return task_info
@@ -157,25 +165,21 @@ class ProgressTracker:
             是否成功
         """
         try:
-            task_info = self.get_task_state(session_id, task_id)
-            if not task_info:
+            entry = self._get_pending(session_id, task_id)
+            if entry is None:
                 return False
             
             checkpoint = {
                 "timestamp": datetime.now().isoformat(),
-                "progress": task_info["progress"].copy(),
+                "progress": self._merge_pending(entry["base"], entry)["progress"],
                 "data": checkpoint_data
             }
             
-            task_info["checkpoints"].append(checkpoint)
-            task_info["updated_at"] = datetime.now().isoformat()
-            
-            # 限制檢查點數量
-            max_checkpoints = 10
-            if len(task_info["checkpoints"]) > max_checkpoints:
-                task_info["checkpoints"] = task_info["checkpoints"][-max_checkpoints:]
+            entry["checkpoints"].append(checkpoint)
+            entry["checkpoints"] = entry["checkpoints"][-MAX_CHECKPOINTS:]
+            entry["updated_at"] = checkpoint["timestamp"]
             
-            self._save_task_state(session_id, task_id, task_info)
+            self._maybe_flush(session_id, task_id)
             
             logger.debug(f"添加檢查點: {session_id}/{task_id}")
             return True
@@ -199,25 +203,31 @@ class ProgressTracker:
             是否成功
         """
         try:
-            task_info = self.get_task_state(session_id, task_id)
-            if not task_info:
+            # 狀態變更立即寫入，先合併待寫入的進度
+            self.flush(session_id, task_id)
+            old_statuses = []
+
+            def apply_status(task_info):
+                if not task_info:
+                    return None
+                old_statuses.append(task_info["status"])
+                task_info["status"] = status.value
+                task_info["updated_at"] = datetime.now().isoformat()
+                
+                if message:
+                    task_info["status_message"] = message
+                
+                # 如果任務完成，計算總耗時
+                if status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
+                    created_at = datetime.fromisoformat(task_info["created_at"])
+                    updated_at = datetime.fromisoformat(task_info["updated_at"])
+                    duration = (updated_at - created_at).total_seconds()
+                    task_info["duration_seconds"] = duration
+                return task_info
+
+            if not self.storage.update_temp_data(session_id, f"task_{task_id}", apply_status):
                 return False
-            
-            old_status = task_info["status"]
-            task_info["status"] = status.value
-            task_info["updated_at"] = datetime.now().isoformat()
-            
-            if message:
-                task_info["status_message"] = message
-            
-            # 如果任務完成，計算總耗時
-            if status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
-                created_at = datetime.fromisoformat(task_info["created_at"])
-                updated_at = datetime.fromisoformat(task_info["updated_at"])
-                duration = (updated_at - created_at).total_seconds()
-                task_info["duration_seconds"] = duration
-            
-            self._save_task_state(session_id, task_id, task_info)
+            old_status = old_statuses[0]
             
             logger.info(f"任務狀態變更: {session_id}/{task_id} {old_status} -> {status.value}")
             return True
@@ -227,28 +237,28 @@ class ProgressTracker:
             return False
     
     def get_task_state(self, session_id: str, task_id: str) -> Optional[Dict[str, Any]]:
-        """獲取任務狀態"""
+        """獲取任務狀態（包含尚未寫入的進度）"""
         try:
-            return self.storage.load_temp_data(session_id, f"task_{task_id}")
+            task_info = self.storage.load_temp_data(session_id, f"task_{task_id}")
+            entry = self._pending.get((session_id, task_id))
+            if task_info and entry:
+                return self._merge_pending(task_info, entry)
+            return task_info
         except Exception as e:
             logger.error(f"獲取任務狀態失敗 {session_id}/{task_id}: {e}")
             return None
     
-    def list_tasks(self, session_id: str) -> List[Dict[str, Any]]:
-        """列出會話的所有任務"""
+    def list_tasks(self, session_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出會話的所有任務（可依狀態篩選，已按創建時間排序）"""
         try:
-            temp_data_ids = self.storage.list_temp_data(session_id)
-            tasks = []
+            tasks = self.storage.list_task_states(session_id, status)
             
-            for data_id in temp_data_ids:
-                if data_id.startswith("task_"):
-                    task_data = self.storage.load_temp_data(session_id, data_id)
-                    if task_data:
-                        tasks.append(task_data)
-            
-            # 按創建時間排序
-            tasks.sort(key=lambda x: x.get("created_at", ""))
-            return tasks
+            # 合併尚未寫入的進度
+            return [
+                self._merge_pending(task, self._pending[(session_id, task["task_id"])])
+                if (session_id, task.get("task_id")) in self._pending else task
+                for task in tasks
+            ]
             
         except Exception as e:
             logger.error(f"列出任務失敗 {session_id}: {e}")
@@ -316,6 +326,76 @@ class ProgressTracker:
             logger.error(f"生成摘要報告失敗 {session_id}/{task_id}: {e}")
             return {"error": str(e)}
     
+    def flush(self, session_id: Optional[str] = None, task_id: Optional[str] = None) -> bool:
+        """
+        將待寫入的進度合併進任務狀態檔
+
+        合併時重新讀取磁碟上的狀態，只覆蓋進度、結果與檢查點，
+        不會蓋掉其他實例期間寫入的狀態變更。未指定任務時寫入全部。
+        """
+        keys = [key for key in list(self._pending)
+                if (session_id is None or key[0] == session_id)
+                and (task_id is None or key[1] == task_id)]
+
+        success = True
+        for key in keys:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                continue
+            try:
+                self.storage.update_temp_data(
+                    key[0], f"task_{key[1]}",
+                    lambda task_info: self._merge_pending(task_info, entry) if task_info else None
+                )
+                self._last_flush[key] = time.monotonic()
+            except Exception as e:
+                logger.error(f"寫入任務進度失敗 {key[0]}/{key[1]}: {e}")
+                success = False
+
+        return success
+
+    def _get_pending(self, session_id: str, task_id: str) -> Optional[Dict[str, Any]]:
+        """取得（或建立）任務的待寫入變更"""
+        key = (session_id, task_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            base = self.storage.load_temp_data(session_id, f"task_{task_id}")
+            if not base:
+                return None
+            entry = {
+                "base": base,
+                "progress": {},
+                "results": {},
+                "checkpoints": [],
+                "updated_at": base.get("updated_at")
+            }
+            self._pending[key] = entry
+        return entry
+
+    def _maybe_flush(self, session_id: str, task_id: str) -> None:
+        """距離上次寫入超過 flush_interval 時寫入"""
+        if time.monotonic() - self._last_flush.get((session_id, task_id), 0.0) >= self.flush_interval:
+            self.flush(session_id, task_id)
+
+    @staticmethod
+    def _merge_pending(task_info: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+        """將待寫入變更合併到任務狀態（返回新字典）"""
+        merged = dict(task_info)
+
+        progress = {**task_info["progress"], **entry["progress"]}
+        if progress.get("total_items", 0) > 0:
+            progress["percentage"] = (progress["processed_items"] / progress["total_items"]) * 100
+        merged["progress"] = progress
+
+        if entry["results"]:
+            merged["results"] = {**task_info.get("results", {}), **entry["results"]}
+        if entry["checkpoints"]:
+            merged["checkpoints"] = (task_info.get("checkpoints", []) + entry["checkpoints"])[-MAX_CHECKPOINTS:]
+        if entry["updated_at"]:
+            merged["updated_at"] = entry["updated_at"]
+
+        return merged
+
     def _save_task_state(self, session_id: str, task_id: str, task_info: Dict[str, Any]) -> bool:
         """保存任務狀態"""
         return self.storage.save_temp_data(session_id, f"task_{task_id}", task_info)
@@ -2,24 +2,40 @@
 Session Storage
 
 管理會話級別的存儲，包括暫存數據和文件摘要。
+
+所有 JSON 寫入都經由暫存檔原子替換，讀-改-寫流程以檔案鎖保護（跨執行緒、協程與進程）。
 """
 
 import os
 import json
+import time
+import asyncio
+import atexit
 import shutil
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Callable
 from datetime import datetime
 import logging
 
+from .file_lock import file_lock, atomic_write_json
+
 logger = logging.getLogger(__name__)
 
+# save_batch_result 寫入的批次行開頭（json.dumps 預設分隔符），掃描時可只解析行首的批次號
+_BATCH_LINE_PREFIX = b'{"batch_number": '
+
 
 class SessionStorage:
     """會話存儲管理器 - 支持重要資料表存儲和循環任務處理"""
 
-    def __init__(self, base_dir: str = "task_memory"):
+    def __init__(self, base_dir: str = "task_memory", access_flush_interval: float = 300.0):
         self.base_dir = Path(base_dir)
+
+        # 會話訪問時間先記在記憶體中，定期寫回 session_info.json（讀取本身不寫檔）
+        self.access_flush_interval = access_flush_interval
+        self._access_times: Dict[str, datetime] = {}
+        self._last_access_flush = time.monotonic()
+        atexit.register(self.flush_access_times)
         self.base_dir.mkdir(exist_ok=True)
 
         # 創建子目錄
@@ -28,6 +44,17 @@ class SessionStorage:
 
         self.sessions_dir.mkdir(exist_ok=True)
         self.global_cache_dir.mkdir(exist_ok=True)
+
+        # 鎖檔集中存放，取鎖不會在會話目錄下建立任何目錄
+        self.locks_dir = self.base_dir / ".locks"
+
+    def _lock(self, path: Path):
+        """取得存儲內檔案的鎖"""
+        return file_lock(path, self.locks_dir)
+
+    def _session_exists(self, session_id: str) -> bool:
+        """以 session_info.json 判斷會話是否已創建（目錄可能只是寫入時的副產物）"""
+        return (self.sessions_dir / session_id / "session_info.json").exists()
     
     def create_session(self, session_id: str) -> Dict[str, Any]:
         """
@@ -64,8 +91,9 @@ class SessionStorage:
             }
 
             # 保存會話信息
-            with open(session_dir / "session_info.json", 'w', encoding='utf-8') as f:
-                json.dump(session_info, f, ensure_ascii=False, indent=2)
+            info_file = session_dir / "session_info.json"
+            with self._lock(info_file):
+                atomic_write_json(info_file, session_info)
 
             logger.info(f"創建會話成功: {session_id} -> {session_dir}")
             return session_info
@@ -75,27 +103,68 @@ class SessionStorage:
             raise
     
     def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """獲取會話信息"""
+        """獲取會話信息（記錄訪問時間於記憶體，不改寫檔案）"""
         try:
-            session_dir = self.sessions_dir / session_id
-            info_file = session_dir / "session_info.json"
-            
-            if not info_file.exists():
+            session_info = self._read_session_info(session_id)
+            if session_info is None:
                 return None
             
-            with open(info_file, 'r', encoding='utf-8') as f:
-                session_info = json.load(f)
-            
             # 更新最後訪問時間
-            session_info["last_accessed"] = datetime.now().isoformat()
-            with open(info_file, 'w', encoding='utf-8') as f:
-                json.dump(session_info, f, ensure_ascii=False, indent=2)
+            now = datetime.now()
+            self._access_times[session_id] = now
+            session_info["last_accessed"] = now.isoformat()
+            
+            if time.monotonic() - self._last_access_flush >= self.access_flush_interval:
+                self.flush_access_times()
             
             return session_info
             
         except Exception as e:
             logger.error(f"獲取會話信息失敗 {session_id}: {e}")
             return None
+
+    def _read_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """純讀取會話信息，last_accessed 取檔案與記憶體中較新的值"""
+        info_file = self.sessions_dir / session_id / "session_info.json"
+        if not info_file.exists():
+            return None
+
+        with open(info_file, 'r', encoding='utf-8') as f:
+            session_info = json.load(f)
+
+        accessed = self._access_times.get(session_id)
+        if accessed and accessed.isoformat() > session_info.get("last_accessed", ""):
+            session_info["last_accessed"] = accessed.isoformat()
+        return session_info
+
+    def flush_access_times(self) -> int:
+        """
+        將記憶體中的訪問時間寫回 session_info.json
+
+        Returns:
+            寫回的會話數
+        """
+        pending, self._access_times = self._access_times, {}
+        self._last_access_flush = time.monotonic()
+
+        flushed = 0
+        for session_id, accessed in pending.items():
+            info_file = self.sessions_dir / session_id / "session_info.json"
+            try:
+                with self._lock(info_file):
+                    if not info_file.exists():
+                        continue
+                    with open(info_file, 'r', encoding='utf-8') as f:
+                        session_info = json.load(f)
+                    if accessed.isoformat() <= session_info.get("last_accessed", ""):
+                        continue
+                    session_info["last_accessed"] = accessed.isoformat()
+                    atomic_write_json(info_file, session_info)
+                    flushed += 1
+            except Exception as e:
+                logger.warning(f"寫回會話訪問時間失敗 {session_id}: {e}")
+
+        return flushed
     
     def save_temp_data(self, session_id: str, data_id: str, data: Dict[str, Any]) -> bool:
         """
@@ -111,8 +180,8 @@ class SessionStorage:
         """
         try:
             session_dir = self.sessions_dir / session_id
-            if not session_dir.exists():
-                logger.info(f"會話目錄不存在，創建新會話: {session_id}")
+            if not self._session_exists(session_id):
+                logger.info(f"會話不存在，創建新會話: {session_id}")
                 self.create_session(session_id)
 
             temp_dir = session_dir / "temp_data"
@@ -129,11 +198,8 @@ class SessionStorage:
                 "data": data
             }
 
-            # 確保父目錄存在
-            data_file.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(data_file, 'w', encoding='utf-8') as f:
-                json.dump(data_with_meta, f, ensure_ascii=False, indent=2)
+            with self._lock(data_file):
+                atomic_write_json(data_file, data_with_meta)
 
             logger.debug(f"保存暫存數據成功: {session_id}/{data_id} -> {data_file}")
             return True
@@ -143,6 +209,27 @@ class SessionStorage:
             logger.error(f"錯誤詳情: {type(e).__name__}: {str(e)}")
             return False
     
+    def update_temp_data(self, session_id: str, data_id: str,
+                         update_func: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+                         ) -> Optional[Dict[str, Any]]:
+        """
+        在檔案鎖內讀-改-寫暫存數據
+
+        Args:
+            session_id: 會話ID
+            data_id: 數據ID
+            update_func: 接收目前數據（不存在時為 None），返回新數據；返回 None 表示不寫入
+
+        Returns:
+            寫入後的數據，未寫入時返回 None
+        """
+        data_file = self.sessions_dir / session_id / "temp_data" / f"{data_id}.json"
+        with self._lock(data_file):
+            data = update_func(self.load_temp_data(session_id, data_id))
+            if data is None or not self.save_temp_data(session_id, data_id, data):
+                return None
+            return data
+
     def load_temp_data(self, session_id: str, data_id: str) -> Optional[Dict[str, Any]]:
         """加載暫存數據"""
         try:
@@ -162,6 +249,175 @@ class SessionStorage:
             logger.error(f"加載暫存數據失敗 {session_id}/{data_id}: {e}")
             return None
     
+    # ==================== 追加式結果日誌（JSON Lines） ====================
+
+    def _result_log_file(self, session_id: str, log_id: str) -> Path:
+        return self.sessions_dir / session_id / "temp_data" / f"{log_id}.jsonl"
+
+    def append_result_log(self, session_id: str, log_id: str, records: List[Dict[str, Any]]) -> bool:
+        """
+        追加結果記錄（每筆一行 JSON），寫入量只與本次記錄數相關
+
+        Args:
+            session_id: 會話ID
+            log_id: 日誌ID
+            records: 要追加的記錄
+
+        Returns:
+            是否成功
+        """
+        try:
+            if not self._session_exists(session_id):
+                self.create_session(session_id)
+
+            log_file = self._result_log_file(session_id, log_id)
+            lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+            with self._lock(log_file):
+                self._truncate_partial_tail(log_file)
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            return True
+
+        except Exception as e:
+            logger.error(f"追加結果日誌失敗 {session_id}/{log_id}: {e}")
+            return False
+
+    @staticmethod
+    def _truncate_partial_tail(log_file: Path) -> None:
+        """截掉寫入中斷留下的不完整末行，避免下一筆記錄接在其後而一起損壞"""
+        if not log_file.exists():
+            return
+
+        with open(log_file, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+
+            # 由尾端往前找最後一個換行
+            position = size
+            while position > 0:
+                chunk_start = max(0, position - 65536)
+                f.seek(chunk_start)
+                chunk = f.read(position - chunk_start)
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    f.truncate(chunk_start + newline + 1)
+                    break
+                position = chunk_start
+            else:
+                f.truncate(0)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.warning(f"已截除結果日誌的不完整末行: {log_file}")
+
+    def iter_result_log(self, session_id: str, log_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        串流讀取結果記錄（不一次載入整個日誌）
+
+        寫入中斷造成的不完整末行會被略過。
+        """
+        log_file = self._result_log_file(session_id, log_id)
+        if not log_file.exists():
+            return
+
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"略過損壞的結果記錄 {session_id}/{log_id}: 第 {line_number} 行")
+
+    def load_result_log(self, session_id: str, log_id: str, offset: int = 0,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """分頁讀取結果記錄"""
+        from itertools import islice
+        stop = offset + limit if limit is not None else None
+        return list(islice(self.iter_result_log(session_id, log_id), offset, stop))
+
+    def compact_result_log(self, session_id: str, log_id: str, key_field: Optional[str] = None) -> int:
+        """
+        壓縮結果日誌：移除損壞行，指定 key_field 時同一鍵只保留最後一筆（重試/恢復產生的重複記錄）
+
+        串流進行兩次讀取：第一次只記下每個鍵最後一筆的位置，第二次在鍵首次出現的位置寫入最後一筆，
+        記憶體用量只與不同鍵的數量相關，不需載入記錄內容。以暫存檔寫入後原子替換，壓縮中斷不影響原日誌。
+
+        Returns:
+            壓縮後的記錄數，失敗時返回 -1
+        """
+        try:
+            log_file = self._result_log_file(session_id, log_id)
+            if not log_file.exists():
+                return 0
+
+            with self._lock(log_file):
+                last_offsets: Dict[Any, int] = {}
+                if key_field:
+                    for offset, record, _ in self._iter_log_lines(log_file):
+                        if key_field in record:
+                            last_offsets[record[key_field]] = offset
+
+                count = 0
+                temp_file = log_file.with_suffix('.jsonl.tmp')
+                with open(log_file, 'rb') as reader, open(temp_file, 'wb') as f:
+                    for offset, record, line in self._iter_log_lines(log_file):
+                        if key_field and key_field in record:
+                            last_offset = last_offsets.pop(record[key_field], None)
+                            if last_offset is None:
+                                continue   # 已在首次出現的位置寫入
+                            if last_offset != offset:
+                                reader.seek(last_offset)
+                                line = reader.readline()
+                        f.write(line if line.endswith(b'\n') else line + b'\n')
+                        count += 1
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, log_file)
+
+            logger.debug(f"壓縮結果日誌: {session_id}/{log_id} -> {count} 筆")
+            return count
+
+        except Exception as e:
+            logger.error(f"壓縮結果日誌失敗 {session_id}/{log_id}: {e}")
+            return -1
+
+    @staticmethod
+    def _iter_log_lines(log_file: Path) -> Iterator[tuple]:
+        """逐行產生 (位置, 記錄, 原始行)，略過空行與損壞行"""
+        with open(log_file, 'rb') as f:
+            offset = 0
+            for line in f:
+                position = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                yield position, record, line
+
+    def delete_result_log(self, session_id: str, log_id: str) -> bool:
+        """刪除結果日誌（重新開始任務時使用）"""
+        try:
+            log_file = self._result_log_file(session_id, log_id)
+            with self._lock(log_file):
+                if log_file.exists():
+                    log_file.unlink()
+            return True
+
+        except Exception as e:
+            logger.error(f"刪除結果日誌失敗 {session_id}/{log_id}: {e}")
+            return False
+
     def list_temp_data(self, session_id: str) -> List[str]:
         """列出會話的所有暫存數據ID"""
         try:
@@ -181,30 +437,83 @@ class SessionStorage:
             logger.error(f"列出暫存數據失敗 {session_id}: {e}")
             return []
     
-    def save_file_summary(self, session_id: str, file_path: str, summary: Dict[str, Any]) -> bool:
-        """保存文件摘要"""
+    def list_task_states(self, session_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出會話的任務狀態（task_* 暫存數據），可依狀態篩選"""
+        tasks = []
+        for data_id in self.list_temp_data(session_id):
+            if not data_id.startswith("task_"):
+                continue
+            task_data = self.load_temp_data(session_id, data_id)
+            if task_data and (status is None or task_data.get("status") == status):
+                tasks.append(task_data)
+
+        tasks.sort(key=lambda x: x.get("created_at", ""))
+        return tasks
+
+    @staticmethod
+    def file_fingerprint(file_path: str) -> Optional[Dict[str, int]]:
+        """文件指紋（大小與修改時間），文件不存在時返回 None"""
         try:
-            session_dir = self.sessions_dir / session_id
-            if not session_dir.exists():
-                self.create_session(session_id)
-            
-            summaries_dir = session_dir / "file_summaries"
-            
-            # 使用文件路徑的哈希作為文件名
-            import hashlib
-            file_hash = hashlib.md5(file_path.encode()).hexdigest()
-            summary_file = summaries_dir / f"{file_hash}.json"
-            
-            summary_with_meta = {
-                "file_path": file_path,
-                "session_id": session_id,
-                "saved_at": datetime.now().isoformat(),
-                "summary": summary
-            }
-            
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                json.dump(summary_with_meta, f, ensure_ascii=False, indent=2)
-            
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @staticmethod
+    def _summary_key(file_path: str, summary_type: str = "") -> str:
+        """摘要的存儲鍵：文件路徑（及摘要類型）的哈希"""
+        import hashlib
+        key = f"{file_path}|{summary_type}" if summary_type else file_path
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def _write_file_summary(self, session_id: str, file_path: str, summary: Dict[str, Any],
+                            fingerprint: Optional[Dict[str, int]], summary_type: str) -> None:
+        session_dir = self.sessions_dir / session_id
+        if not self._session_exists(session_id):
+            self.create_session(session_id)
+
+        summary_file = session_dir / "file_summaries" / f"{self._summary_key(file_path, summary_type)}.json"
+        summary_with_meta = {
+            "file_path": file_path,
+            "session_id": session_id,
+            "saved_at": datetime.now().isoformat(),
+            "summary_type": summary_type,
+            "file_fingerprint": fingerprint,
+            "summary": summary
+        }
+
+        # 大文件的摘要可能有數萬個段落，使用緊湊格式（C 編碼器）寫入
+        with self._lock(summary_file):
+            atomic_write_json(summary_file, summary_with_meta, indent=None)
+
+    def _read_file_summary(self, session_id: str, file_path: str,
+                           summary_type: str) -> Optional[Dict[str, Any]]:
+        summary_file = (self.sessions_dir / session_id / "file_summaries"
+                        / f"{self._summary_key(file_path, summary_type)}.json")
+        if not summary_file.exists():
+            return None
+
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_file_summary(self, session_id: str, file_path: str, summary: Dict[str, Any],
+                          fingerprint: Optional[Dict[str, int]] = None,
+                          summary_type: str = "") -> bool:
+        """
+        保存文件摘要
+
+        Args:
+            session_id: 會話ID
+            file_path: 文件路徑
+            summary: 摘要
+            fingerprint: 生成摘要時的文件指紋；未提供時取目前的文件狀態
+            summary_type: 摘要類型（同一文件可保存不同類型的摘要）
+        """
+        try:
+            if fingerprint is None:
+                fingerprint = self.file_fingerprint(file_path)
+            self._write_file_summary(session_id, file_path, summary, fingerprint, summary_type)
+
             logger.debug(f"保存文件摘要: {session_id}/{file_path}")
             return True
             
@@ -212,32 +521,59 @@ class SessionStorage:
             logger.error(f"保存文件摘要失敗 {session_id}/{file_path}: {e}")
             return False
     
-    def load_file_summary(self, session_id: str, file_path: str) -> Optional[Dict[str, Any]]:
-        """加載文件摘要"""
+    def load_file_summary(self, session_id: str, file_path: str, validate: bool = True,
+                          summary_type: str = "") -> Optional[Dict[str, Any]]:
+        """
+        加載文件摘要
+
+        validate 為 True 時，文件大小或修改時間與保存時不同（文件已被編輯）即視為過期，返回 None。
+        """
         try:
-            session_dir = self.sessions_dir / session_id
-            summaries_dir = session_dir / "file_summaries"
-            
-            import hashlib
-            file_hash = hashlib.md5(file_path.encode()).hexdigest()
-            summary_file = summaries_dir / f"{file_hash}.json"
-            
-            if not summary_file.exists():
+            summary_with_meta = self._read_file_summary(session_id, file_path, summary_type)
+            if summary_with_meta is None:
+                return None
+
+            if validate and summary_with_meta.get("file_fingerprint") != self.file_fingerprint(file_path):
+                logger.debug(f"文件已變更，摘要過期: {session_id}/{file_path}")
                 return None
-            
-            with open(summary_file, 'r', encoding='utf-8') as f:
-                summary_with_meta = json.load(f)
             
             return summary_with_meta.get("summary")
             
         except Exception as e:
             logger.error(f"加載文件摘要失敗 {session_id}/{file_path}: {e}")
             return None
+
+    async def get_or_create_file_summary(self, session_id: str, file_path: str,
+                                         generate: Callable[[str], Any],
+                                         summary_type: str = "") -> Dict[str, Any]:
+        """
+        取得有效的快取摘要，文件變更或無快取時才重新生成並保存
+
+        Args:
+            session_id: 會話ID
+            file_path: 文件路徑
+            generate: 生成摘要的函數（可為協程函數），參數為文件路徑
+            summary_type: 摘要類型
+        """
+        fingerprint = self.file_fingerprint(file_path)
+        cached = self.load_file_summary(session_id, file_path, summary_type=summary_type)
+        if cached is not None:
+            return cached
+
+        summary = generate(file_path)
+        if asyncio.iscoroutine(summary):
+            summary = await summary
+
+        # 生成期間文件又被修改時不保存，避免把舊內容的摘要標記為最新
+        if fingerprint is not None and fingerprint == self.file_fingerprint(file_path):
+            self.save_file_summary(session_id, file_path, summary, fingerprint, summary_type)
+        return summary
     
     def cleanup_session(self, session_id: str) -> bool:
         """清理會話數據"""
         try:
             session_dir = self.sessions_dir / session_id
+            self._access_times.pop(session_id, None)
             if session_dir.exists():
                 shutil.rmtree(session_dir)
                 logger.info(f"清理會話: {session_id}")
@@ -249,12 +585,16 @@ class SessionStorage:
             return False
     
     def list_sessions(self) -> List[Dict[str, Any]]:
-        """列出所有會話"""
+        """列出所有會話（唯讀掃描，不視為訪問）"""
         try:
             sessions = []
             for session_dir in self.sessions_dir.iterdir():
                 if session_dir.is_dir():
-                    session_info = self.get_session_info(session_dir.name)
+                    try:
+                        session_info = self._read_session_info(session_dir.name)
+                    except Exception as e:
+                        logger.warning(f"讀取會話信息失敗 {session_dir.name}: {e}")
+                        continue
                     if session_info:
                         sessions.append(session_info)
             
@@ -273,7 +613,11 @@ class SessionStorage:
             cleaned_count = 0
             for session_dir in self.sessions_dir.iterdir():
                 if session_dir.is_dir():
-                    session_info = self.get_session_info(session_dir.name)
+                    try:
+                        session_info = self._read_session_info(session_dir.name)
+                    except Exception as e:
+                        logger.warning(f"讀取會話信息失敗 {session_dir.name}: {e}")
+                        continue
                     if session_info:
                         last_accessed = datetime.fromisoformat(session_info["last_accessed"])
                         if last_accessed < cutoff_date:
@@ -321,8 +665,8 @@ class SessionStorage:
             }
 
             table_file = session_data_dir / f"{table_id}.json"
-            with open(table_file, 'w', encoding='utf-8') as f:
-                json.dump(table_info, f, ensure_ascii=False, indent=2)
+            with self._lock(table_file):
+                atomic_write_json(table_file, table_info)
 
             logger.info(f"重要資料表已保存: {session_id}/{table_id}")
             return True
@@ -399,6 +743,128 @@ class SessionStorage:
             return []
 
     # ==================== 循環任務批次處理功能 ====================
+    # 任務元數據（進度、狀態）存於 {task_id}.json，維持固定大小；
+    # 每批結果追加至 {task_id}.batches.jsonl，保存與讀取都不需載入全部批次。
+    # 同一批次可能重複保存（重試），元數據只記錄累計值與最大批次號：
+    # 保存的批次號不大於已保存的最大批次號時標記 needs_recount，讀取進度時再從批次檔重新統計。
+
+    def _batch_files(self, session_id: str, task_id: str):
+        batch_dir = self.sessions_dir / session_id / "batch_processing"
+        return batch_dir / f"{task_id}.json", batch_dir / f"{task_id}.batches.jsonl"
+
+    @staticmethod
+    def _new_batch_info(session_id: str, task_id: str, total_items: int, batch_size: int) -> Dict[str, Any]:
+        """新批次任務的元數據"""
+        now = datetime.now().isoformat()
+        return {
+            "task_id": task_id,
+            "session_id": session_id,
+            "total_items": total_items,
+            "batch_size": batch_size,
+            "processed_items": 0,
+            "current_batch": 0,
+            "total_batches": (total_items + batch_size - 1) // batch_size,
+            "completed_batches": 0,
+            "last_saved_batch": None,   # 已保存的最大批次號
+            "needs_recount": False,     # 可能有重複保存的批次，計數需從批次檔重新統計
+            "status": "started",
+            "created_at": now,
+            "updated_at": now,
+            "final_result": None
+        }
+
+    @staticmethod
+    def _apply_batch_progress(batch_info: Dict[str, Any], batch_number: int, item_count: int) -> None:
+        """
+        以固定成本更新批次進度
+
+        批次號大於已保存的最大批次號時必定是新批次，直接累加；
+        否則可能是重複保存，只標記 needs_recount，由讀取端重新統計。
+        """
+        last_saved = batch_info.get("last_saved_batch")
+        if last_saved is None and batch_info.get("completed_batches"):
+            # 未記錄最大批次號的舊元數據
+            last_saved = batch_info["current_batch"]
+
+        if last_saved is None or batch_number > last_saved:
+            batch_info["processed_items"] += item_count
+            batch_info["completed_batches"] = batch_info.get("completed_batches", 0) + 1
+            batch_info["last_saved_batch"] = batch_number
+        else:
+            batch_info["needs_recount"] = True
+
+        batch_info["current_batch"] = max(batch_info["current_batch"], batch_number)
+        batch_info["updated_at"] = datetime.now().isoformat()
+
+        # 檢查是否完成
+        if batch_info["current_batch"] >= batch_info["total_batches"] - 1:
+            batch_info["status"] = "completed"
+
+    def _load_batch_meta(self, session_id: str, task_id: str, recount: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        讀取批次任務元數據
+
+        舊格式（批次結果內嵌於元數據）會先轉換為追加式檔案；
+        recount 為 True 且有重複保存的批次時，從批次檔重新統計進度並寫回。
+        """
+        meta_file, batches_file = self._batch_files(session_id, task_id)
+        if not meta_file.exists():
+            return None
+
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            batch_info = json.load(f)
+
+        if "batches" not in batch_info and not (recount and batch_info.get("needs_recount")):
+            return batch_info
+
+        with self._lock(meta_file):
+            # 取得鎖後重新讀取，避免與其他轉換重複
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                batch_info = json.load(f)
+            changed = False
+
+            if "batches" in batch_info:
+                legacy_batches = batch_info.pop("batches")
+                with self._lock(batches_file):
+                    with open(batches_file, 'a', encoding='utf-8') as f:
+                        for batch_num in sorted(legacy_batches, key=int):
+                            f.write(json.dumps(legacy_batches[batch_num], ensure_ascii=False) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+                batch_info["completed_batches"] = len(legacy_batches)
+                batch_info["last_saved_batch"] = max((int(n) for n in legacy_batches), default=None)
+                changed = True
+
+            if recount and batch_info.get("needs_recount"):
+                item_counts = self._scan_batch_item_counts(batches_file)
+                batch_info["processed_items"] = sum(item_counts.values())
+                batch_info["completed_batches"] = len(item_counts)
+                batch_info["last_saved_batch"] = max(item_counts, default=None)
+                batch_info["needs_recount"] = False
+                changed = True
+
+            if changed:
+                atomic_write_json(meta_file, batch_info)
+
+        return batch_info
+
+    def _scan_batch_item_counts(self, batches_file: Path) -> Dict[int, int]:
+        """串流掃描批次檔，取得每個批次號最後一次保存的項目數"""
+        item_counts: Dict[int, int] = {}
+        if not batches_file.exists():
+            return item_counts
+
+        with self._lock(batches_file):
+            with open(batches_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    item_counts[int(entry["batch_number"])] = entry.get("item_count", 0)
+        return item_counts
 
     def start_batch_processing(self, session_id: str, task_id: str, total_items: int,
                               batch_size: int = 10) -> bool:
@@ -416,30 +882,20 @@ class SessionStorage:
         """
         try:
             session_dir = self.sessions_dir / session_id
-            if not session_dir.exists():
+            if not self._session_exists(session_id):
                 self.create_session(session_id)
 
             session_batch_dir = session_dir / "batch_processing"
-            session_batch_dir.mkdir(exist_ok=True)
+            session_batch_dir.mkdir(parents=True, exist_ok=True)
 
-            batch_info = {
-                "task_id": task_id,
-                "session_id": session_id,
-                "total_items": total_items,
-                "batch_size": batch_size,
-                "processed_items": 0,
-                "current_batch": 0,
-                "total_batches": (total_items + batch_size - 1) // batch_size,
-                "status": "started",
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "batches": {},  # 存儲每批的處理結果
-                "final_result": None
-            }
+            batch_info = self._new_batch_info(session_id, task_id, total_items, batch_size)
 
-            batch_file = session_batch_dir / f"{task_id}.json"
-            with open(batch_file, 'w', encoding='utf-8') as f:
-                json.dump(batch_info, f, ensure_ascii=False, indent=2)
+            meta_file, batches_file = self._batch_files(session_id, task_id)
+            with self._lock(meta_file):
+                with self._lock(batches_file):
+                    if batches_file.exists():
+                        batches_file.unlink()
+                atomic_write_json(meta_file, batch_info)
 
             logger.info(f"批次處理任務已創建: {session_id}/{task_id}")
             return True
@@ -451,7 +907,9 @@ class SessionStorage:
     def save_batch_result(self, session_id: str, task_id: str, batch_number: int,
                          batch_data: Dict[str, Any]) -> bool:
         """
-        保存批次處理結果
+        保存批次處理結果（追加一行並更新固定大小的元數據，耗時與已保存批次數無關）
+
+        同一批次重複保存（例如重試）時以最後一次為準，讀取進度時計數會替換而不是累加。
 
         Args:
             session_id: 會話ID
@@ -463,35 +921,32 @@ class SessionStorage:
             是否保存成功
         """
         try:
-            session_dir = self.sessions_dir / session_id
-            batch_file = session_dir / "batch_processing" / f"{task_id}.json"
+            meta_file, batches_file = self._batch_files(session_id, task_id)
 
-            if not batch_file.exists():
+            if not meta_file.exists():
                 logger.error(f"批次處理任務不存在: {session_id}/{task_id}")
                 return False
 
-            with open(batch_file, 'r', encoding='utf-8') as f:
-                batch_info = json.load(f)
-
-            # 更新批次結果
-            batch_info["batches"][str(batch_number)] = {
-                "batch_number": batch_number,
-                "data": batch_data,
-                "processed_at": datetime.now().isoformat(),
-                "item_count": len(batch_data) if isinstance(batch_data, (list, dict)) else 1
-            }
+            with self._lock(meta_file):
+                batch_info = self._load_batch_meta(session_id, task_id, recount=False)
 
-            # 更新進度
-            batch_info["current_batch"] = max(batch_info["current_batch"], batch_number)
-            batch_info["processed_items"] += batch_info["batches"][str(batch_number)]["item_count"]
-            batch_info["updated_at"] = datetime.now().isoformat()
-
-            # 檢查是否完成
-            if batch_info["current_batch"] >= batch_info["total_batches"] - 1:
-                batch_info["status"] = "completed"
+                # 追加批次結果（batch_number 放在第一個鍵，讀取時可不解析整行）
+                batch_entry = {
+                    "batch_number": batch_number,
+                    "data": batch_data,
+                    "processed_at": datetime.now().isoformat(),
+                    "item_count": len(batch_data) if isinstance(batch_data, (list, dict)) else 1
+                }
+                with self._lock(batches_file):
+                    self._truncate_partial_tail(batches_file)
+                    with open(batches_file, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(batch_entry, ensure_ascii=False) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
 
-            with open(batch_file, 'w', encoding='utf-8') as f:
-                json.dump(batch_info, f, ensure_ascii=False, indent=2)
+                # 更新進度
+                self._apply_batch_progress(batch_info, batch_number, batch_entry["item_count"])
+                atomic_write_json(meta_file, batch_info)
 
             logger.info(f"批次結果已保存: {session_id}/{task_id}/batch_{batch_number}")
             return True
@@ -512,15 +967,10 @@ class SessionStorage:
             批次處理狀態信息
         """
         try:
-            session_dir = self.sessions_dir / session_id
-            batch_file = session_dir / "batch_processing" / f"{task_id}.json"
-
-            if not batch_file.exists():
+            batch_info = self._load_batch_meta(session_id, task_id)
+            if batch_info is None:
                 return None
 
-            with open(batch_file, 'r', encoding='utf-8') as f:
-                batch_info = json.load(f)
-
             # 計算進度
             progress_percentage = (batch_info["processed_items"] / batch_info["total_items"]) * 100
 
@@ -536,7 +986,7 @@ class SessionStorage:
                 },
                 "created_at": batch_info["created_at"],
                 "updated_at": batch_info["updated_at"],
-                "completed_batches": len(batch_info["batches"])
+                "completed_batches": batch_info.get("completed_batches", 0)
             }
 
             return status
@@ -545,10 +995,76 @@ class SessionStorage:
             logger.error(f"獲取批次處理狀態失敗 {session_id}/{task_id}: {e}")
             return None
 
+    def iter_batch_results(self, session_id: str, task_id: str,
+                           start_batch: Optional[int] = None,
+                           end_batch: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        依批次號順序串流讀取批次結果（可指定範圍，含首尾）
+
+        先掃描一次只取得每個批次號最後一次寫入的位置，再逐筆讀取，
+        記憶體用量只與批次數相關，不需載入批次內容。同一批次重複保存時以最後一筆為準。
+        """
+        self._load_batch_meta(session_id, task_id)
+        _, batches_file = self._batch_files(session_id, task_id)
+        if not batches_file.exists():
+            return
+
+        offsets: Dict[int, int] = {}
+        with open(batches_file, 'rb') as f:
+            position = 0
+            for line in f:
+                if line.endswith(b'\n'):
+                    batch_number = self._line_batch_number(line)
+                    if batch_number is not None \
+                            and (start_batch is None or batch_number >= start_batch) \
+                            and (end_batch is None or batch_number <= end_batch):
+                        offsets[batch_number] = position
+                position += len(line)
+
+            for batch_number in sorted(offsets):
+                f.seek(offsets[batch_number])
+                try:
+                    yield json.loads(f.readline().decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning(f"略過損壞的批次結果 {session_id}/{task_id}: batch_{batch_number}")
+
+    @staticmethod
+    def _line_batch_number(line: bytes) -> Optional[int]:
+        """
+        取得批次檔一行的批次號
+
+        save_batch_result 寫入的行以 batch_number 開頭，只解析行首；
+        其他格式的行（鍵順序或分隔符不同）解析整行，損壞的行返回 None。
+        """
+        if line.startswith(_BATCH_LINE_PREFIX):
+            number_end = line.find(b',', len(_BATCH_LINE_PREFIX))
+            try:
+                return int(line[len(_BATCH_LINE_PREFIX):number_end])
+            except ValueError:
+                pass
+        try:
+            entry = json.loads(line)
+            return int(entry["batch_number"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def iter_batch_items(self, session_id: str, task_id: str,
+                         start_batch: Optional[int] = None,
+                         end_batch: Optional[int] = None) -> Iterator[Any]:
+        """依批次順序串流讀取結果項目（列表型批次結果展開為單筆）"""
+        for batch_entry in self.iter_batch_results(session_id, task_id, start_batch, end_batch):
+            batch_data = batch_entry["data"]
+            if isinstance(batch_data, list):
+                yield from batch_data
+            else:
+                yield batch_data
+
     def get_complete_batch_result(self, session_id: str, task_id: str) -> Optional[Dict[str, Any]]:
         """
         獲取完整的批次處理結果（僅當任務完成時）
 
+        結果會全部載入記憶體；大型任務請改用 iter_batch_items 串流讀取。
+
         Args:
             session_id: 會話ID
             task_id: 任務ID
@@ -557,15 +1073,10 @@ class SessionStorage:
             完整的處理結果
         """
         try:
-            session_dir = self.sessions_dir / session_id
-            batch_file = session_dir / "batch_processing" / f"{task_id}.json"
-
-            if not batch_file.exists():
+            batch_info = self._load_batch_meta(session_id, task_id)
+            if batch_info is None:
                 return None
 
-            with open(batch_file, 'r', encoding='utf-8') as f:
-                batch_info = json.load(f)
-
             if batch_info["status"] != "completed":
                 return {
                     "success": False,
@@ -573,13 +1084,7 @@ class SessionStorage:
                 }
 
             # 合併所有批次結果
-            all_results = []
-            for batch_num in sorted(batch_info["batches"].keys(), key=int):
-                batch_data = batch_info["batches"][batch_num]["data"]
-                if isinstance(batch_data, list):
-                    all_results.extend(batch_data)
-                else:
-                    all_results.append(batch_data)
+            all_results = list(self.iter_batch_items(session_id, task_id))
 
             return {
                 "success": True,
@@ -595,5 +1100,23 @@ class SessionStorage:
             return None
 
 
+def create_session_storage(base_dir: str = "task_memory", backend: Optional[str] = None) -> SessionStorage:
+    """
+    依設定建立存儲後端
+
+    Args:
+        base_dir: 存儲根目錄
+        backend: "json"（預設，每筆數據一個 JSON 檔）或 "sqlite"（單一 SQLite 資料庫，WAL 模式）；
+                 未指定時讀取環境變數 TASK_MEMORY_BACKEND
+    """
+    backend = (backend or os.getenv("TASK_MEMORY_BACKEND", "json")).lower()
+    if backend == "sqlite":
+        from .sqlite_storage import SqliteSessionStorage
+        return SqliteSessionStorage(base_dir)
+    if backend != "json":
+        logger.warning(f"未知的存儲後端 {backend}，使用 JSON 檔案存儲")
+    return SessionStorage(base_dir)
+
+
 # 全局存儲實例
-session_storage = SessionStorage()
+session_storage = create_session_storage()
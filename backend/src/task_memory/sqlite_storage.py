@@ -0,0 +1,802 @@
+"""
+SQLite Session Storage
+
+以單一 SQLite 資料庫（WAL 模式）實作 SessionStorage 介面。
+
+會話、暫存數據（包括任務狀態）、結果日誌、批次處理與文件摘要存放在資料表中，
+依會話、任務與狀態建立索引；讀-改-寫在 BEGIN IMMEDIATE 交易內完成，跨進程安全。
+重要資料表的檔案仍沿用 JSON 檔案存儲。
+
+使用方式：
+    TASK_MEMORY_BACKEND=sqlite                      # 由 create_session_storage() 選用
+    python -m task_memory.sqlite_storage migrate    # 將既有 JSON 佈局匯入資料庫
+    python -m task_memory.sqlite_storage benchmark  # 比較兩種後端
+"""
+
+import json
+import time
+import sqlite3
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator, Callable
+from datetime import datetime, timedelta
+import logging
+
+from .session_storage import SessionStorage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_accessed TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active'
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed ON sessions(last_accessed);
+
+CREATE TABLE IF NOT EXISTS temp_data (
+    session_id TEXT NOT NULL,
+    data_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, data_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tasks (
+    session_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (session_id, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tasks_session_status ON tasks(session_id, status);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+
+CREATE TABLE IF NOT EXISTS result_logs (
+    session_id TEXT NOT NULL,
+    log_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (session_id, log_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS batch_tasks (
+    session_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    PRIMARY KEY (session_id, task_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS batch_results (
+    session_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    batch_number INTEGER NOT NULL,
+    item_count INTEGER NOT NULL,
+    processed_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, task_id, batch_number)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS file_summaries (
+    session_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    file_fingerprint TEXT,
+    PRIMARY KEY (session_id, file_path)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteSessionStorage(SessionStorage):
+    """SQLite 會話存儲（與 SessionStorage 相同介面）"""
+
+    def __init__(self, base_dir: str = "task_memory", db_path: Optional[str] = None,
+                 access_flush_interval: float = 300.0):
+        super().__init__(base_dir, access_flush_interval)
+        self.db_path = Path(db_path) if db_path else self.base_dir / "task_memory.db"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 每個執行緒各自的連線
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self._migrate_schema()
+
+    def _migrate_schema(self) -> None:
+        """補上舊版資料庫缺少的欄位"""
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(file_summaries)")}
+        if "file_fingerprint" not in columns:
+            conn.execute("ALTER TABLE file_summaries ADD COLUMN file_fingerprint TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """寫入交易（BEGIN IMMEDIATE 先取得寫鎖，避免讀-改-寫競爭）"""
+        conn = self._conn()
+        if conn.in_transaction:
+            # 巢狀呼叫併入外層交易
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        """關閉目前執行緒的連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ==================== 會話 ====================
+
+    def _ensure_session(self, conn: sqlite3.Connection, session_id: str) -> None:
+        now = datetime.now().isoformat()
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, created_at, last_accessed) VALUES (?, ?, ?)",
+            (session_id, now, now)
+        )
+
+    def _session_exists(self, session_id: str) -> bool:
+        """以 sessions 資料表判斷會話是否已創建"""
+        return self._conn().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone() is not None
+
+    def create_session(self, session_id: str) -> Dict[str, Any]:
+        """創建新會話（會話已存在時保留原有的創建與訪問時間）"""
+        try:
+            with self._transaction() as conn:
+                self._ensure_session(conn, session_id)
+                row = conn.execute(
+                    "SELECT session_id, created_at, last_accessed, status FROM sessions WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+
+            logger.info(f"創建會話成功: {session_id} -> {self.db_path}")
+            return self._session_row_to_info(row)
+
+        except Exception as e:
+            logger.error(f"創建會話失敗 {session_id}: {e}")
+            raise
+
+    @staticmethod
+    def _session_row_to_info(row) -> Dict[str, Any]:
+        return {
+            "session_id": row[0],
+            "created_at": row[1],
+            "last_accessed": row[2],
+            "status": row[3]
+        }
+
+    def _read_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT session_id, created_at, last_accessed, status FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        session_info = self._session_row_to_info(row)
+        accessed = self._access_times.get(session_id)
+        if accessed and accessed.isoformat() > session_info["last_accessed"]:
+            session_info["last_accessed"] = accessed.isoformat()
+        return session_info
+
+    def flush_access_times(self) -> int:
+        """將記憶體中的訪問時間寫回資料庫"""
+        pending, self._access_times = self._access_times, {}
+        self._last_access_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            with self._transaction() as conn:
+                cursor = conn.executemany(
+                    "UPDATE sessions SET last_accessed = ? WHERE session_id = ? AND last_accessed < ?",
+                    [(accessed.isoformat(), session_id, accessed.isoformat())
+                     for session_id, accessed in pending.items()]
+                )
+                return cursor.rowcount
+
+        except Exception as e:
+            logger.warning(f"寫回會話訪問時間失敗: {e}")
+            return 0
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """列出所有會話"""
+        try:
+            rows = self._conn().execute(
+                "SELECT session_id, created_at, last_accessed, status FROM sessions"
+            ).fetchall()
+            sessions = []
+            for row in rows:
+                session_info = self._session_row_to_info(row)
+                accessed = self._access_times.get(row[0])
+                if accessed and accessed.isoformat() > session_info["last_accessed"]:
+                    session_info["last_accessed"] = accessed.isoformat()
+                sessions.append(session_info)
+            return sessions
+
+        except Exception as e:
+            logger.error(f"列出會話失敗: {e}")
+            return []
+
+    def cleanup_session(self, session_id: str) -> bool:
+        """清理會話數據"""
+        try:
+            self._access_times.pop(session_id, None)
+            with self._transaction() as conn:
+                deleted = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+                for table in ("temp_data", "tasks", "result_logs", "batch_tasks", "batch_results",
+                              "file_summaries"):
+                    conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+            # 批次處理等仍使用檔案的數據
+            session_dir = self.sessions_dir / session_id
+            if session_dir.exists():
+                shutil.rmtree(session_dir)
+
+            if deleted:
+                logger.info(f"清理會話: {session_id}")
+            return bool(deleted)
+
+        except Exception as e:
+            logger.error(f"清理會話失敗 {session_id}: {e}")
+            return False
+
+    def cleanup_old_sessions(self, days: int = 7) -> int:
+        """清理舊會話（以 last_accessed 索引查詢）"""
+        try:
+            self.flush_access_times()
+            cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+            session_ids = [row[0] for row in self._conn().execute(
+                "SELECT session_id FROM sessions WHERE last_accessed < ?", (cutoff,)
+            )]
+
+            cleaned_count = sum(1 for session_id in session_ids if self.cleanup_session(session_id))
+            logger.info(f"清理了 {cleaned_count} 個舊會話")
+            return cleaned_count
+
+        except Exception as e:
+            logger.error(f"清理舊會話失敗: {e}")
+            return 0
+
+    # ==================== 暫存數據與任務狀態 ====================
+
+    def _write_temp_data(self, conn: sqlite3.Connection, session_id: str, data_id: str,
+                         data: Dict[str, Any], created_at: Optional[str] = None) -> None:
+        self._ensure_session(conn, session_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO temp_data (session_id, data_id, created_at, data) VALUES (?, ?, ?, ?)",
+            (session_id, data_id, created_at or datetime.now().isoformat(),
+             json.dumps(data, ensure_ascii=False))
+        )
+
+        # 任務狀態另存索引欄位，供依狀態查詢
+        if data_id.startswith("task_") and isinstance(data, dict) and "status" in data:
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (session_id, task_id, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, data_id[len("task_"):], data.get("status"),
+                 data.get("created_at"), data.get("updated_at"))
+            )
+
+    def save_temp_data(self, session_id: str, data_id: str, data: Dict[str, Any]) -> bool:
+        """保存暫存數據"""
+        try:
+            with self._transaction() as conn:
+                self._write_temp_data(conn, session_id, data_id, data)
+            return True
+
+        except Exception as e:
+            logger.error(f"保存暫存數據失敗 {session_id}/{data_id}: {e}")
+            return False
+
+    def update_temp_data(self, session_id: str, data_id: str,
+                         update_func: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+                         ) -> Optional[Dict[str, Any]]:
+        """在寫入交易內讀-改-寫暫存數據"""
+        with self._transaction() as conn:
+            data = update_func(self.load_temp_data(session_id, data_id))
+            if data is None:
+                return None
+            self._write_temp_data(conn, session_id, data_id, data)
+            return data
+
+    def load_temp_data(self, session_id: str, data_id: str) -> Optional[Dict[str, Any]]:
+        """加載暫存數據"""
+        try:
+            row = self._conn().execute(
+                "SELECT data FROM temp_data WHERE session_id = ? AND data_id = ?",
+                (session_id, data_id)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+
+        except Exception as e:
+            logger.error(f"加載暫存數據失敗 {session_id}/{data_id}: {e}")
+            return None
+
+    def list_temp_data(self, session_id: str) -> List[str]:
+        """列出會話的所有暫存數據ID"""
+        try:
+            return [row[0] for row in self._conn().execute(
+                "SELECT data_id FROM temp_data WHERE session_id = ?", (session_id,)
+            )]
+
+        except Exception as e:
+            logger.error(f"列出暫存數據失敗 {session_id}: {e}")
+            return []
+
+    def list_task_states(self, session_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出會話的任務狀態（以 tasks 索引查詢）"""
+        query = ("SELECT d.data FROM tasks t JOIN temp_data d "
+                 "ON d.session_id = t.session_id AND d.data_id = 'task_' || t.task_id "
+                 "WHERE t.session_id = ?")
+        params: List[Any] = [session_id]
+        if status is not None:
+            query += " AND t.status = ?"
+            params.append(status)
+        query += " ORDER BY t.created_at"
+
+        return [json.loads(row[0]) for row in self._conn().execute(query, params)]
+
+    # ==================== 結果日誌 ====================
+
+    def append_result_log(self, session_id: str, log_id: str, records: List[Dict[str, Any]]) -> bool:
+        """追加結果記錄"""
+        try:
+            with self._transaction() as conn:
+                self._ensure_session(conn, session_id)
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM result_logs WHERE session_id = ? AND log_id = ?",
+                    (session_id, log_id)
+                ).fetchone()[0]
+                conn.executemany(
+                    "INSERT INTO result_logs (session_id, log_id, seq, record) VALUES (?, ?, ?, ?)",
+                    [(session_id, log_id, start + offset, json.dumps(record, ensure_ascii=False))
+                     for offset, record in enumerate(records, 1)]
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"追加結果日誌失敗 {session_id}/{log_id}: {e}")
+            return False
+
+    def iter_result_log(self, session_id: str, log_id: str) -> Iterator[Dict[str, Any]]:
+        """串流讀取結果記錄"""
+        # 使用獨立連線，避免與呼叫端在迭代期間的寫入交易互相影響
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            cursor = conn.execute(
+                "SELECT record FROM result_logs WHERE session_id = ? AND log_id = ? ORDER BY seq",
+                (session_id, log_id)
+            )
+            for (record,) in cursor:
+                yield json.loads(record)
+        finally:
+            conn.close()
+
+    def load_result_log(self, session_id: str, log_id: str, offset: int = 0,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """分頁讀取結果記錄"""
+        rows = self._conn().execute(
+            "SELECT record FROM result_logs WHERE session_id = ? AND log_id = ? "
+            "ORDER BY seq LIMIT ? OFFSET ?",
+            (session_id, log_id, -1 if limit is None else limit, offset)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def compact_result_log(self, session_id: str, log_id: str, key_field: Optional[str] = None) -> int:
+        """
+        壓縮結果日誌：同一鍵只保留最後一筆（位置以首次出現為準）
+
+        重複鍵的分組、替換與刪除都在 SQL 內完成，不需將記錄載入記憶體。
+        """
+        try:
+            with self._transaction() as conn:
+                if key_field:
+                    key_path = '$."' + key_field.replace('"', '""') + '"'
+                    conn.execute(
+                        "CREATE TEMP TABLE IF NOT EXISTS compact_keys "
+                        "(first_seq INTEGER PRIMARY KEY, last_seq INTEGER NOT NULL)"
+                    )
+                    conn.execute("DELETE FROM compact_keys")
+                    conn.execute(
+                        "INSERT INTO compact_keys (first_seq, last_seq) "
+                        "SELECT MIN(seq), MAX(seq) FROM result_logs "
+                        "WHERE session_id = ? AND log_id = ? AND json_type(record, ?) IS NOT NULL "
+                        "GROUP BY json_extract(record, ?) HAVING COUNT(*) > 1",
+                        (session_id, log_id, key_path, key_path)
+                    )
+                    # 首次出現的位置換成最後一筆的內容，再刪除同鍵的其他記錄
+                    conn.execute(
+                        "UPDATE result_logs SET record = ("
+                        "  SELECT latest.record FROM compact_keys JOIN result_logs AS latest"
+                        "  ON latest.session_id = result_logs.session_id AND latest.log_id = result_logs.log_id"
+                        "  AND latest.seq = compact_keys.last_seq"
+                        "  WHERE compact_keys.first_seq = result_logs.seq"
+                        ") WHERE session_id = ? AND log_id = ? AND seq IN (SELECT first_seq FROM compact_keys)",
+                        (session_id, log_id)
+                    )
+                    conn.execute(
+                        "DELETE FROM result_logs WHERE session_id = ? AND log_id = ? "
+                        "AND seq NOT IN (SELECT first_seq FROM compact_keys) "
+                        "AND json_extract(record, ?) IN ("
+                        "  SELECT json_extract(first.record, ?) FROM compact_keys JOIN result_logs AS first"
+                        "  ON first.session_id = ? AND first.log_id = ? AND first.seq = compact_keys.first_seq)",
+                        (session_id, log_id, key_path, key_path, session_id, log_id)
+                    )
+                    conn.execute("DELETE FROM compact_keys")
+
+                return conn.execute(
+                    "SELECT COUNT(*) FROM result_logs WHERE session_id = ? AND log_id = ?",
+                    (session_id, log_id)
+                ).fetchone()[0]
+
+        except Exception as e:
+            logger.error(f"壓縮結果日誌失敗 {session_id}/{log_id}: {e}")
+            return -1
+
+    def delete_result_log(self, session_id: str, log_id: str) -> bool:
+        """刪除結果日誌"""
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM result_logs WHERE session_id = ? AND log_id = ?",
+                             (session_id, log_id))
+            return True
+
+        except Exception as e:
+            logger.error(f"刪除結果日誌失敗 {session_id}/{log_id}: {e}")
+            return False
+
+    # ==================== 循環任務批次處理 ====================
+    # 批次結果以 (會話, 任務, 批次號) 為主鍵，重複保存同一批次直接覆蓋，
+    # 進度計數以主鍵查詢上次的項目數後替換，每次保存的成本固定。
+
+    def _load_batch_meta(self, session_id: str, task_id: str, recount: bool = True) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT meta FROM batch_tasks WHERE session_id = ? AND task_id = ?", (session_id, task_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_batch_meta(self, conn: sqlite3.Connection, batch_info: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO batch_tasks (session_id, task_id, meta) VALUES (?, ?, ?)",
+            (batch_info["session_id"], batch_info["task_id"], json.dumps(batch_info, ensure_ascii=False))
+        )
+
+    def start_batch_processing(self, session_id: str, task_id: str, total_items: int,
+                              batch_size: int = 10) -> bool:
+        """開始批次處理任務（同一任務ID重新開始時清除先前的批次結果）"""
+        try:
+            with self._transaction() as conn:
+                self._ensure_session(conn, session_id)
+                conn.execute("DELETE FROM batch_results WHERE session_id = ? AND task_id = ?",
+                             (session_id, task_id))
+                self._write_batch_meta(conn, self._new_batch_info(session_id, task_id, total_items, batch_size))
+
+            logger.info(f"批次處理任務已創建: {session_id}/{task_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"創建批次處理任務失敗 {session_id}/{task_id}: {e}")
+            return False
+
+    def save_batch_result(self, session_id: str, task_id: str, batch_number: int,
+                         batch_data: Dict[str, Any]) -> bool:
+        """保存批次處理結果（同一批次重複保存時以最後一次為準，計數替換而不是累加）"""
+        try:
+            item_count = len(batch_data) if isinstance(batch_data, (list, dict)) else 1
+            with self._transaction() as conn:
+                batch_info = self._load_batch_meta(session_id, task_id)
+                if batch_info is None:
+                    logger.error(f"批次處理任務不存在: {session_id}/{task_id}")
+                    return False
+
+                previous = conn.execute(
+                    "SELECT item_count FROM batch_results "
+                    "WHERE session_id = ? AND task_id = ? AND batch_number = ?",
+                    (session_id, task_id, batch_number)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO batch_results "
+                    "(session_id, task_id, batch_number, item_count, processed_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, task_id, batch_number, item_count, datetime.now().isoformat(),
+                     json.dumps(batch_data, ensure_ascii=False))
+                )
+
+                if previous is None:
+                    batch_info["processed_items"] += item_count
+                    batch_info["completed_batches"] = batch_info.get("completed_batches", 0) + 1
+                else:
+                    batch_info["processed_items"] += item_count - previous[0]
+                batch_info["last_saved_batch"] = max(batch_number, batch_info.get("last_saved_batch") or 0)
+                batch_info["current_batch"] = max(batch_info["current_batch"], batch_number)
+                batch_info["updated_at"] = datetime.now().isoformat()
+
+                # 檢查是否完成
+                if batch_info["current_batch"] >= batch_info["total_batches"] - 1:
+                    batch_info["status"] = "completed"
+
+                self._write_batch_meta(conn, batch_info)
+
+            logger.info(f"批次結果已保存: {session_id}/{task_id}/batch_{batch_number}")
+            return True
+
+        except Exception as e:
+            logger.error(f"保存批次結果失敗 {session_id}/{task_id}: {e}")
+            return False
+
+    def iter_batch_results(self, session_id: str, task_id: str,
+                           start_batch: Optional[int] = None,
+                           end_batch: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """依批次號順序串流讀取批次結果（可指定範圍，含首尾）"""
+        query = ("SELECT batch_number, data, processed_at, item_count FROM batch_results "
+                 "WHERE session_id = ? AND task_id = ?")
+        params: List[Any] = [session_id, task_id]
+        if start_batch is not None:
+            query += " AND batch_number >= ?"
+            params.append(start_batch)
+        if end_batch is not None:
+            query += " AND batch_number <= ?"
+            params.append(end_batch)
+        query += " ORDER BY batch_number"
+
+        # 使用獨立連線，避免與呼叫端在迭代期間的寫入交易互相影響
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            for batch_number, data, processed_at, item_count in conn.execute(query, params):
+                yield {
+                    "batch_number": batch_number,
+                    "data": json.loads(data),
+                    "processed_at": processed_at,
+                    "item_count": item_count
+                }
+        finally:
+            conn.close()
+
+    # ==================== 文件摘要 ====================
+
+    @staticmethod
+    def _summary_row_key(file_path: str, summary_type: str) -> str:
+        return f"{file_path}|{summary_type}" if summary_type else file_path
+
+    def _write_file_summary(self, session_id: str, file_path: str, summary: Dict[str, Any],
+                            fingerprint: Optional[Dict[str, int]], summary_type: str) -> None:
+        with self._transaction() as conn:
+            self._ensure_session(conn, session_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO file_summaries "
+                "(session_id, file_path, saved_at, summary, file_fingerprint) VALUES (?, ?, ?, ?, ?)",
+                (session_id, self._summary_row_key(file_path, summary_type), datetime.now().isoformat(),
+                 json.dumps(summary, ensure_ascii=False),
+                 json.dumps(fingerprint) if fingerprint is not None else None)
+            )
+
+    def _read_file_summary(self, session_id: str, file_path: str,
+                           summary_type: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT saved_at, summary, file_fingerprint FROM file_summaries "
+            "WHERE session_id = ? AND file_path = ?",
+            (session_id, self._summary_row_key(file_path, summary_type))
+        ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            "file_path": file_path,
+            "session_id": session_id,
+            "saved_at": row[0],
+            "summary_type": summary_type,
+            "file_fingerprint": json.loads(row[2]) if row[2] else None,
+            "summary": json.loads(row[1])
+        }
+
+
+def migrate_json_to_sqlite(base_dir: str = "task_memory", db_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    將既有 JSON 檔案佈局匯入 SQLite 資料庫（可重複執行，已存在的數據會被覆蓋）
+
+    匯入會話信息、暫存數據（含任務狀態）、結果日誌、批次處理任務與文件摘要；原始檔案保留不動。
+
+    Returns:
+        各類數據的匯入筆數
+    """
+    source = SessionStorage(base_dir)
+    target = SqliteSessionStorage(base_dir, db_path)
+    counts = {"sessions": 0, "temp_data": 0, "result_logs": 0, "result_records": 0, "batch_tasks": 0,
+              "file_summaries": 0}
+
+    for session_dir in sorted(source.sessions_dir.iterdir()):
+        if not session_dir.is_dir():
+            continue
+        session_id = session_dir.name
+
+        with target._transaction() as conn:
+            info = source._read_session_info(session_id) or {}
+            now = datetime.now().isoformat()
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, last_accessed, status) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, info.get("created_at", now), info.get("last_accessed", now),
+                 info.get("status", "active"))
+            )
+            counts["sessions"] += 1
+
+            temp_dir = session_dir / "temp_data"
+            for data_file in sorted(temp_dir.glob("*.json")) if temp_dir.exists() else []:
+                try:
+                    with open(data_file, 'r', encoding='utf-8') as f:
+                        data_with_meta = json.load(f)
+                    target._write_temp_data(conn, session_id, data_file.stem,
+                                            data_with_meta.get("data"), data_with_meta.get("created_at"))
+                    counts["temp_data"] += 1
+                except Exception as e:
+                    logger.warning(f"略過無法讀取的暫存數據 {data_file}: {e}")
+
+            summaries_dir = session_dir / "file_summaries"
+            for summary_file in sorted(summaries_dir.glob("*.json")) if summaries_dir.exists() else []:
+                try:
+                    with open(summary_file, 'r', encoding='utf-8') as f:
+                        summary_with_meta = json.load(f)
+                    fingerprint = summary_with_meta.get("file_fingerprint")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO file_summaries "
+                        "(session_id, file_path, saved_at, summary, file_fingerprint) VALUES (?, ?, ?, ?, ?)",
+                        (session_id,
+                         target._summary_row_key(summary_with_meta["file_path"],
+                                                 summary_with_meta.get("summary_type", "")),
+                         summary_with_meta.get("saved_at", now),
+                         json.dumps(summary_with_meta.get("summary"), ensure_ascii=False),
+                         json.dumps(fingerprint) if fingerprint is not None else None)
+                    )
+                    counts["file_summaries"] += 1
+                except Exception as e:
+                    logger.warning(f"略過無法讀取的文件摘要 {summary_file}: {e}")
+
+        # 批次處理任務與其批次結果（逐批匯入）
+        batch_dir = session_dir / "batch_processing"
+        for meta_file in sorted(batch_dir.glob("*.json")) if batch_dir.exists() else []:
+            task_id = meta_file.stem
+            try:
+                batch_info = source._load_batch_meta(session_id, task_id)
+                if batch_info is None:
+                    continue
+                with target._transaction() as conn:
+                    conn.execute("DELETE FROM batch_results WHERE session_id = ? AND task_id = ?",
+                                 (session_id, task_id))
+                    for entry in source.iter_batch_results(session_id, task_id):
+                        conn.execute(
+                            "INSERT OR REPLACE INTO batch_results "
+                            "(session_id, task_id, batch_number, item_count, processed_at, data) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (session_id, task_id, entry["batch_number"], entry.get("item_count", 0),
+                             entry.get("processed_at", now), json.dumps(entry.get("data"), ensure_ascii=False))
+                        )
+                    target._write_batch_meta(conn, {**batch_info, "session_id": session_id, "task_id": task_id})
+                counts["batch_tasks"] += 1
+            except Exception as e:
+                logger.warning(f"略過無法讀取的批次處理任務 {meta_file}: {e}")
+
+        # 結果日誌分段匯入，避免一次載入大型日誌
+        for log_file in sorted((session_dir / "temp_data").glob("*.jsonl")):
+            log_id = log_file.stem
+            target.delete_result_log(session_id, log_id)
+            chunk = []
+            for record in source.iter_result_log(session_id, log_id):
+                chunk.append(record)
+                if len(chunk) >= 5000:
+                    target.append_result_log(session_id, log_id, chunk)
+                    counts["result_records"] += len(chunk)
+                    chunk = []
+            if chunk:
+                target.append_result_log(session_id, log_id, chunk)
+                counts["result_records"] += len(chunk)
+            counts["result_logs"] += 1
+
+    logger.info(f"JSON → SQLite 遷移完成: {counts}")
+    return counts
+
+
+def benchmark_backends(sessions: int = 20, tasks_per_session: int = 20,
+                       updates_per_task: int = 20, log_records: int = 20000) -> Dict[str, Dict[str, float]]:
+    """
+    比較 JSON 檔案與 SQLite 後端的常見操作耗時（秒），在暫存目錄中執行
+
+    進度更新直接寫入任務狀態（不經 ProgressTracker 的合併寫入），以比較後端本身的寫入成本。
+    """
+    results: Dict[str, Dict[str, float]] = {}
+
+    for backend in ("json", "sqlite"):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            base_dir = str(Path(temp_dir) / "task_memory")
+            storage = SqliteSessionStorage(base_dir) if backend == "sqlite" else SessionStorage(base_dir)
+            timings: Dict[str, float] = {}
+
+            start = time.perf_counter()
+            for s in range(sessions):
+                for t in range(tasks_per_session):
+                    storage.save_temp_data(f"s{s}", f"task_t{t}", {
+                        "task_id": f"t{t}", "status": "running" if t % 4 else "completed",
+                        "created_at": datetime.now().isoformat(), "progress": {"processed_items": 0}
+                    })
+            timings["create_tasks"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for s in range(sessions):
+                for t in range(tasks_per_session):
+                    for u in range(updates_per_task):
+                        storage.update_temp_data(
+                            f"s{s}", f"task_t{t}",
+                            lambda data, u=u: {**data, "progress": {"processed_items": u}}
+                        )
+            timings["update_progress"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for s in range(sessions):
+                storage.list_task_states(f"s{s}", "completed")
+            timings["list_tasks_by_status"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for offset in range(0, log_records, 100):
+                storage.append_result_log("s0", "log", [{"index": i, "value": i * 2}
+                                                       for i in range(offset, offset + 100)])
+            timings["append_result_log"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sum(1 for _ in storage.iter_result_log("s0", "log"))
+            timings["read_result_log"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            storage.list_sessions()
+            timings["list_sessions"] = time.perf_counter() - start
+
+            if isinstance(storage, SqliteSessionStorage):
+                storage.close()
+            results[backend] = {name: round(value, 4) for name, value in timings.items()}
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Task Memory SQLite 存儲工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="將 JSON 檔案佈局匯入 SQLite")
+    migrate_parser.add_argument("--base-dir", default="task_memory")
+    migrate_parser.add_argument("--db-path", default=None)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="比較 JSON 與 SQLite 後端")
+    benchmark_parser.add_argument("--sessions", type=int, default=20)
+    benchmark_parser.add_argument("--tasks", type=int, default=20)
+    benchmark_parser.add_argument("--updates", type=int, default=20)
+    benchmark_parser.add_argument("--log-records", type=int, default=20000)
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        print(json.dumps(migrate_json_to_sqlite(args.base_dir, args.db_path), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(benchmark_backends(args.sessions, args.tasks, args.updates, args.log_records),
+                         ensure_ascii=False, indent=2))
@@ -4,27 +4,88 @@ Task Memory Manager
 統一管理任務記憶、會話存儲和進度追蹤。
 """
 
+import json
 import asyncio
+import hashlib
 from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime
 import logging
 
-from .session_storage import SessionStorage
+from .session_storage import SessionStorage, create_session_storage
 from .progress_tracker import ProgressTracker, TaskStatus
 
 logger = logging.getLogger(__name__)
 
+# 任務描述索引的暫存數據ID
+TASK_INDEX_ID = "task_index"
+
+# 可恢復的任務狀態
+RESUMABLE_STATUSES = {
+    TaskStatus.PENDING.value,
+    TaskStatus.RUNNING.value,
+    TaskStatus.PAUSED.value,
+    TaskStatus.FAILED.value
+}
+
+# 處理期間的結果日誌壓縮門檻：新增記錄數至少達到此值，且不少於上次壓縮後的記錄數，
+# 壓縮總成本因此與記錄總數呈線性
+RESULT_LOG_COMPACT_MIN_RECORDS = 10000
+
+# process_batch_task 返回值中內嵌的結果數量上限，完整結果在結果日誌中
+RESULTS_INLINE_LIMIT = 1000
+
+
+def make_task_id(session_id: str, task_description: str, fingerprint: Any = None,
+                 prefix: str = "batch_task") -> str:
+    """
+    產生穩定的任務ID
+
+    由會話、任務描述與內容指紋（例如處理指令與項目）計算 SHA-256，
+    不受 Python hash 隨機化影響，跨進程重啟後仍一致。
+    """
+    payload = json.dumps([session_id, task_description, fingerprint],
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return f"{prefix}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+
+class ResultLogCompactor:
+    """處理期間依記錄數門檻定期壓縮結果日誌（移除恢復或重試產生的重複記錄）"""
+
+    def __init__(self, storage: SessionStorage, session_id: str, log_id: str, key_field: str,
+                 min_records: int = RESULT_LOG_COMPACT_MIN_RECORDS):
+        self.storage = storage
+        self.session_id = session_id
+        self.log_id = log_id
+        self.key_field = key_field
+        self.min_records = min_records
+        self.compacted_count = 0
+        self.appended = 0
+
+    def record_appended(self, count: int) -> None:
+        """記錄本次追加的記錄數，達到門檻時壓縮"""
+        self.appended += count
+        if self.appended >= max(self.min_records, self.compacted_count):
+            self.compact()
+
+    def compact(self) -> int:
+        count = self.storage.compact_result_log(self.session_id, self.log_id, key_field=self.key_field)
+        if count >= 0:
+            self.compacted_count = count
+            self.appended = 0
+        return count
+
 
 class TaskMemoryManager:
     """任務記憶管理器"""
     
     def __init__(self):
-        self.storage = SessionStorage()
+        self.storage = create_session_storage()
         self.tracker = ProgressTracker(self.storage)
     
     async def create_batch_task(self, session_id: str, task_id: str, 
                                items: List[Any], batch_size: int = 10,
-                               processor_func: Callable = None) -> Dict[str, Any]:
+                               processor_func: Callable = None,
+                               task_description: Optional[str] = None) -> Dict[str, Any]:
         """
         創建批次處理任務
         
@@ -34,6 +95,7 @@ class TaskMemoryManager:
             items: 要處理的項目列表
             batch_size: 批次大小
             processor_func: 處理函數
+            task_description: 任務描述（登記後可用 find_resumable_task 查找）
             
         Returns:
             任務信息
@@ -44,11 +106,17 @@ class TaskMemoryManager:
                 "total_items": len(items),
                 "batch_size": batch_size,
                 "processor_func": processor_func.__name__ if processor_func else None,
+                "task_description": task_description,
                 "created_by": "task_memory_manager"
             }
             
             # 創建任務
             task_info = self.tracker.create_task(session_id, task_id, task_config)
+            if task_description:
+                self.register_task_description(session_id, task_id, task_description)
+            
+            # 同ID重新創建時清除舊的結果日誌，避免被視為已完成
+            self.storage.delete_result_log(session_id, f"results_{task_id}")
             
             # 保存項目數據
             self.storage.save_temp_data(session_id, f"items_{task_id}", {
@@ -78,7 +146,10 @@ class TaskMemoryManager:
             on_error: 錯誤處理回調
             
         Returns:
-            處理結果
+            處理結果統計；results 只內嵌結果日誌的前 RESULTS_INLINE_LIMIT 筆
+            （超過時 results_truncated 為 True），完整結果以返回的 results_log 串流讀取；
+            有批次失敗時任務狀態為 FAILED、missing_items 為未寫入日誌的項目數，
+            不保存最終結果，可再以 resume_batch_task 處理缺少的項目
         """
         try:
             # 獲取任務狀態
@@ -97,50 +168,72 @@ class TaskMemoryManager:
             items = items_data["items"]
             batch_size = items_data["batch_size"]
             
-            # 獲取當前進度
-            progress = task_info["progress"]
-            start_index = progress["processed_items"]
-            
-            results = []
+            # 結果以追加式日誌保存，每批寫入量只與批次大小相關
+            results_log_id = f"results_{task_id}"
+            compactor = ResultLogCompactor(self.storage, session_id, results_log_id, key_field="index")
             errors = []
+
+            # 以結果日誌為準恢復進度：已寫入日誌的項目不再處理，
+            # 中斷時尚未寫入的批次會重新處理，每個項目在日誌中恰好記錄一次
+            recovered = self._recover_from_log(session_id, results_log_id)
+            completed_indices = recovered["indices"]
+            pending = [index for index in range(len(items)) if index not in completed_indices]
+            processed_count = len(items) - len(pending)
+            success_total = recovered["success_count"]
+            error_total = recovered["error_count"]
+            batch_number = (processed_count + batch_size - 1) // batch_size
+
+            if completed_indices:
+                logger.info(f"♻️ 從結果日誌恢復: 已完成 {processed_count}/{len(items)}，剩餘 {len(pending)}")
             
             # 分批處理
-            for i in range(start_index, len(items), batch_size):
-                batch = items[i:i + batch_size]
-                batch_number = (i // batch_size) + 1
+            for start in range(0, len(pending), batch_size):
+                indices = pending[start:start + batch_size]
+                batch = [items[index] for index in indices]
+                batch_number += 1
                 
                 try:
                     logger.info(f"處理批次 {batch_number}: {len(batch)} 項目")
                     
                     # 處理批次
                     batch_results = await self._process_batch(batch, processor_func)
-                    results.extend(batch_results)
+                    for index, result in zip(indices, batch_results):
+                        result["index"] = index
+                    if not self.storage.append_result_log(session_id, results_log_id, batch_results):
+                        raise IOError(f"寫入結果日誌失敗: {results_log_id}")
+                    compactor.record_appended(len(batch_results))
+                    completed_indices.update(indices)
                     
                     # 更新進度
-                    processed_count = min(i + batch_size, len(items))
+                    processed_count += len(batch)
                     success_count = len([r for r in batch_results if r.get("success", False)])
-                    error_count = len([r for r in batch_results if not r.get("success", False)])
+                    success_total += success_count
+                    error_total += len(batch_results) - success_count
                     
                     self.tracker.update_progress(
                         session_id, task_id,
                         processed_items=processed_count,
                         current_batch=batch_number,
-                        success_count=progress["success_count"] + success_count,
-                        error_count=progress["error_count"] + error_count
+                        success_count=success_total,
+                        error_count=error_total
                     )
                     
-                    # 保存中間結果
+                    # 保存中間狀態（結果本身在日誌中）
                     self.storage.save_temp_data(session_id, f"results_{task_id}", {
-                        "results": results,
+                        "results_log": results_log_id,
                         "errors": errors,
                         "last_batch": batch_number
                     })
                     
-                    # 添加檢查點
+                    # 添加檢查點（不複製結果內容）：結果以項目索引（記錄的 index 欄位）定位，
+                    # 日誌壓縮會移除重複記錄並改變行位置，但不改變索引
                     self.tracker.add_checkpoint(session_id, task_id, {
                         "batch_number": batch_number,
                         "batch_size": len(batch),
-                        "batch_results": batch_results
+                        "results_log": results_log_id,
+                        "log_count": len(batch_results),
+                        "first_index": indices[0],
+                        "last_index": indices[-1]
                     })
                     
                     # 調用批次完成回調
@@ -162,19 +255,48 @@ class TaskMemoryManager:
                     # 這裡簡單地繼續處理下一批次
                     continue
             
-            # 任務完成
-            self.tracker.set_task_status(session_id, task_id, TaskStatus.COMPLETED, "批次處理完成")
+            # 有批次失敗或項目未寫入日誌時任務標記為失敗且不保存最終結果，
+            # 之後以 resume_batch_task 恢復時只處理缺少的項目
+            missing_count = len(items) - len(completed_indices)
+            incomplete = bool(errors or missing_count)
+            if incomplete:
+                self.tracker.set_task_status(
+                    session_id, task_id, TaskStatus.FAILED,
+                    f"{len(errors)} 個批次失敗，{missing_count} 個項目未完成，可恢復執行"
+                )
+            else:
+                self.tracker.set_task_status(session_id, task_id, TaskStatus.COMPLETED, "批次處理完成")
             
-            # 生成最終報告
+            # 壓縮結果日誌（恢復執行可能重複處理同一項目，以最後一筆為準）
+            compactor.compact()
+
+            # 生成最終報告（串流統計日誌，包含先前執行已完成的結果，只保留有上限的結果預覽）
+            result_count = 0
+            successful_results = 0
+            results_preview = []
+            for record in self.storage.iter_result_log(session_id, results_log_id):
+                result_count += 1
+                if record.get("success", False):
+                    successful_results += 1
+                if len(results_preview) < RESULTS_INLINE_LIMIT:
+                    results_preview.append(record)
             final_results = {
-                "total_processed": len(items),
-                "successful_results": len([r for r in results if r.get("success", False)]),
-                "failed_results": len([r for r in results if not r.get("success", False)]),
+                "total_processed": len(items) - missing_count,
+                "missing_items": missing_count,
+                "successful_results": successful_results,
+                "failed_results": result_count - successful_results,
+                "results": results_preview,
+                "results_truncated": result_count > len(results_preview),
                 "errors": errors,
-                "results": results
+                "results_log": results_log_id
             }
-            
-            # 保存最終結果
+
+            if incomplete:
+                logger.warning(f"批次任務未完成: {session_id}/{task_id}，缺少 {missing_count} 個項目")
+                return final_results
+
+            # 保存並返回最終報告；完整結果只保存在 results_log，
+            # 以 storage.iter_result_log(session_id, results_log) 串流讀取
             self.storage.save_temp_data(session_id, f"final_results_{task_id}", final_results)
             
             logger.info(f"批次任務完成: {session_id}/{task_id}")
@@ -185,6 +307,47 @@ class TaskMemoryManager:
             self.tracker.set_task_status(session_id, task_id, TaskStatus.FAILED, str(e))
             raise
     
+    async def resume_batch_task(self, session_id: str, task_id: str,
+                                processor_func: Callable,
+                                on_batch_complete: Callable = None,
+                                on_error: Callable = None) -> Dict[str, Any]:
+        """
+        恢復中斷的批次任務
+
+        由結果日誌判斷已完成的項目，從下一個未處理的項目繼續；
+        任務已完成時直接返回保存的最終結果。
+        """
+        task_info = self.tracker.get_task_state(session_id, task_id)
+        if not task_info:
+            raise ValueError(f"任務不存在: {task_id}")
+
+        status = task_info["status"]
+        if status == TaskStatus.CANCELLED.value:
+            raise ValueError(f"任務已取消: {task_id}")
+        if status == TaskStatus.COMPLETED.value:
+            final_results = self.storage.load_temp_data(session_id, f"final_results_{task_id}")
+            if final_results:
+                return final_results
+
+        logger.info(f"♻️ 恢復批次任務: {session_id}/{task_id}（狀態: {status}）")
+        return await self.process_batch_task(session_id, task_id, processor_func,
+                                             on_batch_complete=on_batch_complete,
+                                             on_error=on_error)
+
+    def _recover_from_log(self, session_id: str, results_log_id: str) -> Dict[str, Any]:
+        """串流讀取結果日誌，統計已完成的項目索引與成功/失敗數（同一索引以最後一筆為準）"""
+        latest: Dict[int, bool] = {}
+        for record in self.storage.iter_result_log(session_id, results_log_id):
+            if "index" in record:
+                latest[record["index"]] = bool(record.get("success", False))
+
+        success_count = sum(1 for success in latest.values() if success)
+        return {
+            "indices": set(latest),
+            "success_count": success_count,
+            "error_count": len(latest) - success_count
+        }
+
     async def _process_batch(self, batch: List[Any], processor_func: Callable) -> List[Dict[str, Any]]:
         """處理單個批次"""
         results = []
@@ -213,6 +376,59 @@ class TaskMemoryManager:
         
         return results
     
+    @staticmethod
+    def _description_key(task_description: str) -> str:
+        return hashlib.sha256(task_description.strip().encode('utf-8')).hexdigest()[:32]
+
+    def register_task_description(self, session_id: str, task_id: str, task_description: str) -> bool:
+        """登記任務描述與任務ID的對應"""
+        def add_task(index):
+            index = index or {}
+            entry = index.setdefault(self._description_key(task_description), {
+                "task_description": task_description,
+                "task_ids": []
+            })
+
+            # 最近使用的任務排在最後
+            if task_id in entry["task_ids"]:
+                entry["task_ids"].remove(task_id)
+            entry["task_ids"].append(task_id)
+            return index
+
+        try:
+            return self.storage.update_temp_data(session_id, TASK_INDEX_ID, add_task) is not None
+
+        except Exception as e:
+            logger.error(f"登記任務描述失敗 {session_id}/{task_id}: {e}")
+            return False
+
+    def find_resumable_task(self, session_id: str, task_description: str) -> Optional[Dict[str, Any]]:
+        """
+        依任務描述查找最近一個尚未完成、可恢復的任務
+
+        Returns:
+            任務狀態，找不到時返回 None
+        """
+        try:
+            index = self.storage.load_temp_data(session_id, TASK_INDEX_ID) or {}
+            entry = index.get(self._description_key(task_description))
+            if not entry:
+                return None
+
+            for task_id in reversed(entry["task_ids"]):
+                task_info = self.tracker.get_task_state(session_id, task_id)
+                if not task_info or task_info.get("status") not in RESUMABLE_STATUSES:
+                    continue
+                progress = task_info.get("progress", {})
+                if progress.get("processed_items", 0) < progress.get("total_items", 0):
+                    return task_info
+
+            return None
+
+        except Exception as e:
+            logger.error(f"查找可恢復任務失敗 {session_id}: {e}")
+            return None
+
     def pause_task(self, session_id: str, task_id: str) -> bool:
         """暫停任務"""
         return self.tracker.set_task_status(session_id, task_id, TaskStatus.PAUSED, "任務已暫停")
@@ -8,13 +8,169 @@ import os
 import json
 import csv
 import io
+import asyncio
+import tempfile
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple, Union
 import logging
 
+from file_processor.stream_stats import JsonStreamReader
+from file_processor.line_index import line_index_manager
+
 logger = logging.getLogger(__name__)
 
+# 分塊讀取的行數、返回的樣本行數，以及 Excel 預覽解析的行數（用於推斷列類型）
+CSV_CHUNK_SIZE = 50000
+SAMPLE_ROWS = 3
+EXCEL_PREVIEW_ROWS = 100
+
+# 支持的行操作與可寫入的格式（.xls 只能讀取）
+ROW_OPERATIONS = ['add_row', 'delete_row', 'update_cell', 'update_row']
+WRITABLE_DATA_FORMATS = ['.csv', '.jsonl', '.json', '.xlsx']
+
+
+# pd.read_csv 對字串列使用的類型（pandas 3 為 str，較舊版本為 object）
+_CSV_STRING_DTYPE = pd.Series(['']).dtype
+_CSV_TRUE_VALUES = {'True', 'TRUE', 'true'}
+_CSV_FALSE_VALUES = {'False', 'FALSE', 'false'}
+
+
+class _CsvDtypeMerger:
+    """
+    合併 CSV 各分塊推斷出的列類型，結果與 pd.read_csv 一次讀入整個文件相同
+
+    每列記錄出現過的值種類（數字、布林、字串）與是否有空值：只有數字時合併數值類型
+    （整數含空值變為浮點），只有布林時為 bool（含空值為 object），種類混合時為字串；
+    全為空值的分塊會被推斷為 float64，只計入空值而不影響種類。
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, Dict[str, Any]] = {}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        for col in chunk.columns:
+            series = chunk[col]
+            state = self._columns.setdefault(col, {'kinds': set(), 'numeric': None, 'has_nan': False})
+            missing = series.isna()
+            if missing.any():
+                state['has_nan'] = True
+                if missing.all():
+                    continue
+
+            dtype = series.dtype
+            if pd.api.types.is_bool_dtype(dtype):
+                state['kinds'].add('bool')
+            elif pd.api.types.is_numeric_dtype(dtype):
+                state['kinds'].add('number')
+                state['numeric'] = dtype if state['numeric'] is None else np.result_type(state['numeric'], dtype)
+            elif dtype == object and series[~missing].map(lambda value: isinstance(value, bool)).all():
+                # 布林值夾雜空值的分塊為 object
+                state['kinds'].add('bool')
+            else:
+                state['kinds'].add('string')
+
+    def dtype(self, col: str) -> Any:
+        state = self._columns[col]
+        kinds = state['kinds']
+        if not kinds:
+            return np.dtype('float64')
+        if kinds == {'number'}:
+            numeric = state['numeric']
+            if state['has_nan'] and not pd.api.types.is_float_dtype(numeric):
+                return np.dtype('float64')
+            return numeric
+        if kinds == {'bool'}:
+            return np.dtype(object) if state['has_nan'] else np.dtype(bool)
+        return _CSV_STRING_DTYPE
+
+
+def _cast_raw_value(value: Any, dtype: Any) -> Any:
+    """將 CSV 原始文字轉為整個文件一次讀入時該列的值"""
+    if pd.isna(value) or dtype == _CSV_STRING_DTYPE:
+        return value
+    if pd.api.types.is_bool_dtype(dtype) or dtype == object:
+        if value in _CSV_TRUE_VALUES:
+            return True
+        if value in _CSV_FALSE_VALUES:
+            return False
+        return value
+    return np.asarray(pd.to_numeric(value)).astype(dtype).item()
+
+
+def _filter_dataframe(df: pd.DataFrame, filters: Optional[Dict[str, Any]],
+                      comparisons: bool = True) -> pd.DataFrame:
+    """對 DataFrame 應用過濾條件（comparisons=False 時只支持 equals / contains）"""
+    if not filters:
+        return df
+    for column, condition in filters.items():
+        if column in df.columns and isinstance(condition, dict):
+            if 'equals' in condition:
+                df = df[df[column] == condition['equals']]
+            elif 'contains' in condition:
+                df = df[df[column].astype(str).str.contains(condition['contains'], na=False)]
+            elif comparisons and 'greater_than' in condition:
+                df = df[df[column] > condition['greater_than']]
+            elif comparisons and 'less_than' in condition:
+                df = df[df[column] < condition['less_than']]
+    return df
+
+
+def _has_applicable_filters(df: pd.DataFrame, filters: Optional[Dict[str, Any]]) -> bool:
+    """過濾條件中是否有作用於此表的列"""
+    return bool(filters) and any(
+        column in df.columns and isinstance(condition, dict) for column, condition in filters.items()
+    )
+
+
+def _match_record(item: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """判斷單筆 JSON 記錄是否符合過濾條件（equals / contains）"""
+    for key, condition in filters.items():
+        if isinstance(condition, dict):
+            if 'equals' in condition and item.get(key) != condition['equals']:
+                return False
+            elif 'contains' in condition and condition['contains'] not in str(item.get(key, '')):
+                return False
+    return True
+
+
+def _excel_data_rows(excel_file: pd.ExcelFile, sheet_name: str) -> Optional[int]:
+    """
+    從工作表尺寸信息取得數據行數（不含表頭），無需讀取單元格
+
+    openpyxl 唯讀模式讀取 dimension 標記，xlrd 使用 nrows；無法取得時返回 None。
+    """
+    book = excel_file.book
+    try:
+        if hasattr(book, 'sheet_by_name'):
+            return max(0, book.sheet_by_name(sheet_name).nrows - 1)
+        max_row = book[sheet_name].max_row
+    except Exception:
+        return None
+    return None if max_row is None else max(0, max_row - 1)
+
+
+def _count_excel_rows(excel_file: pd.ExcelFile, sheet_name: str) -> Optional[int]:
+    """
+    逐行掃描工作表計算數據行數（不含表頭）
+
+    用於尺寸信息缺失或不可信（例如只有 A1）的工作表；與 pandas 一致，忽略末尾的空行。
+    無法計算時返回 None。
+    """
+    book = excel_file.book
+    try:
+        if hasattr(book, 'sheet_by_name'):
+            return max(0, book.sheet_by_name(sheet_name).nrows - 1)
+        last_row = 0
+        for row_number, row in enumerate(book[sheet_name].iter_rows(values_only=True), start=1):
+            if any(value is not None for value in row):
+                last_row = row_number
+    except Exception:
+        return None
+    return max(0, last_row - 1)
+
 
 class DataFileTools:
     """數據文件操作工具集"""
@@ -70,42 +226,49 @@ class DataFileTools:
     
     async def _read_csv_file(self, file_path: str, filters: Optional[Dict[str, Any]], 
                            limit: Optional[int], session_id: str) -> Dict[str, Any]:
-        """讀取CSV文件"""
+        """
+        讀取CSV文件
+
+        第一遍分塊讀取只合併列類型並計數；有過濾條件時第二遍以整個文件的列類型分塊讀取並逐塊過濾，
+        達到 limit 後即停止。類型與過濾結果都與整個文件一次讀入相同，記憶體只保留樣本行與計數。
+        """
         try:
-            df = pd.read_csv(file_path)
-            
-            # 應用過濾器
-            if filters:
-                for column, condition in filters.items():
-                    if column in df.columns:
-                        if isinstance(condition, dict):
-                            if 'equals' in condition:
-                                df = df[df[column] == condition['equals']]
-                            elif 'contains' in condition:
-                                df = df[df[column].astype(str).str.contains(condition['contains'], na=False)]
-                            elif 'greater_than' in condition:
-                                df = df[df[column] > condition['greater_than']]
-                            elif 'less_than' in condition:
-                                df = df[df[column] < condition['less_than']]
-            
-            # 限制行數
-            if limit:
-                df = df.head(limit)
-            
+            columns: Optional[List[str]] = None
+            dtypes = _CsvDtypeMerger()
+            total_rows = 0
+
+            with pd.read_csv(file_path, chunksize=CSV_CHUNK_SIZE) as reader:
+                for chunk in reader:
+                    if columns is None:
+                        columns = chunk.columns.tolist()
+                    dtypes.update(chunk)
+                    total_rows += len(chunk)
+
+            columns = columns or []
+            column_types = {col: dtypes.dtype(col) for col in columns}
+
+            if any(col in columns and isinstance(condition, dict) for col, condition in (filters or {}).items()):
+                sample_rows, matched = self._filter_csv_rows(file_path, filters, limit, column_types)
+            else:
+                matched = min(total_rows, limit) if limit else total_rows
+                sample_rows = list(range(min(SAMPLE_ROWS, matched)))
+
+            samples = self._read_csv_samples(file_path, sample_rows, column_types)
+
             # 分析數據結構
             schema = {
-                'columns': df.columns.tolist(),
-                'types': {col: str(df[col].dtype) for col in df.columns},
-                'row_count': len(df),
-                'sample_data': df.head(3).to_dict('records') if len(df) > 0 else []
+                'columns': columns,
+                'types': {col: str(column_types[col]) for col in columns},
+                'row_count': matched,
+                'sample_data': samples
             }
             
             return {
                 "success": True,
                 "format": "csv",
                 "schema": schema,
-                "data": df.head(1).to_dict('records'),  # 只返回1筆樣本數據，而不是完整數據
-                "total_rows": len(df),
+                "data": samples[:1],  # 只返回1筆樣本數據，而不是完整數據
+                "total_rows": matched,
                 "session_id": session_id
             }
             
@@ -115,71 +278,134 @@ class DataFileTools:
                 "error": f"讀取CSV文件失敗: {str(e)}"
             }
     
+    @staticmethod
+    def _filter_csv_rows(file_path: str, filters: Dict[str, Any], limit: Optional[int],
+                         column_types: Dict[str, Any]) -> Tuple[List[int], int]:
+        """
+        以整個文件的列類型分塊讀取並過濾
+
+        數值、布林與字串列直接以合併後的類型解析，與一次讀入得到相同的值；
+        布林夾雜空值（object）的列由各分塊自行推斷，值同樣為 True / False / NaN。
+
+        Returns:
+            (樣本行號, 符合條件的行數)
+        """
+        read_dtypes = {col: dtype for col, dtype in column_types.items() if dtype != object}
+        sample_rows: List[int] = []
+        matched = 0
+
+        with pd.read_csv(file_path, dtype=read_dtypes, chunksize=CSV_CHUNK_SIZE) as reader:
+            for chunk in reader:
+                chunk = _filter_dataframe(chunk, filters)
+                if limit:
+                    chunk = chunk.head(limit - matched)
+
+                if len(sample_rows) < SAMPLE_ROWS:
+                    sample_rows.extend(chunk.index[:SAMPLE_ROWS - len(sample_rows)])
+                matched += len(chunk)
+
+                if limit and matched >= limit:
+                    break
+
+        return sample_rows, matched
+
+    @staticmethod
+    def _read_csv_samples(file_path: str, rows: List[int], column_types: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        以原始文字重新讀取樣本行，再轉為整個文件的列類型
+
+        分塊推斷的類型可能與樣本所在分塊不同（例如 1 與 True 混合的列為字串），
+        從原始文字轉換才能得到與一次讀入相同的值。只讀取到最後一個樣本行為止。
+        """
+        if not rows:
+            return []
+        wanted = set(rows)
+        raw_rows: Dict[int, Dict[str, Any]] = {}
+        with pd.read_csv(file_path, dtype=object, chunksize=CSV_CHUNK_SIZE) as reader:
+            for chunk in reader:
+                for index, record in chunk[chunk.index.isin(wanted)].iterrows():
+                    raw_rows[index] = record.to_dict()
+                if len(raw_rows) == len(wanted):
+                    break
+        return [
+            {col: _cast_raw_value(value, column_types[col]) for col, value in raw_rows[index].items()}
+            for index in rows if index in raw_rows
+        ]
+
     async def _read_json_file(self, file_path: str, filters: Optional[Dict[str, Any]], 
                             limit: Optional[int], session_id: str) -> Dict[str, Any]:
-        """讀取JSON文件"""
+        """
+        讀取JSON文件
+
+        頂層為數組時逐個元素解析，只保留樣本與計數；單個對象需完整返回，仍整體解析。
+        """
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 如果是數組，可以應用過濾和限制
-            if isinstance(data, list):
-                filtered_data = data
-                
-                # 應用過濾器
-                if filters and len(data) > 0 and isinstance(data[0], dict):
-                    for key, condition in filters.items():
-                        if isinstance(condition, dict):
-                            if 'equals' in condition:
-                                filtered_data = [item for item in filtered_data 
-                                               if item.get(key) == condition['equals']]
-                            elif 'contains' in condition:
-                                filtered_data = [item for item in filtered_data 
-                                               if condition['contains'] in str(item.get(key, ''))]
-                
-                # 限制行數
-                if limit:
-                    filtered_data = filtered_data[:limit]
-                
-                # 分析結構
-                if filtered_data:
-                    sample_item = filtered_data[0]
-                    if isinstance(sample_item, dict):
-                        schema = {
-                            'type': 'array_of_objects',
-                            'keys': list(sample_item.keys()),
-                            'sample_data': filtered_data[:3],
-                            'total_items': len(filtered_data)
-                        }
-                    else:
-                        schema = {
-                            'type': 'array_of_primitives',
-                            'sample_data': filtered_data[:3],
-                            'total_items': len(filtered_data)
-                        }
+                reader = JsonStreamReader(f)
+
+                if reader.peek() != '[':
+                    data = reader.read_value()
+                    if reader.peek():
+                        raise ValueError(f"JSON 格式錯誤：文件末尾存在多餘內容（第 {reader.chars_read} 字符附近）")
+
+                    # 單個對象
+                    return {
+                        "success": True,
+                        "format": "json",
+                        "schema": {
+                            'type': 'object',
+                            'keys': list(data.keys()) if isinstance(data, dict) else [],
+                            'sample_data': data
+                        },
+                        "data": data,
+                        "session_id": session_id
+                    }
+
+                # 如果是數組，可以應用過濾和限制（是否過濾由第一個元素是否為對象決定）
+                samples: List[Any] = []
+                matched = 0
+                apply_filters = None
+
+                for item in reader.iter_array():
+                    if apply_filters is None:
+                        apply_filters = bool(filters) and isinstance(item, dict)
+                    if apply_filters and not _match_record(item, filters):
+                        continue
+
+                    if len(samples) < SAMPLE_ROWS:
+                        samples.append(item)
+                    matched += 1
+
+                    # 限制行數
+                    if limit and matched >= limit:
+                        break
+
+            # 分析結構
+            if samples:
+                sample_item = samples[0]
+                if isinstance(sample_item, dict):
+                    schema = {
+                        'type': 'array_of_objects',
+                        'keys': list(sample_item.keys()),
+                        'sample_data': samples,
+                        'total_items': matched
+                    }
                 else:
-                    schema = {'type': 'empty_array', 'total_items': 0}
-                
-                return {
-                    "success": True,
-                    "format": "json",
-                    "schema": schema,
-                    "data": filtered_data[:1] if filtered_data else [],  # 只返回1筆樣本數據
-                    "session_id": session_id
-                }
+                    schema = {
+                        'type': 'array_of_primitives',
+                        'sample_data': samples,
+                        'total_items': matched
+                    }
             else:
-                # 單個對象
-                return {
-                    "success": True,
-                    "format": "json",
-                    "schema": {
-                        'type': 'object',
-                        'keys': list(data.keys()) if isinstance(data, dict) else [],
-                        'sample_data': data
-                    },
-                    "data": data,
-                    "session_id": session_id
-                }
+                schema = {'type': 'empty_array', 'total_items': 0}
+
+            return {
+                "success": True,
+                "format": "json",
+                "schema": schema,
+                "data": samples[:1],  # 只返回1筆樣本數據
+                "session_id": session_id
+            }
                 
         except Exception as e:
             return {
@@ -189,49 +415,41 @@ class DataFileTools:
     
     async def _read_jsonl_file(self, file_path: str, filters: Optional[Dict[str, Any]], 
                              limit: Optional[int], session_id: str) -> Dict[str, Any]:
-        """讀取JSONL文件"""
+        """讀取JSONL文件（逐行解析，只保留樣本與計數）"""
         try:
-            data = []
+            samples: List[Any] = []
+            all_keys = set()
+            matched = 0
+
             with open(file_path, 'r', encoding='utf-8') as f:
                 for line_num, line in enumerate(f):
-                    if limit and len(data) >= limit:
+                    if limit and matched >= limit:
                         break
                     
                     try:
                         item = json.loads(line.strip())
-                        
-                        # 應用過濾器
-                        if filters and isinstance(item, dict):
-                            match = True
-                            for key, condition in filters.items():
-                                if isinstance(condition, dict):
-                                    if 'equals' in condition and item.get(key) != condition['equals']:
-                                        match = False
-                                        break
-                                    elif 'contains' in condition and condition['contains'] not in str(item.get(key, '')):
-                                        match = False
-                                        break
-                            if not match:
-                                continue
-                        
-                        data.append(item)
-                        
                     except json.JSONDecodeError:
                         logger.warning(f"跳過無效JSON行 {line_num + 1}: {line[:50]}...")
                         continue
+
+                    # 應用過濾器
+                    if filters and isinstance(item, dict) and not _match_record(item, filters):
+                        continue
+
+                    # 分析前10個項目的鍵
+                    if matched < 10 and isinstance(item, dict):
+                        all_keys.update(item.keys())
+                    if len(samples) < SAMPLE_ROWS:
+                        samples.append(item)
+                    matched += 1
             
             # 分析結構
-            if data:
-                all_keys = set()
-                for item in data[:10]:  # 分析前10個項目
-                    if isinstance(item, dict):
-                        all_keys.update(item.keys())
-                
+            if matched:
                 schema = {
                     'type': 'jsonl',
                     'common_keys': list(all_keys),
-                    'sample_data': data[:3],
-                    'total_lines': len(data)
+                    'sample_data': samples,
+                    'total_lines': matched
                 }
             else:
                 schema = {'type': 'empty_jsonl', 'total_lines': 0}
@@ -240,7 +458,7 @@ class DataFileTools:
                 "success": True,
                 "format": "jsonl",
                 "schema": schema,
-                "data": data,
+                "data": samples[:1],  # 只返回1筆樣本數據
                 "session_id": session_id
             }
             
@@ -252,41 +470,57 @@ class DataFileTools:
     
     async def _read_excel_file(self, file_path: str, filters: Optional[Dict[str, Any]], 
                              limit: Optional[int], session_id: str) -> Dict[str, Any]:
-        """讀取Excel文件"""
+        """
+        讀取Excel文件
+
+        工作簿只打開一次；無需過濾的工作表只解析前幾行作預覽，
+        行數取自工作表的尺寸信息，耗時與工作表數量相關而非單元格總數。
+        尺寸信息缺失或不可信時才逐行掃描該工作表計數。
+        """
         try:
-            # 讀取所有工作表
-            excel_file = pd.ExcelFile(file_path)
             sheets_data = {}
-            
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
-                # 應用過濾器
-                if filters:
-                    for column, condition in filters.items():
-                        if column in df.columns:
-                            if isinstance(condition, dict):
-                                if 'equals' in condition:
-                                    df = df[df[column] == condition['equals']]
-                                elif 'contains' in condition:
-                                    df = df[df[column].astype(str).str.contains(condition['contains'], na=False)]
-                
-                # 限制行數
-                if limit:
-                    df = df.head(limit)
-                
-                sheets_data[sheet_name] = {
-                    'columns': df.columns.tolist(),
-                    'types': {col: str(df[col].dtype) for col in df.columns},
-                    'row_count': len(df),
-                    'data': df.head(1).to_dict('records'),  # 只返回1筆樣本數據
-                    'sample_data': df.head(1).to_dict('records') if len(df) > 0 else []
-                }
+
+            # 讀取所有工作表（共用同一個工作簿句柄）
+            with pd.ExcelFile(file_path) as excel_file:
+                sheet_names = list(excel_file.sheet_names)
+
+                for sheet_name in sheet_names:
+                    # 尺寸信息需在解析前讀取（pandas 解析唯讀工作表時會重置尺寸）
+                    sheet_rows = _excel_data_rows(excel_file, sheet_name)
+                    preview_rows = min(limit, EXCEL_PREVIEW_ROWS) if limit else EXCEL_PREVIEW_ROWS
+                    df = excel_file.parse(sheet_name, nrows=preview_rows)
+
+                    if _has_applicable_filters(df, filters):
+                        # 過濾需要檢查每一行，只對此工作表完整解析
+                        df = _filter_dataframe(excel_file.parse(sheet_name), filters, comparisons=False)
+                        # 限制行數
+                        if limit:
+                            df = df.head(limit)
+                        row_count = len(df)
+                    else:
+                        if sheet_rows is not None and sheet_rows >= len(df):
+                            row_count = sheet_rows
+                        elif len(df) < preview_rows or (limit and len(df) >= limit):
+                            # 預覽已涵蓋整個工作表，或已達返回行數上限
+                            row_count = len(df)
+                        else:
+                            # 尺寸信息缺失或小於預覽行數（不可信），逐行計數；仍無法取得時為 None（未知）
+                            row_count = _count_excel_rows(excel_file, sheet_name)
+                        if limit and row_count is not None:
+                            row_count = min(row_count, limit)
+
+                    sheets_data[sheet_name] = {
+                        'columns': df.columns.tolist(),
+                        'types': {col: str(df[col].dtype) for col in df.columns},
+                        'row_count': row_count,
+                        'data': df.head(1).to_dict('records'),  # 只返回1筆樣本數據
+                        'sample_data': df.head(1).to_dict('records') if len(df) > 0 else []
+                    }
             
             return {
                 "success": True,
                 "format": "excel",
-                "sheets": list(excel_file.sheet_names),
+                "sheets": sheet_names,
                 "data": sheets_data,
                 "session_id": session_id
             }
@@ -299,7 +533,8 @@ class DataFileTools:
     
     async def edit_data_file(self, file_path: str, row_range: Optional[tuple] = None, 
                            column: Optional[str] = None, new_values: Optional[List[Any]] = None,
-                           session_id: str = "default") -> Dict[str, Any]:
+                           session_id: str = "default",
+                           operations: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         編輯數據文件
         
@@ -309,12 +544,16 @@ class DataFileTools:
             column: 要編輯的列名
             new_values: 新值列表
             session_id: 會話ID
+            operations: 行操作列表，提供時改為批量執行（見 edit_data_rows）
             
         Returns:
             編輯結果
         """
         try:
             logger.info(f"編輯數據文件: {file_path}")
+
+            if operations:
+                return await self.edit_data_rows(file_path, operations, session_id)
             
             file_ext = Path(file_path).suffix.lower()
             
@@ -336,36 +575,29 @@ class DataFileTools:
     async def _edit_csv_file(self, file_path: str, row_range: Optional[tuple], 
                            column: Optional[str], new_values: Optional[List[Any]], 
                            session_id: str) -> Dict[str, Any]:
-        """編輯CSV文件"""
+        """編輯CSV文件（分塊改寫，未修改的單元格保持原文）"""
         try:
-            df = pd.read_csv(file_path)
-            
-            if column and column in df.columns and new_values:
-                if row_range:
-                    start, end = row_range
-                    start = max(0, start)
-                    end = min(len(df), end)
-                    
-                    # 確保新值數量匹配行數
-                    rows_to_update = end - start
-                    if len(new_values) != rows_to_update:
-                        return {
-                            "success": False,
-                            "error": f"新值數量 ({len(new_values)}) 與行數 ({rows_to_update}) 不匹配"
-                        }
-                    
-                    df.loc[start:end-1, column] = new_values
-                else:
-                    # 更新整列
-                    if len(new_values) != len(df):
-                        return {
-                            "success": False,
-                            "error": f"新值數量 ({len(new_values)}) 與總行數 ({len(df)}) 不匹配"
-                        }
-                    df[column] = new_values
-                
+            columns = _read_csv_header(file_path)
+
+            if column and column in columns and new_values:
+                start, end = row_range if row_range else (0, None)
+                start = max(0, start)
+                operation = {'kind': 'update', 'range': (start, end), 'column_values': (column, list(new_values))}
+
+                def validate(stats: Dict[str, int]) -> Optional[str]:
+                    total = stats['total_rows']
+                    if row_range:
+                        # 確保新值數量匹配行數
+                        rows_to_update = min(total, end) - start
+                        if len(new_values) != rows_to_update:
+                            return f"新值數量 ({len(new_values)}) 與行數 ({rows_to_update}) 不匹配"
+                    elif len(new_values) != total:
+                        return f"新值數量 ({len(new_values)}) 與總行數 ({total}) 不匹配"
+                    return None
+
                 # 保存文件
-                df.to_csv(file_path, index=False)
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, _rewrite_rows, file_path, [operation], validate)
                 
                 return {
                     "success": True,
@@ -379,12 +611,408 @@ class DataFileTools:
                     "error": "缺少必要參數或列不存在"
                 }
                 
+        except RowEditRejected as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"編輯CSV文件失敗: {str(e)}"
             }
 
+    async def append_rows(self, file_path: str, rows: List[Dict[str, Any]],
+                          session_id: str = "default") -> Dict[str, Any]:
+        """
+        在數據文件末尾追加行
+
+        CSV 與 JSONL 直接追加到文件末尾而不讀取既有內容；
+        新行帶有 CSV 表頭以外的列，或文件為 JSON / Excel 時，改為一次完整改寫。
+        """
+        return await self.edit_data_rows(file_path, [{'operation': 'add_row', 'rows': rows}], session_id)
+
+    async def edit_data_rows(self, file_path: str, operations: List[Dict[str, Any]],
+                             session_id: str = "default") -> Dict[str, Any]:
+        """
+        批量執行行操作，整批只改寫一次文件
+
+        每個操作為一個字典，operation 可為：
+            add_row:     row（單行）或 rows（多行），追加到末尾
+            delete_row:  以 row_index / row_indices / conditions 選擇要刪除的行
+            update_cell: row_index、column、value
+            update_row:  以 row_index / row_indices / conditions 選擇行，values 為 {列名: 新值}
+        conditions 的格式與 update/delete 工具相同（column、operator、value），
+        match 為 "all"（全部符合，update 預設）或 "any"（任一符合，delete 預設）。
+        行號為 0-based，並一律指向本批操作前的文件內容。
+
+        只包含 add_row 的批次對 CSV / JSONL 直接追加；其餘情況 CSV 分塊改寫，
+        JSON / Excel 讀入後改寫一次。
+
+        Args:
+            file_path: 文件路徑
+            operations: 操作列表
+            session_id: 會話ID
+
+        Returns:
+            各類操作影響的行數
+        """
+        try:
+            logger.info(f"批量編輯數據文件: {file_path}（{len(operations)} 個操作）")
+
+            file_ext = Path(file_path).suffix.lower()
+            if file_ext not in WRITABLE_DATA_FORMATS:
+                return {
+                    "success": False,
+                    "error": f"暫不支持編輯 {file_ext} 格式的文件"
+                }
+
+            normalized = _normalize_row_operations(operations)
+            only_adds = all(op['kind'] == 'add' for op in normalized)
+
+            if not os.path.exists(file_path) and not only_adds:
+                return {
+                    "success": False,
+                    "error": f"文件不存在: {file_path}"
+                }
+
+            loop = asyncio.get_running_loop()
+            stats = None
+            if only_adds:
+                rows = [row for op in normalized for row in op['rows']]
+                stats = await loop.run_in_executor(None, _append_rows, file_path, rows)
+            if stats is None:
+                if file_ext == '.jsonl':
+                    return {
+                        "success": False,
+                        "error": "JSONL 文件目前只支持追加行"
+                    }
+                stats = await loop.run_in_executor(None, _rewrite_rows, file_path, normalized, None)
+
+            line_index_manager.invalidate(file_path)
+            logger.info(f"✅ 數據文件編輯完成: {file_path} {stats}")
+
+            return {
+                "success": True,
+                "file_path": file_path,
+                "operations": len(normalized),
+                **stats,
+                "affected_rows": stats['updated_rows'] + stats['deleted_rows'] + stats['added_rows'],
+                "session_id": session_id
+            }
+
+        except Exception as e:
+            logger.error(f"批量編輯數據文件失敗 {file_path}: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+
+class RowEditRejected(ValueError):
+    """改寫完成後校驗失敗，原文件保持不變"""
+
+
+def _read_csv_header(file_path: str) -> List[str]:
+    """只讀取CSV表頭"""
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _normalize_row_operations(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把外部的行操作格式轉為內部格式（kind 與行選擇條件）"""
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations 必須為非空列表")
+
+    normalized = []
+    for op in operations:
+        name = op.get('operation') if isinstance(op, dict) else None
+
+        if name == 'add_row':
+            rows = op.get('rows', op.get('row'))
+            rows = [rows] if isinstance(rows, dict) else rows
+            if not rows or not all(isinstance(row, dict) for row in rows):
+                raise ValueError("add_row 需要提供 row（對象）或 rows（對象列表）")
+            normalized.append({'kind': 'add', 'rows': rows})
+
+        elif name == 'delete_row':
+            normalized.append({'kind': 'delete', **_row_selector(op, match_all=False)})
+
+        elif name == 'update_cell':
+            if 'column' not in op:
+                raise ValueError("update_cell 需要提供 column 和 value")
+            normalized.append({'kind': 'update', 'values': {op['column']: op.get('value')},
+                               **_row_selector(op, match_all=True)})
+
+        elif name == 'update_row':
+            values = op.get('values')
+            if not isinstance(values, dict) or not values:
+                raise ValueError("update_row 需要提供 values（{列名: 新值}）")
+            normalized.append({'kind': 'update', 'values': values, **_row_selector(op, match_all=True)})
+
+        else:
+            raise ValueError(f"不支持的操作類型: {name}，支持的操作: {ROW_OPERATIONS}")
+
+    return normalized
+
+
+def _row_selector(op: Dict[str, Any], match_all: bool) -> Dict[str, Any]:
+    """解析操作的行選擇方式"""
+    if 'row_index' in op:
+        return {'rows': {int(op['row_index'])}}
+    if 'row_indices' in op:
+        return {'rows': {int(i) for i in op['row_indices']}}
+    if 'conditions' in op:
+        match = op.get('match', 'all' if match_all else 'any')
+        return {'conditions': op['conditions'] or [], 'match_all': match == 'all'}
+    raise ValueError(f"{op.get('operation')} 需要提供 row_index、row_indices 或 conditions")
+
+
+def _condition_mask(df: pd.DataFrame, conditions: List[Dict[str, Any]], match_all: bool) -> pd.Series:
+    """計算條件匹配的行（不存在的列與未知運算符被忽略）"""
+    mask = pd.Series(match_all, index=df.index)
+
+    for condition in conditions:
+        column = condition.get("column")
+        operator = condition.get("operator")
+        value = condition.get("value")
+
+        if column not in df.columns:
+            continue
+
+        series = df[column]
+        # CSV 以原文讀入，與數字比較時先轉為數值
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and series.dtype == object:
+            series = pd.to_numeric(series, errors='coerce')
+
+        if operator == "==":
+            matched = series == value
+        elif operator == "!=":
+            matched = series != value
+        elif operator == ">":
+            matched = series > value
+        elif operator == "<":
+            matched = series < value
+        elif operator == "contains":
+            matched = df[column].astype(str).str.contains(str(value), na=False)
+        else:
+            continue
+
+        mask = (mask & matched) if match_all else (mask | matched)
+
+    return mask
+
+
+def _operation_mask(df: pd.DataFrame, op: Dict[str, Any]) -> pd.Series:
+    if 'rows' in op:
+        # 索引為連續的原文件行號，直接換算位置，不必逐行查找
+        first = df.index[0] if len(df) else 0
+        mask = np.zeros(len(df), dtype=bool)
+        mask[[row - first for row in op['rows'] if 0 <= row - first < len(df)]] = True
+        return pd.Series(mask, index=df.index)
+    if 'range' in op:
+        start, end = op['range']
+        mask = df.index >= start
+        if end is not None:
+            mask &= df.index < end
+        return pd.Series(mask, index=df.index)
+    return _condition_mask(df, op['conditions'], op['match_all'])
+
+
+def _assign(df: pd.DataFrame, rows: Any, column: str, value: Any) -> None:
+    """賦值，新值與列類型不相容時把該列轉為 object"""
+    try:
+        df.loc[rows, column] = value
+    except (TypeError, ValueError):
+        df[column] = df[column].astype(object)
+        df.loc[rows, column] = value
+
+
+def _apply_row_operations(df: pd.DataFrame, operations: List[Dict[str, Any]],
+                          stats: Dict[str, int]) -> pd.DataFrame:
+    """
+    對一塊數據依序執行更新與刪除操作
+
+    df 的索引必須是行在原文件中的 0-based 位置，分塊處理時各塊結果可直接拼接。
+    """
+    deleted = pd.Series(False, index=df.index)
+    updated = pd.Series(False, index=df.index)
+
+    for op in operations:
+        if op['kind'] == 'add':
+            continue
+        mask = _operation_mask(df, op) & ~deleted
+        if not mask.any():
+            continue
+
+        if op['kind'] == 'delete':
+            deleted |= mask
+            continue
+
+        if 'column_values' in op:
+            column, values, start = *op['column_values'], op['range'][0]
+            labels = df.index[mask.to_numpy()]
+            labels = labels[labels - start < len(values)]
+            _assign(df, labels, column, [values[label - start] for label in labels])
+        else:
+            for column, value in op['values'].items():
+                if column in df.columns:
+                    _assign(df, mask, column, value)
+        updated |= mask
+
+    stats['updated_rows'] += int((updated & ~deleted).sum())
+    stats['deleted_rows'] += int(deleted.sum())
+    return df[~deleted]
+
+
+@contextmanager
+def _atomic_output(file_path: str) -> Iterator[str]:
+    """在同目錄的暫存檔寫出新內容，成功後原子替換原文件，失敗時原文件不變"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    # 保留原副檔名，寫出時才能依副檔名選擇格式（如 Excel）
+    fd, temp_name = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.",
+                                     suffix=f".tmp{Path(file_path).suffix}", dir=directory)
+    os.close(fd)
+    try:
+        yield temp_name
+        os.replace(temp_name, file_path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {'total_rows': 0, 'updated_rows': 0, 'deleted_rows': 0, 'added_rows': 0, 'remaining_rows': 0}
+
+
+def _line_terminator(file_path: str) -> str:
+    """沿用文件第一行的換行符"""
+    with open(file_path, 'rb') as f:
+        first_line = f.readline()
+    return '\r\n' if first_line.endswith(b'\r\n') else '\n'
+
+
+def _ends_with_newline(file_path: str) -> bool:
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _append_rows(file_path: str, rows: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    直接追加行到 CSV / JSONL 文件末尾
+
+    無法直接追加（JSON、Excel，或新行包含 CSV 表頭以外的列）時返回 None，由調用方改寫整個文件。
+    """
+    file_ext = Path(file_path).suffix.lower()
+    exists = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+
+    if file_ext == '.jsonl':
+        needs_newline = exists and not _ends_with_newline(file_path)
+        with open(file_path, 'a', encoding='utf-8') as f:
+            if needs_newline:
+                f.write('\n')
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+    elif file_ext == '.csv':
+        if not exists:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            pd.DataFrame(rows).to_csv(file_path, index=False, encoding='utf-8')
+        else:
+            header = _read_csv_header(file_path)
+            if any(key not in header for row in rows for key in row):
+                return None
+            terminator = _line_terminator(file_path)
+            needs_newline = not _ends_with_newline(file_path)
+            with open(file_path, 'a', encoding='utf-8', newline='') as f:
+                if needs_newline:
+                    f.write(terminator)
+                pd.DataFrame(rows).reindex(columns=header).to_csv(
+                    f, index=False, header=False, lineterminator=terminator
+                )
+
+    else:
+        return None
+
+    # 直接追加時不讀取既有內容，原有行數未知
+    stats = _new_stats()
+    stats.update(total_rows=None, remaining_rows=None, added_rows=len(rows))
+    return stats
+
+
+def _rewrite_rows(file_path: str, operations: List[Dict[str, Any]],
+                  validate: Optional[Callable[[Dict[str, int]], Optional[str]]] = None) -> Dict[str, int]:
+    """
+    執行一批行操作並只改寫文件一次
+
+    CSV 以原文（object）分塊讀寫，記憶體與文件大小無關，未修改的單元格保持原樣；
+    JSON / Excel 讀入整個表後寫出一次。validate 返回錯誤信息時放棄改寫。
+    """
+    file_ext = Path(file_path).suffix.lower()
+    add_rows = [row for op in operations if op['kind'] == 'add' for row in op['rows']]
+    stats = _new_stats()
+
+    with _atomic_output(file_path) as temp_path:
+        if file_ext == '.csv':
+            header = _read_csv_header(file_path) if os.path.exists(file_path) else []
+            columns = header + list(dict.fromkeys(key for row in add_rows for key in row if key not in header))
+            terminator = _line_terminator(file_path) if header else '\n'
+
+            with open(temp_path, 'w', encoding='utf-8', newline='') as out:
+                write_header = True
+                if header:
+                    with pd.read_csv(file_path, dtype=object, keep_default_na=False,
+                                     chunksize=CSV_CHUNK_SIZE) as reader:
+                        for chunk in reader:
+                            chunk.index = pd.RangeIndex(stats['total_rows'], stats['total_rows'] + len(chunk))
+                            stats['total_rows'] += len(chunk)
+                            chunk = _apply_row_operations(chunk, operations, stats)
+                            stats['remaining_rows'] += len(chunk)
+                            chunk.reindex(columns=columns).to_csv(
+                                out, index=False, header=write_header, lineterminator=terminator
+                            )
+                            write_header = False
+                if add_rows or write_header:
+                    pd.DataFrame(add_rows).reindex(columns=columns).to_csv(
+                        out, index=False, header=write_header, lineterminator=terminator
+                    )
+
+        elif file_ext in ('.json', '.xlsx'):
+            if os.path.exists(file_path):
+                df = pd.read_json(file_path) if file_ext == '.json' else pd.read_excel(file_path)
+            else:
+                df = pd.DataFrame()
+            df.index = pd.RangeIndex(len(df))
+            stats['total_rows'] = len(df)
+            df = _apply_row_operations(df, operations, stats)
+            stats['remaining_rows'] = len(df)
+            if add_rows:
+                df = pd.concat([df, pd.DataFrame(add_rows)], ignore_index=True)
+
+            if file_ext == '.json':
+                df.to_json(temp_path, orient='records', indent=2, force_ascii=False)
+            else:
+                df.to_excel(temp_path, index=False, engine='openpyxl')
+
+        else:
+            raise ValueError(f"暫不支持改寫 {file_ext} 格式的文件")
+
+        stats['added_rows'] = len(add_rows)
+        stats['remaining_rows'] += len(add_rows)
+
+        error = validate(stats) if validate else None
+        if error:
+            raise RowEditRejected(error)
+
+    return stats
+
 
 # 全局工具實例
 data_file_tools = DataFileTools()
@@ -402,3 +1030,9 @@ async def edit_data_file_tool(file_path: str, row_range: Optional[tuple] = None,
                             session_id: str = "default") -> Dict[str, Any]:
     """編輯數據文件的工具函數"""
     return await data_file_tools.edit_data_file(file_path, row_range, column, new_values, session_id)
+
+
+async def edit_data_rows_tool(file_path: str, operations: List[Dict[str, Any]],
+                              session_id: str = "default") -> Dict[str, Any]:
+    """批量編輯數據行的工具函數（整批只改寫一次文件）"""
+    return await data_file_tools.edit_data_rows(file_path, operations, session_id)
@@ -16,6 +16,8 @@ from file_processor.summary_generator import SummaryGenerator
 from file_processor.parallel_reader import ParallelFileReader
 from file_processor.content_analyzer import ContentAnalyzer
 from file_processor.smart_summary_generator import smart_summary_generator
+from file_processor.line_index import line_index_manager
+from task_memory.session_storage import session_storage
 
 logger = logging.getLogger(__name__)
 
@@ -28,13 +30,16 @@ class LocalFileTools:
         self.file_reader = ParallelFileReader()
         self.content_analyzer = ContentAnalyzer()
     
-    async def read_file_with_summary(self, file_path: str, session_id: str = "default") -> Dict[str, Any]:
+    async def read_file_with_summary(self, file_path: str, session_id: str = "default",
+                                     start_line: Optional[int] = None, end_line: Optional[int] = None) -> Dict[str, Any]:
         """
         讀取文件並生成摘要
         
         Args:
             file_path: 文件路徑
             session_id: 會話ID
+            start_line: 可選，同時返回此行起的內容（1-based）
+            end_line: 可選，內容的結束行號（包含）
             
         Returns:
             包含文件內容和摘要的字典
@@ -48,15 +53,31 @@ class LocalFileTools:
                     "error": f"文件不存在: {file_path}"
                 }
             
-            # 生成簡潔的文件摘要
-            summary = await self._generate_simple_summary(file_path)
+            # 生成簡潔的文件摘要（文件未變更時沿用會話中的快取）
+            summary = await session_storage.get_or_create_file_summary(
+                session_id, file_path, self._generate_simple_summary, summary_type="simple"
+            )
             
-            return {
+            result = {
                 "success": True,
                 "file_path": file_path,
                 "summary": summary,
                 "session_id": session_id
             }
+
+            # 指定行範圍時透過行索引只讀取該範圍
+            if start_line is not None or end_line is not None:
+                total_lines = line_index_manager.line_count(file_path)
+                range_start = start_line or 1
+                range_end = min(end_line or total_lines, total_lines)
+                result["content"] = line_index_manager.read_text(file_path, range_start, range_end)
+                result["line_range"] = {
+                    "start_line": range_start,
+                    "end_line": range_end,
+                    "total_lines": total_lines
+                }
+
+            return result
             
         except Exception as e:
             logger.error(f"讀取文件失敗 {file_path}: {e}")
@@ -220,6 +241,9 @@ class LocalFileTools:
                     "success": False,
                     "error": "無效的行號範圍"
                 }
+
+            # 編輯前的完整摘要（僅在文件未變更時有效），用於增量更新
+            previous_summary = session_storage.load_file_summary(session_id, file_path, summary_type="full")
             
             # 替換指定行範圍的內容
             new_lines = new_content.split('\n')
@@ -236,10 +260,17 @@ class LocalFileTools:
             # 寫回文件
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.writelines(updated_lines)
+            line_index_manager.invalidate(file_path)
             
-            # 重新生成摘要
+            # 更新摘要：有編輯前的摘要時只重新分析受影響的段落
             try:
-                updated_summary = await self.summary_generator.generate_file_summary(file_path)
+                if previous_summary is not None:
+                    updated_summary = await self.summary_generator.update_file_summary(
+                        previous_summary, start_line, end_line, new_content, file_path
+                    )
+                else:
+                    updated_summary = await self.summary_generator.generate_file_summary(file_path)
+                session_storage.save_file_summary(session_id, file_path, updated_summary, summary_type="full")
             except Exception as e:
                 logger.warning(f"重新生成摘要失敗: {e}")
                 updated_summary = None
@@ -282,15 +313,14 @@ class LocalFileTools:
                     "error": f"文件不存在: {file_path}"
                 }
             
-            # 讀取文件內容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # 透過行索引取得行數，只讀取需要高亮的範圍
+            total_lines = line_index_manager.line_count(file_path)
             
             # 驗證所有範圍
             for range_info in ranges:
                 start = range_info.get('start_line', 1)
                 end = range_info.get('end_line', 1)
-                if start < 1 or end < start or start > len(lines):
+                if start < 1 or end < start or start > total_lines:
                     return {
                         "success": False,
                         "error": f"無效的行號範圍: {start}-{end}"
@@ -301,7 +331,7 @@ class LocalFileTools:
             for range_info in ranges:
                 start = range_info['start_line']
                 end = range_info['end_line']
-                content = ''.join(lines[start-1:end])
+                content = ''.join(line_index_manager.read_lines(file_path, start, end, keepends=True))
                 highlighted_content.append({
                     "start_line": start,
                     "end_line": end,
@@ -391,9 +421,11 @@ class LocalFileTools:
             with open(file_path, 'w', encoding=encoding) as f:
                 f.write(content)
             
-            # 生成摘要
+            # 生成並保存完整摘要，之後按行編輯時即可增量更新
             try:
-                summary = await self.summary_generator.generate_file_summary(file_path)
+                summary = await session_storage.get_or_create_file_summary(
+                    session_id, file_path, self.summary_generator.generate_file_summary, summary_type="full"
+                )
             except Exception as e:
                 logger.warning(f"生成摘要失敗: {e}")
                 summary = None
@@ -445,9 +477,11 @@ class LocalFileTools:
             with open(file_path, 'w', encoding=encoding) as f:
                 f.write(content)
             
-            # 生成摘要
+            # 生成並保存完整摘要，之後按行編輯時即可增量更新
             try:
-                summary = await self.summary_generator.generate_file_summary(file_path)
+                summary = await session_storage.get_or_create_file_summary(
+                    session_id, file_path, self.summary_generator.generate_file_summary, summary_type="full"
+                )
             except Exception as e:
                 logger.warning(f"生成摘要失敗: {e}")
                 summary = None
@@ -474,9 +508,10 @@ local_file_tools = LocalFileTools()
 
 
 # 便利函數，供 Agent 調用
-async def read_file_with_summary_tool(file_path: str, session_id: str = "default") -> Dict[str, Any]:
+async def read_file_with_summary_tool(file_path: str, session_id: str = "default",
+                                      start_line: Optional[int] = None, end_line: Optional[int] = None) -> Dict[str, Any]:
     """讀取文件並生成摘要的工具函數"""
-    return await local_file_tools.read_file_with_summary(file_path, session_id)
+    return await local_file_tools.read_file_with_summary(file_path, session_id, start_line, end_line)
 
 
 async def edit_file_by_lines_tool(file_path: str, start_line: int, end_line: int, 
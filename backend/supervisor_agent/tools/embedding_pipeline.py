@@ -0,0 +1,286 @@
+"""
+Embedding 管線 - 指紋搜尋引擎共用的非同步批次 embedding 工具
+支援並發上限、依 token 估算切分批次、429/5xx 指數退避重試，並明確回報失敗項目
+"""
+
+import os
+import re
+import math
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 預設模型（Azure 上為 deployment 名稱）
+DEFAULT_EMBED_MODEL = "text-embedding-3-small"
+DEFAULT_API_VERSION = "2024-08-01-preview"
+
+# 需要重試的 HTTP 狀態碼
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 中日韓字元大約一字一 token，其餘約四字元一 token
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估文本的 token 數（不依賴 tokenizer）"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+@dataclass
+class EmbeddingResult:
+    """批次 embedding 結果，失敗的項目為 None 並記錄於 failed_indices"""
+    embeddings: List[Optional[List[float]]]
+    failed_indices: List[int] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    batch_count: int = 0
+    retry_count: int = 0
+
+    @property
+    def success(self) -> bool:
+        return not self.failed_indices
+
+    def summary(self) -> Dict[str, Any]:
+        """供 search_info 使用的簡要統計"""
+        return {
+            "total": len(self.embeddings),
+            "failed": len(self.failed_indices),
+            "batches": self.batch_count,
+            "retries": self.retry_count,
+            "errors": self.errors[:5]
+        }
+
+
+class EmbeddingRequestError(Exception):
+    """embedding 請求失敗（可能可重試）"""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class EmbeddingPipeline:
+    """非同步 embedding 管線"""
+
+    def __init__(self, api_key: str, endpoint: str,
+                 model: str = DEFAULT_EMBED_MODEL,
+                 api_version: str = DEFAULT_API_VERSION,
+                 endpoint_url: Optional[str] = None,
+                 max_concurrency: int = 4,
+                 max_batch_tokens: int = 16000,
+                 max_batch_size: int = 128,
+                 max_input_tokens: int = 8000,
+                 max_retries: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 timeout: float = 60.0):
+        self.api_key = api_key
+        self.model = model
+        # endpoint_url 可直接指定完整 URL（例如本地 stub server）
+        self.endpoint_url = endpoint_url or (
+            f"{endpoint.rstrip('/')}/openai/deployments/{model}/embeddings?api-version={api_version}"
+        )
+
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_input_tokens = max_input_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    def _truncate(self, text: str) -> str:
+        """截斷超過單一輸入上限的文本"""
+        if estimate_tokens(text) <= self.max_input_tokens:
+            return text
+        # 以最保守的比例（一字一 token）截斷
+        return text[:self.max_input_tokens]
+
+    def _build_batches(self, texts: List[str]) -> List[List[int]]:
+        """依 token 估算與數量上限切分批次，返回每批的原始索引"""
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for index, text in enumerate(texts):
+            if not text:
+                continue
+            tokens = estimate_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens
+                            or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """計算退避時間，優先採用伺服器提供的 Retry-After"""
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        delay = self.base_delay * (2 ** attempt)
+        return min(self.max_delay, delay) * (0.5 + random.random() / 2)
+
+    @staticmethod
+    def _parse_retry_after(headers) -> Optional[float]:
+        """解析 retry-after-ms / Retry-After 標頭"""
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("Retry-After"):
+                return float(headers["Retry-After"])
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    async def _post_batch(self, session: aiohttp.ClientSession,
+                          inputs: List[str]) -> List[List[float]]:
+        """送出單一批次請求"""
+        payload = {"input": inputs, "model": self.model}
+        headers = {"api-key": self.api_key, "Content-Type": "application/json"}
+
+        try:
+            async with session.post(self.endpoint_url, json=payload, headers=headers) as response:
+                if response.status != 200:
+                    body = await response.text()
+                    raise EmbeddingRequestError(
+                        f"HTTP {response.status}: {body[:200]}",
+                        status=response.status,
+                        retryable=response.status in RETRYABLE_STATUS,
+                        retry_after=self._parse_retry_after(response.headers)
+                    )
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise EmbeddingRequestError(f"連線錯誤: {type(e).__name__}: {e}", retryable=True)
+
+        items = sorted(data.get("data", []), key=lambda item: item.get("index", 0))
+        if len(items) != len(inputs):
+            raise EmbeddingRequestError(
+                f"回傳數量不符: 預期 {len(inputs)}，實際 {len(items)}", retryable=True
+            )
+        return [item["embedding"] for item in items]
+
+    async def _run_batch(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                         batch_number: int, indices: List[int], texts: List[str],
+                         result: EmbeddingResult) -> None:
+        """在並發上限內執行一個批次，含重試"""
+        inputs = [self._truncate(texts[i]) for i in indices]
+
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    vectors = await self._post_batch(session, inputs)
+                    for i, vector in zip(indices, vectors):
+                        result.embeddings[i] = vector
+                    return
+                except EmbeddingRequestError as e:
+                    if not e.retryable or attempt >= self.max_retries:
+                        logger.error(f"❌ Embedding 批次 {batch_number} 失敗（{len(indices)} 筆）: {e}")
+                        result.failed_indices.extend(indices)
+                        result.errors.append(f"batch {batch_number}: {e}")
+                        return
+
+                    delay = self._backoff_delay(attempt, e.retry_after)
+                    result.retry_count += 1
+                    logger.warning(f"⚠️ Embedding 批次 {batch_number} 第 {attempt + 1} 次重試，"
+                                   f"等待 {delay:.2f} 秒: {e}")
+                    await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str]) -> EmbeddingResult:
+        """
+        批次取得 embeddings
+
+        空字串不送出請求，對應結果為 None 但不視為失敗。
+
+        Args:
+            texts: 要向量化的文本列表
+
+        Returns:
+            EmbeddingResult，順序與輸入一致
+        """
+        result = EmbeddingResult(embeddings=[None] * len(texts))
+        texts = [str(text).strip() if text is not None else "" for text in texts]
+
+        batches = self._build_batches(texts)
+        result.batch_count = len(batches)
+        if not batches:
+            return result
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await asyncio.gather(*[
+                self._run_batch(session, semaphore, number, indices, texts, result)
+                for number, indices in enumerate(batches, 1)
+            ])
+
+        result.failed_indices.sort()
+        logger.info(f"✅ Embedding 完成: {len(texts)} 筆，{len(batches)} 批，"
+                    f"重試 {result.retry_count} 次，失敗 {len(result.failed_indices)} 筆")
+        return result
+
+
+_pipeline: Optional[EmbeddingPipeline] = None
+
+
+def get_embedding_pipeline() -> Optional[EmbeddingPipeline]:
+    """
+    取得全局 embedding 管線
+
+    讀取 EMBED_KEY / EMBED_END；EMBED_URL 可覆蓋完整請求 URL（例如指向本地 stub server），
+    EMBED_MAX_CONCURRENCY 可調整並發上限。
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    api_key = os.getenv("EMBED_KEY")
+    endpoint = os.getenv("EMBED_END")
+    endpoint_url = os.getenv("EMBED_URL")
+
+    if not api_key or not (endpoint or endpoint_url):
+        logger.warning("⚠️ 缺少 EMBED_KEY 或 EMBED_END 環境變數，embedding 管線不可用")
+        return None
+
+    _pipeline = EmbeddingPipeline(
+        api_key=api_key,
+        endpoint=endpoint or "",
+        endpoint_url=endpoint_url,
+        max_concurrency=int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+    )
+    return _pipeline
+
+
+async def embed_texts(texts: List[str]) -> EmbeddingResult:
+    """使用全局管線取得 embeddings；管線不可用時所有項目標記為失敗"""
+    pipeline = get_embedding_pipeline()
+    if pipeline is None:
+        indices = [i for i, text in enumerate(texts) if text and str(text).strip()]
+        return EmbeddingResult(
+            embeddings=[None] * len(texts),
+            failed_indices=indices,
+            errors=["embedding 管線未配置（缺少 EMBED_KEY / EMBED_END）"] if indices else []
+        )
+    return await pipeline.embed(texts)
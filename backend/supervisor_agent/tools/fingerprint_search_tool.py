@@ -13,12 +13,9 @@ from pathlib import Path
 import logging
 from datetime import datetime
 import re
-import math
 import time
 import asyncio
-from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
 
 # Azure OpenAI Embedding 配置
@@ -65,6 +62,8 @@ def embedder(query: str) -> List[float]:
         return []
 
 from supervisor_agent.core.session_data_manager import session_data_manager
+from supervisor_agent.tools.embedding_pipeline import EmbeddingResult, embed_texts
+from supervisor_agent.tools.search_index import bm25_component, search_index_cache
 
 logger = logging.getLogger(__name__)
 
@@ -88,41 +87,9 @@ class AdvancedFingerprintSearchEngine:
             'entity': 1.0
         }
 
-    def batch_embeddings(self, texts: List[str], batch_size: int = 35) -> List[List[float]]:
-        """批次處理 embeddings，提升速度"""
-        if not texts:
-            return []
-
-        all_embeddings = []
-
-        try:
-            # 分批處理
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-
-                # 調用 Azure OpenAI batch embedding
-                response = embed_client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=batch_texts
-                )
-
-                # 提取 embeddings
-                batch_embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(batch_embeddings)
-
-                logger.info(f"🔄 處理 embedding 批次 {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
-
-        except Exception as e:
-            logger.error(f"❌ 批次 embedding 失敗: {e}")
-            # 回退到逐一處理
-            for text in texts:
-                try:
-                    embedding = embedder(text)
-                    all_embeddings.append(embedding)
-                except:
-                    all_embeddings.append([0.0] * 1536)  # 預設維度
-
-        return all_embeddings
+    async def batch_embeddings(self, texts: List[str]) -> EmbeddingResult:
+        """批次處理 embeddings（共用非同步管線：並發上限、退避重試、失敗明確回報）"""
+        return await embed_texts(texts)
 
     async def expand_query_keywords(self, query: str) -> List[str]:
         """使用預定義規則擴展查詢關鍵字（暫時替代 LLM）"""
@@ -150,31 +117,6 @@ class AdvancedFingerprintSearchEngine:
         logger.info(f"🔍 查詢擴展: {query} -> {len(expanded_keywords)} 個關鍵字")
         return expanded_keywords
 
-    def calculate_bm25_score(self, query_terms: List[str], doc_terms: List[str],
-                           doc_length: int, avg_doc_length: float,
-                           corpus_size: int, term_doc_freq: Dict[str, int]) -> float:
-        """計算 BM25 分數"""
-        score = 0.0
-
-        for term in query_terms:
-            if term in doc_terms:
-                # Term frequency in document
-                tf = doc_terms.count(term)
-
-                # Document frequency (how many docs contain this term)
-                df = term_doc_freq.get(term, 1)
-
-                # Inverse document frequency
-                idf = math.log((corpus_size - df + 0.5) / (df + 0.5))
-
-                # BM25 formula
-                numerator = tf * (self.k1 + 1)
-                denominator = tf + self.k1 * (1 - self.b + self.b * (doc_length / avg_doc_length))
-
-                score += idf * (numerator / denominator)
-
-        return score
-
     def calculate_recency_score(self, date_str: str) -> float:
         """計算時間新近度分數"""
         try:
@@ -286,135 +228,23 @@ class AdvancedFingerprintSearchEngine:
         
         return entities
     
-    async def calculate_advanced_similarity(self, query: str, expanded_keywords: List[str],
-                                          doc_data: Dict[str, Any], corpus_stats: Dict[str, Any]) -> Dict[str, float]:
-        """
-        計算進階相似度分數 (標準化版本)
-        基於公式: 2.5×BM25_subject + 1.2×BM25_body + 1.5×cos(q,d) + 1.0×EntityMatch
-        所有分數都標準化到 0-1 範圍後再加權
-        """
-        scores = {}
-
-        # 準備查詢詞彙
-        query_terms = self._tokenize(' '.join(expanded_keywords))
-
-        # 1. BM25 for Subject
-        subject = doc_data.get('subject', '')
-        if subject:
-            subject_terms = self._tokenize(subject)
-            bm25_subject_raw = self.calculate_bm25_score(
-                query_terms, subject_terms, len(subject_terms),
-                corpus_stats['avg_subject_length'], corpus_stats['corpus_size'],
-                corpus_stats['subject_term_freq']
-            )
-            # 標準化 BM25 分數 (使用 sigmoid 函數)
-            scores['bm25_subject'] = self._normalize_bm25(bm25_subject_raw)
-        else:
-            scores['bm25_subject'] = 0.0
-
-        # 2. BM25 for Body/Content
-        content = doc_data.get('snippet', '') + ' ' + doc_data.get('content', '')
-        if content.strip():
-            content_terms = self._tokenize(content)
-            bm25_body_raw = self.calculate_bm25_score(
-                query_terms, content_terms, len(content_terms),
-                corpus_stats['avg_content_length'], corpus_stats['corpus_size'],
-                corpus_stats['content_term_freq']
-            )
-            # 標準化 BM25 分數
-            scores['bm25_body'] = self._normalize_bm25(bm25_body_raw)
-        else:
-            scores['bm25_body'] = 0.0
-
-        # 3. Semantic Similarity (已經是 0-1 範圍)
-        full_text = f"{subject} {content}".strip()
-        if full_text and self.embedder:
-            try:
-                doc_vector = self.embedder(full_text)
-                query_vector = self.embedder(query)
-
-                if doc_vector and query_vector:
-                    doc_vec = np.array(doc_vector).reshape(1, -1)
-                    query_vec = np.array(query_vector).reshape(1, -1)
-                    scores['semantic'] = cosine_similarity(query_vec, doc_vec)[0][0]
-                else:
-                    scores['semantic'] = 0.0
-            except Exception as e:
-                logger.warning(f"語義相似度計算失敗: {e}")
-                scores['semantic'] = 0.0
-        else:
-            scores['semantic'] = 0.0
-
-        # 4. Entity Match (已經是 0-1 範圍)
-        query_entities = self._extract_entities(query)
-        doc_entities = self._extract_entities(full_text)
-        scores['entity'] = self._calculate_entity_match(query_entities, doc_entities)
-
-        # 計算加權總分
-        total_score = (
-            self.weights['bm25_subject'] * scores['bm25_subject'] +
-            self.weights['bm25_body'] * scores['bm25_body'] +
-            self.weights['semantic'] * scores['semantic'] +
-            self.weights['entity'] * scores['entity']
-        )
-
-        # 返回詳細分數和總分
-        scores['total'] = total_score
-        return scores
-
-    def calculate_advanced_similarity_fast(self, query: str, expanded_keywords: List[str],
-                                         doc_data: Dict[str, Any], corpus_stats: Dict[str, Any],
-                                         query_embedding: List[float], doc_embedding: List[float]) -> Dict[str, float]:
+    def calculate_advanced_similarity_fast(self, bm25_subject_raw: float, bm25_body_raw: float,
+                                         semantic_sim: Optional[float],
+                                         query_entities: Dict[str, List[str]],
+                                         doc_entities: Dict[str, List[str]]) -> Dict[str, float]:
         """
-        快速計算進階相似度分數（使用預計算的 embeddings）
+        快速計算進階相似度分數（BM25、實體、語義相似度皆來自索引的批次計算）
         """
         scores = {}
 
-        # 準備查詢詞彙
-        query_terms = self._tokenize(' '.join(expanded_keywords))
+        # 1. BM25 for Subject / 2. BM25 for Body（分欄位統計由索引提供）
+        scores['bm25_subject'] = self._normalize_bm25(bm25_subject_raw)
+        scores['bm25_body'] = self._normalize_bm25(bm25_body_raw)
 
-        # 1. BM25 for Subject
-        subject = doc_data.get('subject', '')
-        if subject:
-            subject_terms = self._tokenize(subject)
-            bm25_subject_raw = self.calculate_bm25_score(
-                query_terms, subject_terms, len(subject_terms),
-                corpus_stats['avg_subject_length'], corpus_stats['corpus_size'],
-                corpus_stats['subject_term_freq']
-            )
-            scores['bm25_subject'] = self._normalize_bm25(bm25_subject_raw)
-        else:
-            scores['bm25_subject'] = 0.0
-
-        # 2. BM25 for Body/Content
-        content = doc_data.get('snippet', '') + ' ' + doc_data.get('content', '')
-        if content.strip():
-            content_terms = self._tokenize(content)
-            bm25_body_raw = self.calculate_bm25_score(
-                query_terms, content_terms, len(content_terms),
-                corpus_stats['avg_content_length'], corpus_stats['corpus_size'],
-                corpus_stats['content_term_freq']
-            )
-            scores['bm25_body'] = self._normalize_bm25(bm25_body_raw)
-        else:
-            scores['bm25_body'] = 0.0
-
-        # 3. Semantic Similarity（使用預計算的 embeddings）
-        if query_embedding and doc_embedding:
-            try:
-                query_vec = np.array(query_embedding).reshape(1, -1)
-                doc_vec = np.array(doc_embedding).reshape(1, -1)
-                scores['semantic'] = cosine_similarity(query_vec, doc_vec)[0][0]
-            except Exception as e:
-                logger.warning(f"語義相似度計算失敗: {e}")
-                scores['semantic'] = 0.0
-        else:
-            scores['semantic'] = 0.0
+        # 3. Semantic Similarity（缺少 embedding 時為 0）
+        scores['semantic'] = float(semantic_sim) if semantic_sim is not None else 0.0
 
         # 4. Entity Match
-        full_text = f"{subject} {content}".strip()
-        query_entities = self._extract_entities(query)
-        doc_entities = self._extract_entities(full_text)
         scores['entity'] = self._calculate_entity_match(query_entities, doc_entities)
 
         # 計算加權總分
@@ -516,19 +346,20 @@ class AdvancedFingerprintSearchEngine:
     
     async def search_csv(self, file_path: str, search_query: str,
                         similarity_threshold: float = 0.1,
-                        max_results: int = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
-        """在 CSV 文件中進行進階指紋搜尋（優化版）"""
+                        max_results: int = None,
+                        explain: bool = False) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        在 CSV 文件中進行進階指紋搜尋（優化版）
+
+        explain=True 時每筆結果附帶 _score_breakdown（subject/body BM25、語義、實體、擴展關鍵字貢獻），
+        可搭配 search_index.rescore_breakdown 離線調整權重
+        """
 
         start_time = time.time()
 
-        # 讀取 CSV 文件
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(file_path, encoding='big5')
-            except:
-                df = pd.read_csv(file_path, encoding='cp1252')
+        # 讀取 CSV 文件（檔案僅尾端追加時只解析新增資料列）
+        corpus = search_index_cache.load_corpus(file_path)
+        df = corpus.frame.copy()
 
         if df.empty:
             return df, {"total_processed": 0, "matches_found": 0}
@@ -539,53 +370,45 @@ class AdvancedFingerprintSearchEngine:
         expanded_keywords = await self.expand_query_keywords(search_query)
         logger.info(f"🔑 擴展關鍵字: {expanded_keywords[:5]}...")
 
-        # 2. 計算語料庫統計信息
-        corpus_stats = self._calculate_corpus_stats(df)
+        # 2. 文件實體、分欄位詞頻統計與 embeddings 快取於索引，追加資料時只處理新增部分
+        index = search_index_cache.get_or_build(
+            "gmail", corpus, ['subject', 'body'], self._build_index_documents,
+            self._tokenize, self._extract_entities
+        )
+        query_entities = self._extract_entities(search_query)
 
-        # 3. 批次處理 embeddings（性能優化關鍵！）
-        logger.info(f"🚀 開始批次 embedding 處理...")
+        # 3. 批次處理 embeddings：查詢 + 尚未向量化的文件
+        pending = index.pending_embeddings()
+        logger.info(f"🚀 開始批次 embedding 處理（新增 {len(pending)} 筆文件）...")
 
-        # 準備所有文本
-        all_texts = []
-        query_text = search_query
-
-        for _, row in df.iterrows():
-            subject = row.get('subject', '')
-            content = row.get('snippet', '') + ' ' + row.get('content', '')
-            full_text = f"{subject} {content}".strip()
-            all_texts.append(full_text)
-
-        # 批次獲取 embeddings（一次性處理所有文檔 + 查詢）
-        all_input_texts = [query_text] + all_texts
-        all_embeddings = self.batch_embeddings(all_input_texts, batch_size=35)
+        embedding_result = await self.batch_embeddings(
+            [search_query] + [index.doc_texts[i] for i in pending]
+        )
 
-        if not all_embeddings:
-            logger.error("❌ Embedding 處理失敗")
-            return df, {"total_processed": len(df), "matches_found": 0}
+        if embedding_result.failed_indices:
+            logger.warning(f"⚠️ {len(embedding_result.failed_indices)} 筆 embedding 失敗，"
+                           f"這些項目的語義分數將為 0")
 
-        # 分離查詢和文檔 embeddings
-        query_embedding = all_embeddings[0]
-        doc_embeddings = all_embeddings[1:]
+        # 分離查詢和文檔 embeddings（失敗項目為 None，下次查詢時重試）
+        query_embedding = embedding_result.embeddings[0]
+        index.set_embeddings(pending, embedding_result.embeddings[1:])
+        semantic_scores, has_embedding = index.semantic_scores(query_embedding)
 
         logger.info(f"✅ Embedding 完成，開始計算相似度...")
 
-        # 4. 並行計算相似度分數
+        # 4. 各欄位 BM25 只走訪查詢詞的倒排表，body 統計與評分使用相同文本（snippet + content）
+        query_terms = self._tokenize(' '.join(expanded_keywords))
+        subject_scores = index.bm25_field_scores('subject', query_terms, self.k1, self.b)
+        body_scores = index.bm25_field_scores('body', query_terms, self.k1, self.b)
+
         similarities = []
         detailed_scores = []
 
-        for i, (_, row) in enumerate(df.iterrows()):
-            doc_data = {
-                'subject': row.get('subject', ''),
-                'snippet': row.get('snippet', ''),
-                'content': row.get('content', ''),
-            }
-
-            # 使用預計算的 embeddings
-            doc_embedding = doc_embeddings[i] if i < len(doc_embeddings) else None
-
+        for i in range(len(df)):
             score_dict = self.calculate_advanced_similarity_fast(
-                search_query, expanded_keywords, doc_data, corpus_stats,
-                query_embedding, doc_embedding
+                subject_scores.get(i, 0.0), body_scores.get(i, 0.0),
+                semantic_scores[i] if has_embedding[i] else None,
+                query_entities, index.entities[i]
             )
 
             similarities.append(score_dict['total'])
@@ -593,13 +416,10 @@ class AdvancedFingerprintSearchEngine:
 
         # 5. 添加相似度分數和詳細分數
         df['_similarity_score'] = similarities
-
-        # 添加詳細分數欄位
-        for i, score_dict in enumerate(detailed_scores):
-            df.loc[i, '_bm25_subject'] = score_dict['bm25_subject']
-            df.loc[i, '_bm25_body'] = score_dict['bm25_body']
-            df.loc[i, '_semantic'] = score_dict['semantic']
-            df.loc[i, '_entity'] = score_dict['entity']
+        df['_bm25_subject'] = [score_dict['bm25_subject'] for score_dict in detailed_scores]
+        df['_bm25_body'] = [score_dict['bm25_body'] for score_dict in detailed_scores]
+        df['_semantic'] = [score_dict['semantic'] for score_dict in detailed_scores]
+        df['_entity'] = [score_dict['entity'] for score_dict in detailed_scores]
 
         # 6. 過濾和排序結果
         filtered_df = df[df['_similarity_score'] >= similarity_threshold]
@@ -609,6 +429,22 @@ class AdvancedFingerprintSearchEngine:
         if max_results and len(filtered_df) > max_results:
             filtered_df = filtered_df.head(max_results)
 
+        # 8. 分數說明：只為保留的結果組裝，擴展關鍵字貢獻 = 全部查詢詞 - 原始查詢詞（BM25 對詞項可加）
+        original_terms = self._tokenize(search_query)
+        expansion_terms = [term for term in dict.fromkeys(query_terms) if term not in set(original_terms)]
+        if explain and not filtered_df.empty:
+            original_subject = index.bm25_field_scores('subject', original_terms, self.k1, self.b)
+            original_body = index.bm25_field_scores('body', original_terms, self.k1, self.b)
+            filtered_df = filtered_df.copy()
+            filtered_df['_score_breakdown'] = [
+                self._build_score_breakdown(
+                    detailed_scores[i],
+                    (subject_scores.get(i, 0.0), original_subject.get(i, 0.0)),
+                    (body_scores.get(i, 0.0), original_body.get(i, 0.0))
+                )
+                for i in filtered_df.index
+            ]
+
         end_time = time.time()
         processing_time = end_time - start_time
 
@@ -617,11 +453,13 @@ class AdvancedFingerprintSearchEngine:
             "matches_found": len(filtered_df),
             "query": search_query,
             "expanded_keywords": expanded_keywords,
+            "expansion_terms": expansion_terms,
             "threshold": similarity_threshold,
             "max_results": max_results,
             "avg_similarity": filtered_df['_similarity_score'].mean() if not filtered_df.empty else 0,
             "score_distribution": self._analyze_score_distribution(similarities),
             "total_score": filtered_df['_similarity_score'].sum() if not filtered_df.empty else 0,
+            "embedding": embedding_result.summary(),
             "processing_time": processing_time
         }
 
@@ -629,41 +467,34 @@ class AdvancedFingerprintSearchEngine:
 
         return filtered_df, search_info
 
-    def _calculate_corpus_stats(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """計算語料庫統計信息，用於 BM25"""
-        corpus_size = len(df)
-
-        # Subject 統計
-        subjects = df['subject'].fillna('').astype(str)
-        subject_lengths = [len(self._tokenize(s)) for s in subjects]
-        avg_subject_length = np.mean(subject_lengths) if subject_lengths else 1.0
-
-        # Content 統計
-        contents = df['snippet'].fillna('').astype(str)
-        content_lengths = [len(self._tokenize(c)) for c in contents]
-        avg_content_length = np.mean(content_lengths) if content_lengths else 1.0
-
-        # Term frequency 統計
-        subject_term_freq = Counter()
-        content_term_freq = Counter()
+    def _build_score_breakdown(self, score_dict: Dict[str, float],
+                               subject_raw: Tuple[float, float],
+                               body_raw: Tuple[float, float]) -> Dict[str, Any]:
+        """由評分時已計算的數值組裝單筆結果的分數說明（raw 為 (全部查詢詞, 原始查詢詞) 的 BM25）"""
+        return {
+            "components": {
+                "bm25_subject": bm25_component(subject_raw[0], subject_raw[0] - subject_raw[1],
+                                               self.weights['bm25_subject']),
+                "bm25_body": bm25_component(body_raw[0], body_raw[0] - body_raw[1],
+                                            self.weights['bm25_body']),
+                "semantic": {"value": float(score_dict['semantic']), "weight": self.weights['semantic']},
+                "entity": {"value": float(score_dict['entity']), "weight": self.weights['entity']}
+            },
+            "total": float(score_dict['total'])
+        }
 
-        for subject in subjects:
-            terms = set(self._tokenize(subject))
-            for term in terms:
-                subject_term_freq[term] += 1
+    def _build_index_documents(self, df: pd.DataFrame) -> Tuple[List[Dict[str, str]], List[str]]:
+        """由資料列產生索引用的各欄位文本與完整文本"""
+        field_texts = []
+        all_texts = []
 
-        for content in contents:
-            terms = set(self._tokenize(content))
-            for term in terms:
-                content_term_freq[term] += 1
+        for _, row in df.iterrows():
+            subject = row.get('subject', '')
+            content = row.get('snippet', '') + ' ' + row.get('content', '')
+            field_texts.append({'subject': '' if pd.isna(subject) else str(subject), 'body': str(content)})
+            all_texts.append(f"{subject} {content}".strip())
 
-        return {
-            'corpus_size': corpus_size,
-            'avg_subject_length': avg_subject_length,
-            'avg_content_length': avg_content_length,
-            'subject_term_freq': dict(subject_term_freq),
-            'content_term_freq': dict(content_term_freq)
-        }
+        return field_texts, all_texts
 
     def _analyze_score_distribution(self, scores: List[float]) -> Dict[str, float]:
         """分析分數分佈"""
@@ -692,7 +523,8 @@ async def fingerprint_search_csv(
     session_id: str = "default",
     similarity_threshold: float = 0.1,
     max_results: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    explain: bool = False
 ) -> Dict[str, Any]:
     """
     使用指紋搜尋技術在 CSV 文件中搜尋相關內容
@@ -704,6 +536,7 @@ async def fingerprint_search_csv(
         similarity_threshold: 相似度閾值 (0.0-1.0)
         max_results: 最大返回結果數 (None 表示不限制)
         save_results: 是否保存結果到檔案
+        explain: 是否在樣本結果附帶分數說明（結果檔案中以 JSON 字串保存於 _score_breakdown 欄位）
         
     Returns:
         搜尋結果的字典
@@ -720,7 +553,7 @@ async def fingerprint_search_csv(
         
         # 執行搜尋
         result_df, search_info = await search_engine.search_csv(
-            file_path, search_query, similarity_threshold, max_results
+            file_path, search_query, similarity_threshold, max_results, explain=explain
         )
         
         # 準備結果
@@ -731,8 +564,12 @@ async def fingerprint_search_csv(
             filename = f"fingerprint_search_{timestamp}.csv"
             results_file = session_data_manager.get_temp_file_path(session_id, filename)
             
-            # 保存結果
-            result_df.to_csv(results_file, index=False, encoding='utf-8-sig')
+            # 保存結果（分數說明序列化為 JSON 字串）
+            saved_df = result_df
+            if '_score_breakdown' in saved_df.columns:
+                saved_df = saved_df.assign(_score_breakdown=saved_df['_score_breakdown'].map(
+                    lambda breakdown: json.dumps(breakdown, ensure_ascii=False)))
+            saved_df.to_csv(results_file, index=False, encoding='utf-8-sig')
             logger.info(f"✅ 搜尋結果已保存到: {results_file}")
         
         # 準備樣本結果
@@ -740,10 +577,13 @@ async def fingerprint_search_csv(
         if not result_df.empty:
             sample_df = result_df.head(5)
             for _, row in sample_df.iterrows():
-                sample_results.append({
+                sample = {
                     "similarity_score": round(row.get('_similarity_score', 0), 4),
-                    "data": row.drop('_similarity_score').to_dict()
-                })
+                    "data": row.drop([col for col in ('_similarity_score', '_score_breakdown') if col in row.index]).to_dict()
+                }
+                if explain:
+                    sample["score_breakdown"] = row.get('_score_breakdown')
+                sample_results.append(sample)
         
         return {
             "success": True,
@@ -7,18 +7,14 @@ import os
 import sys
 import json
 import pandas as pd
-import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import logging
 from datetime import datetime
 import re
-import math
 import time
 import asyncio
-from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
 
 # Azure OpenAI Embedding 配置
@@ -61,6 +57,8 @@ def embedder(query: str) -> List[float]:
         return []
 
 from supervisor_agent.core.session_data_manager import session_data_manager
+from supervisor_agent.tools.embedding_pipeline import EmbeddingResult, embed_texts
+from supervisor_agent.tools.search_index import bm25_component, search_index_cache
 
 logger = logging.getLogger(__name__)
 
@@ -78,37 +76,18 @@ class FlexibleFingerprintSearchEngine:
 
         # 評分權重 (可動態調整)
         self.weights = {
-            'bm25_primary': 2.5,    # 主要欄位權重
-            'bm25_secondary': 1.2,  # 次要欄位權重
+            'bm25f': 3.7,           # 多欄位 BM25F（原主要 2.5 + 次要 1.2，維持總分尺度）
             'semantic': 1.5,
             'entity': 1.0
         }
 
-    async def batch_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """批次處理 embeddings 以提高性能"""
-        all_embeddings = []
-        
-        try:
-            # 批次處理所有文本
-            if embed_client and texts:
-                response = embed_client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=texts
-                )
-                all_embeddings = [data.embedding for data in response.data]
-                logger.info(f"✅ 批次 embedding 成功，處理 {len(texts)} 個文本")
-
-        except Exception as e:
-            logger.error(f"❌ 批次 embedding 失敗: {e}")
-            # 回退到逐一處理
-            for text in texts:
-                try:
-                    embedding = embedder(text)
-                    all_embeddings.append(embedding)
-                except:
-                    all_embeddings.append([0.0] * 1536)  # 預設維度
-
-        return all_embeddings
+        # BM25F 預設欄位權重：第一個欄位為主要欄位，其餘為次要欄位
+        self.primary_field_weight = 2.5
+        self.secondary_field_weight = 1.2
+
+    async def batch_embeddings(self, texts: List[str]) -> EmbeddingResult:
+        """批次處理 embeddings（共用非同步管線：並發上限、退避重試、失敗明確回報）"""
+        return await embed_texts(texts)
 
     async def expand_query_keywords(self, query: str) -> List[str]:
         """使用預定義規則擴展查詢關鍵字"""
@@ -178,29 +157,6 @@ class FlexibleFingerprintSearchEngine:
         
         return entities
 
-    def calculate_bm25_score(self, query_terms: List[str], doc_terms: List[str], 
-                           doc_length: int, avg_doc_length: float, 
-                           corpus_size: int, term_freq: Dict[str, int]) -> float:
-        """計算 BM25 分數"""
-        if not query_terms or not doc_terms:
-            return 0.0
-        
-        doc_term_freq = Counter(doc_terms)
-        score = 0.0
-        
-        for term in query_terms:
-            if term in doc_term_freq:
-                tf = doc_term_freq[term]
-                df = term_freq.get(term, 1)
-                idf = math.log((corpus_size - df + 0.5) / (df + 0.5))
-                
-                numerator = tf * (self.k1 + 1)
-                denominator = tf + self.k1 * (1 - self.b + self.b * (doc_length / avg_doc_length))
-                
-                score += idf * (numerator / denominator)
-        
-        return max(0.0, score)
-
     def _normalize_bm25(self, bm25_score: float, max_expected: float = 8.0) -> float:
         """線性標準化 BM25 分數到 0-1 範圍"""
         if bm25_score <= 0:
@@ -226,22 +182,33 @@ class FlexibleFingerprintSearchEngine:
 
         return total_matches / total_query_entities if total_query_entities > 0 else 0.0
 
+    def resolve_field_weights(self, search_columns: List[str],
+                              field_weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """決定各欄位的 BM25F 權重（未指定的欄位使用主要/次要預設值）"""
+        resolved = {}
+        for position, col in enumerate(search_columns):
+            default = self.primary_field_weight if position == 0 else self.secondary_field_weight
+            resolved[col] = float(field_weights.get(col, default)) if field_weights else default
+        return resolved
+
     async def search_csv_flexible(self, file_path: str, search_query: str,
                                 search_columns: List[str],
                                 similarity_threshold: float = 0.1,
-                                max_results: int = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
-        """在 CSV 文件中進行靈活的指紋搜尋"""
+                                max_results: int = None,
+                                field_weights: Optional[Dict[str, float]] = None,
+                                explain: bool = False) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        在 CSV 文件中進行靈活的指紋搜尋
+
+        explain=True 時每筆結果附帶 _score_breakdown（各欄位 BM25F、語義、實體、擴展關鍵字貢獻），
+        可搭配 search_index.rescore_breakdown 離線調整權重
+        """
 
         start_time = time.time()
 
-        # 讀取 CSV 文件
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(file_path, encoding='big5')
-            except:
-                df = pd.read_csv(file_path, encoding='cp1252')
+        # 讀取 CSV 文件（檔案僅尾端追加時只解析新增資料列）
+        corpus = search_index_cache.load_corpus(file_path)
+        df = corpus.frame.copy()
 
         if df.empty:
             return df, {"total_processed": 0, "matches_found": 0}
@@ -262,44 +229,46 @@ class FlexibleFingerprintSearchEngine:
         expanded_keywords = await self.expand_query_keywords(search_query)
         logger.info(f"🔑 擴展關鍵字: {expanded_keywords[:5]}...")
 
-        # 2. 計算語料庫統計信息
-        corpus_stats = self._calculate_corpus_stats_flexible(df, search_columns)
-
-        # 3. 批次處理 embeddings
-        logger.info(f"🚀 開始批次 embedding 處理...")
+        # 2. 文件實體、分欄位詞頻統計與 embeddings 快取於索引，追加資料時只處理新增部分
+        index = search_index_cache.get_or_build(
+            "flexible", corpus, search_columns,
+            lambda frame: self._build_index_documents(frame, search_columns),
+            self._tokenize, self._extract_entities
+        )
+        query_entities = self._extract_entities(search_query)
 
-        # 準備所有文本
-        all_texts = []
-        query_text = search_query
+        # 3. 批次處理 embeddings：查詢 + 尚未向量化的文件
+        pending = index.pending_embeddings()
+        logger.info(f"🚀 開始批次 embedding 處理（新增 {len(pending)} 筆文件）...")
 
-        for _, row in df.iterrows():
-            # 合併指定欄位的內容
-            combined_text = ' '.join([str(row.get(col, '')) for col in search_columns])
-            all_texts.append(combined_text.strip())
+        embedding_result = await self.batch_embeddings(
+            [search_query] + [index.doc_texts[i] for i in pending]
+        )
 
-        # 批次處理 embeddings
-        all_texts_with_query = [query_text] + all_texts
-        all_embeddings = await self.batch_embeddings(all_texts_with_query)
+        if embedding_result.failed_indices:
+            logger.warning(f"⚠️ {len(embedding_result.failed_indices)} 筆 embedding 失敗，"
+                           f"這些項目的語義分數將為 0")
 
-        # 分離查詢和文檔 embeddings
-        query_embedding = all_embeddings[0] if all_embeddings else []
-        doc_embeddings = all_embeddings[1:] if len(all_embeddings) > 1 else []
+        # 分離查詢和文檔 embeddings（失敗項目為 None，下次查詢時重試）
+        query_embedding = embedding_result.embeddings[0]
+        index.set_embeddings(pending, embedding_result.embeddings[1:])
+        semantic_scores, has_embedding = index.semantic_scores(query_embedding)
 
         logger.info(f"✅ Embedding 完成，開始計算相似度...")
 
-        # 4. 並行計算相似度分數
+        # 4. BM25F 只走訪查詢詞的倒排表
+        resolved_weights = self.resolve_field_weights(search_columns, field_weights)
+        query_terms = self._tokenize(' '.join(expanded_keywords))
+        bm25f_scores = index.bm25f_scores(query_terms, resolved_weights, self.k1, self.b)
+
         similarities = []
         detailed_scores = []
 
-        for i, (_, row) in enumerate(df.iterrows()):
-            doc_data = {col: row.get(col, '') for col in search_columns}
-
-            # 使用預計算的 embeddings
-            doc_embedding = doc_embeddings[i] if i < len(doc_embeddings) else []
-
+        for i in range(len(df)):
             score_dict = self.calculate_flexible_similarity(
-                search_query, expanded_keywords, doc_data, corpus_stats,
-                query_embedding, doc_embedding, search_columns
+                bm25f_scores.get(i, {}),
+                semantic_scores[i] if has_embedding[i] else None,
+                query_entities, index.entities[i]
             )
 
             similarities.append(score_dict['total'])
@@ -307,13 +276,19 @@ class FlexibleFingerprintSearchEngine:
 
         # 5. 添加相似度分數和詳細分數
         df['_similarity_score'] = similarities
-
-        # 添加詳細分數欄位
-        for i, score_dict in enumerate(detailed_scores):
-            df.loc[i, '_bm25_primary'] = score_dict.get('bm25_primary', 0)
-            df.loc[i, '_bm25_secondary'] = score_dict.get('bm25_secondary', 0)
-            df.loc[i, '_semantic'] = score_dict.get('semantic', 0)
-            df.loc[i, '_entity'] = score_dict.get('entity', 0)
+        df['_bm25f'] = [score_dict['bm25f'] for score_dict in detailed_scores]
+        # 相容舊版明細欄位：BM25F 分數中主要欄位（第一個搜尋欄位）與其餘欄位的貢獻
+        primary_col = search_columns[0]
+        df['_bm25_primary'] = [
+            self._normalize_bm25(bm25f_scores.get(i, {}).get(primary_col, 0.0)) for i in range(len(df))
+        ]
+        df['_bm25_secondary'] = [
+            self._normalize_bm25(sum(value for field_name, value in bm25f_scores.get(i, {}).items()
+                                     if field_name != primary_col))
+            for i in range(len(df))
+        ]
+        df['_semantic'] = [score_dict['semantic'] for score_dict in detailed_scores]
+        df['_entity'] = [score_dict['entity'] for score_dict in detailed_scores]
 
         # 6. 過濾和排序結果
         filtered_df = df[df['_similarity_score'] >= similarity_threshold]
@@ -323,6 +298,17 @@ class FlexibleFingerprintSearchEngine:
         if max_results and len(filtered_df) > max_results:
             filtered_df = filtered_df.head(max_results)
 
+        # 8. 分數說明：只為保留的結果組裝，擴展關鍵字貢獻 = 全部查詢詞 - 原始查詢詞（BM25F 對詞項可加）
+        original_terms = self._tokenize(search_query)
+        expansion_terms = [term for term in dict.fromkeys(query_terms) if term not in set(original_terms)]
+        if explain and not filtered_df.empty:
+            original_scores = index.bm25f_scores(original_terms, resolved_weights, self.k1, self.b)
+            filtered_df = filtered_df.copy()
+            filtered_df['_score_breakdown'] = [
+                self._build_score_breakdown(detailed_scores[i], bm25f_scores.get(i, {}), original_scores.get(i, {}))
+                for i in filtered_df.index
+            ]
+
         end_time = time.time()
         processing_time = end_time - start_time
 
@@ -331,11 +317,14 @@ class FlexibleFingerprintSearchEngine:
             "matches_found": len(filtered_df),
             "query": search_query,
             "search_columns": search_columns,
+            "field_weights": resolved_weights,
             "expanded_keywords": expanded_keywords,
+            "expansion_terms": expansion_terms,
             "threshold": similarity_threshold,
             "max_results": max_results,
             "avg_similarity": filtered_df['_similarity_score'].mean() if not filtered_df.empty else 0,
             "total_score": filtered_df['_similarity_score'].sum() if not filtered_df.empty else 0,
+            "embedding": embedding_result.summary(),
             "processing_time": processing_time
         }
 
@@ -343,107 +332,63 @@ class FlexibleFingerprintSearchEngine:
 
         return filtered_df, search_info
 
-    def _calculate_corpus_stats_flexible(self, df: pd.DataFrame, search_columns: List[str]) -> Dict[str, Any]:
-        """計算語料庫統計信息（靈活版本）"""
-        corpus_size = len(df)
-
-        # 計算每個欄位的平均長度和詞頻
-        column_stats = {}
-
-        for col in search_columns:
-            contents = df[col].fillna('').astype(str).tolist()
-            lengths = [len(self._tokenize(content)) for content in contents]
-            avg_length = sum(lengths) / len(lengths) if lengths else 0
-
-            # 計算詞頻
-            term_freq = Counter()
-            for content in contents:
-                terms = set(self._tokenize(content))
-                for term in terms:
-                    term_freq[term] += 1
-
-            column_stats[col] = {
-                'avg_length': avg_length,
-                'term_freq': dict(term_freq)
-            }
-
+    def _build_score_breakdown(self, score_dict: Dict[str, float], bm25f_fields: Dict[str, float],
+                               original_fields: Dict[str, float]) -> Dict[str, Any]:
+        """由評分時已計算的數值組裝單筆結果的分數說明"""
+        bm25f_raw = sum(bm25f_fields.values())
         return {
-            'corpus_size': corpus_size,
-            'column_stats': column_stats
+            "components": {
+                "bm25f": bm25_component(bm25f_raw, bm25f_raw - sum(original_fields.values()),
+                                        self.weights['bm25f'], fields=bm25f_fields),
+                "semantic": {"value": float(score_dict['semantic']), "weight": self.weights['semantic']},
+                "entity": {"value": float(score_dict['entity']), "weight": self.weights['entity']}
+            },
+            "total": float(score_dict['total'])
         }
 
-    def calculate_flexible_similarity(self, query: str, expanded_keywords: List[str],
-                                    doc_data: Dict[str, str], corpus_stats: Dict[str, Any],
-                                    query_embedding: List[float], doc_embedding: List[float],
-                                    search_columns: List[str]) -> Dict[str, float]:
-        """計算靈活的相似度分數"""
-        scores = {}
+    def _build_index_documents(self, df: pd.DataFrame,
+                               search_columns: List[str]) -> Tuple[List[Dict[str, str]], List[str]]:
+        """由資料列產生索引用的各欄位文本與完整文本"""
+        field_texts = []
+        all_texts = []
 
-        # 準備查詢詞彙
-        query_terms = self._tokenize(' '.join(expanded_keywords))
+        for _, row in df.iterrows():
+            field_texts.append({
+                col: '' if pd.isna(row.get(col, '')) else str(row.get(col, '')) for col in search_columns
+            })
+            # 合併指定欄位的內容
+            combined_text = ' '.join([str(row.get(col, '')) for col in search_columns])
+            all_texts.append(combined_text.strip())
+
+        return field_texts, all_texts
+
+    def calculate_flexible_similarity(self, bm25f_fields: Dict[str, float],
+                                    semantic_sim: Optional[float],
+                                    query_entities: Dict[str, List[str]],
+                                    doc_entities: Dict[str, List[str]]) -> Dict[str, float]:
+        """
+        計算靈活的相似度分數
+
+        Args:
+            bm25f_fields: 索引計算的 BM25F 各欄位貢獻
+            semantic_sim: 索引批次計算的 cosine 相似度（缺少 embedding 時為 None）
+            query_entities: 查詢實體
+            doc_entities: 索引預先抽取的文件實體
+        """
+        scores = {}
 
-        # 1. 計算每個欄位的 BM25 分數
-        primary_col = search_columns[0] if search_columns else None
-        secondary_cols = search_columns[1:] if len(search_columns) > 1 else []
-
-        # 主要欄位 BM25
-        if primary_col and primary_col in doc_data:
-            primary_content = doc_data[primary_col]
-            if primary_content:
-                primary_terms = self._tokenize(primary_content)
-                primary_stats = corpus_stats['column_stats'].get(primary_col, {})
-                bm25_primary_raw = self.calculate_bm25_score(
-                    query_terms, primary_terms, len(primary_terms),
-                    primary_stats.get('avg_length', 1), corpus_stats['corpus_size'],
-                    primary_stats.get('term_freq', {})
-                )
-                scores['bm25_primary'] = self._normalize_bm25(bm25_primary_raw)
-            else:
-                scores['bm25_primary'] = 0.0
-        else:
-            scores['bm25_primary'] = 0.0
-
-        # 次要欄位 BM25（合併所有次要欄位）
-        if secondary_cols:
-            secondary_content = ' '.join([str(doc_data.get(col, '')) for col in secondary_cols])
-            if secondary_content.strip():
-                secondary_terms = self._tokenize(secondary_content)
-                # 使用第一個次要欄位的統計信息作為代表
-                secondary_stats = corpus_stats['column_stats'].get(secondary_cols[0], {})
-                bm25_secondary_raw = self.calculate_bm25_score(
-                    query_terms, secondary_terms, len(secondary_terms),
-                    secondary_stats.get('avg_length', 1), corpus_stats['corpus_size'],
-                    secondary_stats.get('term_freq', {})
-                )
-                scores['bm25_secondary'] = self._normalize_bm25(bm25_secondary_raw)
-            else:
-                scores['bm25_secondary'] = 0.0
-        else:
-            scores['bm25_secondary'] = 0.0
+        # 1. 多欄位 BM25F
+        scores['bm25f'] = self._normalize_bm25(sum(bm25f_fields.values()))
 
         # 2. 語義相似度
-        if query_embedding and doc_embedding and len(query_embedding) == len(doc_embedding):
-            try:
-                query_vec = np.array(query_embedding).reshape(1, -1)
-                doc_vec = np.array(doc_embedding).reshape(1, -1)
-                semantic_sim = cosine_similarity(query_vec, doc_vec)[0][0]
-                scores['semantic'] = max(0.0, semantic_sim)
-            except Exception as e:
-                logger.warning(f"語義相似度計算失敗: {e}")
-                scores['semantic'] = 0.0
-        else:
-            scores['semantic'] = 0.0
+        scores['semantic'] = max(0.0, float(semantic_sim)) if semantic_sim is not None else 0.0
 
         # 3. 實體匹配
-        full_text = ' '.join([str(doc_data.get(col, '')) for col in search_columns])
-        query_entities = self._extract_entities(query)
-        doc_entities = self._extract_entities(full_text)
         scores['entity'] = self._calculate_entity_match(query_entities, doc_entities)
 
         # 計算加權總分
         total_score = (
-            self.weights['bm25_primary'] * scores['bm25_primary'] +
-            self.weights['bm25_secondary'] * scores['bm25_secondary'] +
+            self.weights['bm25f'] * scores['bm25f'] +
             self.weights['semantic'] * scores['semantic'] +
             self.weights['entity'] * scores['entity']
         )
@@ -463,7 +408,9 @@ async def flexible_fingerprint_search_csv(
     session_id: str = "default",
     similarity_threshold: float = 0.1,
     max_results: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    field_weights: Optional[Dict[str, float]] = None,
+    explain: bool = False
 ) -> Dict[str, Any]:
     """
     使用靈活指紋搜尋技術在 CSV 文件中搜尋相關內容
@@ -476,6 +423,8 @@ async def flexible_fingerprint_search_csv(
         similarity_threshold: 相似度閾值 (0.0-1.0)
         max_results: 最大返回結果數 (None 表示不限制)
         save_results: 是否保存結果到檔案
+        field_weights: 各欄位的 BM25F 權重（未指定時第一欄 2.5、其餘 1.2）
+        explain: 是否在樣本結果附帶分數說明（結果檔案中以 JSON 字串保存於 _score_breakdown 欄位）
 
     Returns:
         搜尋結果的字典
@@ -492,7 +441,8 @@ async def flexible_fingerprint_search_csv(
 
         # 執行搜尋
         result_df, search_info = await flexible_search_engine.search_csv_flexible(
-            file_path, search_query, search_columns, similarity_threshold, max_results
+            file_path, search_query, search_columns, similarity_threshold, max_results,
+            field_weights=field_weights, explain=explain
         )
 
         # 準備結果
@@ -503,8 +453,12 @@ async def flexible_fingerprint_search_csv(
             filename = f"flexible_fingerprint_search_{timestamp}.csv"
             results_file = session_data_manager.get_temp_file_path(session_id, filename)
 
-            # 保存結果
-            result_df.to_csv(results_file, index=False, encoding='utf-8-sig')
+            # 保存結果（分數說明序列化為 JSON 字串）
+            saved_df = result_df
+            if '_score_breakdown' in saved_df.columns:
+                saved_df = saved_df.assign(_score_breakdown=saved_df['_score_breakdown'].map(
+                    lambda breakdown: json.dumps(breakdown, ensure_ascii=False)))
+            saved_df.to_csv(results_file, index=False, encoding='utf-8-sig')
             logger.info(f"✅ 搜尋結果已保存到: {results_file}")
 
         # 準備樣本結果
@@ -514,10 +468,13 @@ async def flexible_fingerprint_search_csv(
             for _, row in sample_df.iterrows():
                 # 移除內部評分欄位
                 clean_row = row.drop([col for col in row.index if col.startswith('_')])
-                sample_results.append({
+                sample = {
                     "similarity_score": round(row.get('_similarity_score', 0), 4),
                     "data": clean_row.to_dict()
-                })
+                }
+                if explain:
+                    sample["score_breakdown"] = row.get('_score_breakdown')
+                sample_results.append(sample)
 
         return {
             "success": True,
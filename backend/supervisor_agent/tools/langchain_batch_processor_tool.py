@@ -6,7 +6,8 @@
 
 import json
 import asyncio
-from typing import Dict, Any, List, Optional, Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 from langchain_core.tools import tool
 
 import logging
@@ -18,24 +19,19 @@ current_dir = Path(__file__).parent
 src_dir = current_dir.parent.parent / "src"
 sys.path.insert(0, str(src_dir))
 
-try:
-    from task_memory.task_memory_manager import TaskMemoryManager
-    task_memory_manager = TaskMemoryManager()
-except ImportError:
-    # 如果導入失敗，創建一個簡化的替代品
-    class SimpleTaskMemoryManager:
-        def __init__(self):
-            self.storage = None  # 設置為None而不是boolean
+from task_memory.item_processor import process_single_item, run_item_in_process, is_write_instruction
+from task_memory.task_memory_manager import TaskMemoryManager, ResultLogCompactor, make_task_id
+from task_memory.progress_tracker import TaskStatus
 
-        async def create_batch_task(self, session_id, task_id, items, batch_size):
-            return {"task_id": task_id, "total_items": len(items), "batch_size": batch_size}
+task_memory_manager = TaskMemoryManager()
 
-        async def save_batch_result(self, session_id, task_id, result):
-            return True
+logger = logging.getLogger(__name__)
 
-    task_memory_manager = SimpleTaskMemoryManager()
+# 最終報告與狀態中內嵌的結果數量上限，完整結果在結果日誌中
+RESULT_PREVIEW_LIMIT = 100
 
-logger = logging.getLogger(__name__)
+# 支援的執行模式：async 適合 I/O 密集工作，process 適合 CPU 密集工作
+EXECUTION_MODES = ("async", "process")
 
 
 @tool
@@ -45,7 +41,10 @@ async def smart_batch_processor_tool(
     data_items: List[Any],
     processing_instruction: str,
     batch_size: int = 50,
-    use_file_backup: bool = True
+    use_file_backup: bool = True,
+    max_concurrency: int = 4,
+    execution_mode: str = "async",
+    resume: bool = True
 ) -> str:
     """
     智能批次處理工具 - 自動處理大量數據的核心工具
@@ -56,6 +55,7 @@ async def smart_batch_processor_tool(
     3. 保存中間結果到 tmp 空間
     4. 管理Token使用，只保留進度信息
     5. 生成最終報告
+    6. 相同任務（會話、描述、指令與項目皆相同）中斷後重新呼叫時，從上次完成的位置繼續
 
     Args:
         session_id: 會話ID
@@ -64,13 +64,32 @@ async def smart_batch_processor_tool(
         processing_instruction: 每個項目的處理指令
         batch_size: 每批處理的數量，默認50
         use_file_backup: 是否在編輯前備份文件，默認True
+        max_concurrency: 同時處理的項目數上限（所有批次共用同一個並發池），默認4
+        execution_mode: "async"（I/O 密集，協程並發）或 "process"（CPU 密集，進程池），默認 "async"
+        resume: 是否恢復未完成的相同任務，默認True；False 時清除舊進度重新開始
 
     Returns:
         處理結果的JSON字符串
     """
+    executor = None
     try:
         total_items = len(data_items)
 
+        if execution_mode not in EXECUTION_MODES:
+            return json.dumps({
+                "success": False,
+                "error": f"不支援的執行模式: {execution_mode}，可用: {', '.join(EXECUTION_MODES)}"
+            }, ensure_ascii=False)
+        max_concurrency = max(1, int(max_concurrency))
+
+        # 寫入類任務對同一檔案的結果順序敏感，維持逐項處理
+        if max_concurrency > 1 and is_write_instruction(processing_instruction):
+            logger.info("📝 寫入類任務需保持項目順序，改為逐項處理")
+            max_concurrency = 1
+
+        if execution_mode == "process" and max_concurrency > 1:
+            executor = ProcessPoolExecutor(max_workers=max_concurrency)
+
         # 創建備份目錄
         import os
         import shutil
@@ -113,59 +132,74 @@ async def smart_batch_processor_tool(
             "backup_dir": backup_dir,
             "total_items": total_items
         }
-        task_id = f"batch_task_{session_id}_{hash(task_description) % 10000}"
+        # 任務ID由會話、描述、指令與項目內容決定，跨進程穩定，重新呼叫時可找回進度
+        task_id = make_task_id(
+            session_id, task_description,
+            {"instruction": processing_instruction, "items": data_items}
+        )
+        storage = getattr(task_memory_manager, 'storage', None)
+        tracker = getattr(task_memory_manager, 'tracker', None)
         
         logger.info(f"🚀 開始智能批次處理: {task_description}")
-        logger.info(f"📊 總項目數: {total_items}, 批次大小: {batch_size}")
+        logger.info(f"📊 總項目數: {total_items}, 批次大小: {batch_size}, "
+                    f"並發數: {max_concurrency} ({execution_mode})")
         
-        # 步驟1: 創建批次任務
-        task_info = await task_memory_manager.create_batch_task(
-            session_id=session_id,
-            task_id=task_id,
-            items=data_items,
-            batch_size=batch_size
-        )
+        # 步驟1: 恢復未完成的任務，或創建新的批次任務
+        results_log_id = f"accumulated_results_{task_id}"
+        resume_state = _load_resume_state(session_id, task_id, total_items) if resume and storage else None
+
+        if resume_state:
+            logger.info(f"♻️ 恢復任務 {task_id}: 已完成 {resume_state['total_processed']}/{total_items}")
+        else:
+            if storage:
+                storage.delete_result_log(session_id, results_log_id)
+            task_info = await task_memory_manager.create_batch_task(
+                session_id=session_id,
+                task_id=task_id,
+                items=data_items,
+                batch_size=batch_size,
+                task_description=task_description
+            )
+        if tracker:
+            tracker.set_task_status(session_id, task_id, TaskStatus.RUNNING)
         
-        # 步驟2: 初始化結果累積器
-        accumulated_results = []
+        # 步驟2: 初始化結果累積器（完整結果追加至日誌，記憶體只保留預覽）
+        resume_state = resume_state or {}
+        resumed_from = resume_state.get("total_processed", 0)
+        result_preview = resume_state.get("accumulated_results", [])
         batch_summaries = []
-        total_success = 0
-        total_errors = 0
+        total_success = resume_state.get("success_count", 0)
+        total_errors = resume_state.get("error_count", 0)
+        completed_batches = resume_state.get("completed_batches", 0)
         
-        # 步驟3: 循環處理每個批次
+        # 步驟3: 從上次完成的位置開始，以單一並發池處理所有剩餘項目；
+        # 批次只作為完成後的記帳單位，依批次順序保存結果並更新進度
         total_batches = (total_items + batch_size - 1) // batch_size
-        
-        for batch_num in range(1, total_batches + 1):
-            start_idx = (batch_num - 1) * batch_size
-            end_idx = min(start_idx + batch_size, total_items)
-            current_batch = data_items[start_idx:end_idx]
-            
-            logger.info(f"🔄 處理批次 {batch_num}/{total_batches} (項目 {start_idx+1}-{end_idx})")
-            
+        compactor = ResultLogCompactor(storage, session_id, results_log_id, key_field="global_index") \
+            if storage else None
+
+        async def on_batch_complete(batch_num: int, start_idx: int, batch_results: Dict[str, Any]) -> None:
+            nonlocal total_success, total_errors, completed_batches
+            end_idx = start_idx + len(batch_results["items"])
+
             try:
-                # 處理當前批次
-                batch_results = await _process_single_batch(
-                    batch_data=current_batch,
-                    batch_number=batch_num,
-                    processing_instruction=processing_instruction,
-                    task_description=task_description
-                )
-                
                 # 累積結果
-                accumulated_results.extend(batch_results["items"])
+                if len(result_preview) < RESULT_PREVIEW_LIMIT:
+                    result_preview.extend(batch_results["items"][:RESULT_PREVIEW_LIMIT - len(result_preview)])
                 batch_summaries.append(batch_results["summary"])
+                completed_batches += 1
                 total_success += batch_results["success_count"]
                 total_errors += batch_results["error_count"]
-                
-                # 保存中間結果到 tmp 空間
+
+                # 保存中間結果到 tmp 空間（以任務ID區分，避免不同任務互相覆蓋）
                 try:
                     if hasattr(task_memory_manager, 'storage') and task_memory_manager.storage:
                         task_memory_manager.storage.save_temp_data(
                             session_id,
-                            f"batch_{batch_num}_results",
+                            f"batch_{batch_num}_results_{task_id}",
                             {
                                 "batch_number": batch_num,
-                                "items_processed": len(current_batch),
+                                "items_processed": len(batch_results["items"]),
                                 "results": batch_results["items"],
                                 "summary": batch_results["summary"],
                                 "timestamp": batch_results["timestamp"]
@@ -174,9 +208,18 @@ async def smart_batch_processor_tool(
                 except Exception as e:
                     logger.warning(f"⚠️ 保存中間結果失敗: {e}")
 
-                # 保存累積結果
+                # 保存累積結果：結果追加至日誌，進度摘要維持小型 JSON
                 try:
                     if hasattr(task_memory_manager, 'storage') and task_memory_manager.storage:
+                        task_memory_manager.storage.append_result_log(
+                            session_id,
+                            results_log_id,
+                            [
+                                {**item, "global_index": start_idx + item["item_index"], "batch_number": batch_num}
+                                for item in batch_results["items"]
+                            ]
+                        )
+                        compactor.record_appended(len(batch_results["items"]))
                         task_memory_manager.storage.save_temp_data(
                             session_id,
                             f"accumulated_results_{task_id}",
@@ -184,48 +227,78 @@ async def smart_batch_processor_tool(
                                 "total_processed": end_idx,
                                 "total_items": total_items,
                                 "completion_percentage": (end_idx / total_items) * 100,
-                                "accumulated_results": accumulated_results,
-                                "batch_summaries": batch_summaries,
+                                "results_log": results_log_id,
+                                "accumulated_results": result_preview,
+                                "last_batch_summary": batch_results["summary"],
+                                "completed_batches": completed_batches,
                                 "success_count": total_success,
                                 "error_count": total_errors
                             }
                         )
+                    # 進度寫入任務狀態，供 find_resumable_task 判斷是否可恢復
+                    if tracker:
+                        tracker.update_progress(
+                            session_id, task_id,
+                            processed_items=end_idx,
+                            current_batch=batch_num,
+                            success_count=total_success,
+                            error_count=total_errors
+                        )
                 except Exception as e:
                     logger.warning(f"⚠️ 保存累積結果失敗: {e}")
-                
-                logger.info(f"✅ 批次 {batch_num} 完成: {batch_results['success_count']} 成功, {batch_results['error_count']} 失敗")
-                
+
+                logger.info(f"✅ 批次 {batch_num}/{total_batches} 完成 (項目 {start_idx+1}-{end_idx}): "
+                            f"{batch_results['success_count']} 成功, {batch_results['error_count']} 失敗")
+
             except Exception as e:
                 logger.error(f"❌ 批次 {batch_num} 處理失敗: {e}")
-                total_errors += len(current_batch)
-                
+
                 # 保存錯誤信息
                 try:
                     if hasattr(task_memory_manager, 'storage') and task_memory_manager.storage:
                         task_memory_manager.storage.save_temp_data(
                             session_id,
-                            f"batch_{batch_num}_error",
+                            f"batch_{batch_num}_error_{task_id}",
                             {
                                 "batch_number": batch_num,
                                 "error": str(e),
-                                "failed_items": len(current_batch)
+                                "failed_items": end_idx - start_idx
                             }
                         )
                 except Exception as storage_e:
                     logger.warning(f"⚠️ 保存錯誤信息失敗: {storage_e}")
-        
-        # 步驟4: 生成最終報告
+
+        await _process_items_pooled(
+            data_items=data_items,
+            start_index=resumed_from,
+            batch_size=batch_size,
+            processing_instruction=processing_instruction,
+            task_description=task_description,
+            max_concurrency=max_concurrency,
+            on_batch_complete=on_batch_complete,
+            executor=executor
+        )
+
+        # 步驟4: 壓縮結果日誌並生成最終報告
+        if compactor:
+            compactor.compact()
+        if tracker:
+            tracker.set_task_status(session_id, task_id, TaskStatus.COMPLETED)
+
         final_report = {
             "task_description": task_description,
             "total_items": total_items,
             "total_batches": total_batches,
             "batch_size": batch_size,
+            "max_concurrency": max_concurrency,
+            "execution_mode": execution_mode,
             "success_count": total_success,
             "error_count": total_errors,
             "success_rate": (total_success / total_items) * 100 if total_items > 0 else 0,
-            "batch_summaries": batch_summaries,
-            "accumulated_results": accumulated_results[:100],  # 只返回前100個結果，完整結果在 tmp 中
-            "results_location": f"accumulated_results_{task_id}",
+            "batch_summaries": batch_summaries,  # 只包含本次執行的批次
+            "resumed_from": resumed_from,
+            "accumulated_results": result_preview,  # 只返回前100個結果，完整結果在結果日誌中
+            "results_location": results_log_id,
             "completion_status": "completed"
         }
         
@@ -252,6 +325,7 @@ async def smart_batch_processor_tool(
         return json.dumps({
             "success": True,
             "task_id": task_id,
+            "resumed": resumed_from > 0,
             "report": final_report,
             "message": f"批次處理完成！成功處理 {total_success}/{total_items} 項目 ({final_report['success_rate']:.1f}%)"
         }, ensure_ascii=False)
@@ -262,64 +336,164 @@ async def smart_batch_processor_tool(
             "success": False,
             "error": str(e)
         }, ensure_ascii=False)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
 
 
-async def _process_single_batch(
-    batch_data: List[Any],
-    batch_number: int,
+def _load_resume_state(session_id: str, task_id: str, total_items: int) -> Optional[Dict[str, Any]]:
+    """讀取未完成任務的累積進度，已完成或不存在時返回 None"""
+    summary = task_memory_manager.storage.load_temp_data(session_id, f"accumulated_results_{task_id}")
+    if not summary or summary.get("total_items") != total_items:
+        return None
+    if not 0 < summary.get("total_processed", 0) < total_items:
+        return None
+    return summary
+
+
+async def _process_items_pooled(
+    data_items: List[Any],
+    start_index: int,
+    batch_size: int,
     processing_instruction: str,
-    task_description: str
-) -> Dict[str, Any]:
+    task_description: str,
+    max_concurrency: int,
+    on_batch_complete: Callable[[int, int, Dict[str, Any]], Awaitable[None]],
+    executor: Optional[ProcessPoolExecutor] = None
+) -> None:
     """
-    處理單個批次的數據
-    
-    這個函數模擬了對每個數據項目的處理邏輯
-    在實際使用中，這裡會調用具體的處理邏輯
+    以單一並發池處理 data_items[start_index:]
+
+    max_concurrency 個工作協程共用同一個項目序列，慢項目只佔用一個工作位置，不會拖住整批。
+    每個批次的項目全部完成後，依批次順序呼叫 on_batch_complete(批次號, 起始位置, 批次結果)，
+    批次內結果按原始順序排列。最早未完成批次之後最多預先分派 lookahead 個項目，
+    等待記帳的已完成批次因此有上限。
     """
+    total_items = len(data_items)
+    max_concurrency = max(1, max_concurrency)
+    lookahead = max(2 * batch_size, 4 * max_concurrency)
+    loop = asyncio.get_running_loop()
+
+    next_index = start_index
+    finalize_start = start_index  # 下一個待記帳批次的起始位置
+    pending: Dict[int, List[Optional[Dict[str, Any]]]] = {}
+    remaining: Dict[int, int] = {}
+    window_moved = asyncio.Condition()
+    finalize_lock = asyncio.Lock()
+
+    def batch_of(index: int):
+        key = (index - start_index) // batch_size
+        batch_start = start_index + key * batch_size
+        return key, batch_start, min(batch_start + batch_size, total_items) - batch_start
+
+    async def finalize_ready() -> None:
+        nonlocal finalize_start
+        async with finalize_lock:
+            while finalize_start < total_items:
+                key, batch_start, size = batch_of(finalize_start)
+                if remaining.get(key) != 0:
+                    return
+                results = pending.pop(key)
+                del remaining[key]
+                batch_num = batch_start // batch_size + 1
+                try:
+                    await on_batch_complete(
+                        batch_num, batch_start,
+                        _summarize_batch(results, batch_num, processing_instruction, task_description)
+                    )
+                except Exception as e:
+                    logger.error(f"❌ 批次 {batch_num} 記帳失敗: {e}")
+                finalize_start = batch_start + size
+                async with window_moved:
+                    window_moved.notify_all()
+
+    async def worker() -> None:
+        nonlocal next_index
+        while True:
+            async with window_moved:
+                await window_moved.wait_for(
+                    lambda: next_index >= total_items or next_index < finalize_start + lookahead
+                )
+                if next_index >= total_items:
+                    return
+                index = next_index
+                next_index += 1
+
+            key, batch_start, size = batch_of(index)
+            slots = pending.setdefault(key, [None] * size)
+            remaining.setdefault(key, size)
+            slots[index - batch_start] = await _run_item(
+                index - batch_start, data_items[index], processing_instruction, executor, loop
+            )
+            remaining[key] -= 1
+            if remaining[key] == 0:
+                await finalize_ready()
+
+    workers = min(max_concurrency, total_items - start_index)
+    if workers > 0:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def _run_item(
+    item_index: int,
+    item: Any,
+    processing_instruction: str,
+    executor: Optional[ProcessPoolExecutor],
+    loop: asyncio.AbstractEventLoop
+) -> Dict[str, Any]:
+    """處理單個項目（提供 executor 時交由進程池執行），失敗只影響該項目"""
     import time
+
+    try:
+        # 根據 processing_instruction 處理 item
+        if executor is not None:
+            processed_result = await loop.run_in_executor(
+                executor, run_item_in_process, item, processing_instruction
+            )
+        else:
+            processed_result = await process_single_item(item, processing_instruction)
+
+        return {
+            "item_index": item_index,
+            "original_item": item,
+            "processed_result": processed_result,
+            "status": "success",
+            "processing_time": time.time()
+        }
+
+    except Exception as e:
+        return {
+            "item_index": item_index,
+            "original_item": item,
+            "error": str(e),
+            "status": "error",
+            "processing_time": time.time()
+        }
+
+
+def _summarize_batch(
+    results: List[Dict[str, Any]],
+    batch_number: int,
+    processing_instruction: str,
+    task_description: str
+) -> Dict[str, Any]:
+    """組裝已完成批次的結果與摘要"""
     from datetime import datetime
-    
-    results = []
-    success_count = 0
-    error_count = 0
-    
-    # 模擬處理每個項目
-    for i, item in enumerate(batch_data):
-        try:
-            # 這裡是實際的處理邏輯
-            # 根據 processing_instruction 處理 item
-            processed_result = await _process_single_item(item, processing_instruction)
-            
-            results.append({
-                "item_index": i,
-                "original_item": item,
-                "processed_result": processed_result,
-                "status": "success",
-                "processing_time": time.time()
-            })
-            success_count += 1
-            
-        except Exception as e:
-            results.append({
-                "item_index": i,
-                "original_item": item,
-                "error": str(e),
-                "status": "error",
-                "processing_time": time.time()
-            })
-            error_count += 1
-    
+
+    success_count = sum(1 for result in results if result["status"] == "success")
+    error_count = len(results) - success_count
+
     # 生成批次摘要
     batch_summary = {
         "batch_number": batch_number,
-        "items_count": len(batch_data),
+        "items_count": len(results),
         "success_count": success_count,
         "error_count": error_count,
-        "success_rate": (success_count / len(batch_data)) * 100,
+        "success_rate": (success_count / len(results)) * 100,
         "processing_instruction": processing_instruction,
         "task_description": task_description
     }
-    
+
     return {
         "items": results,
         "summary": batch_summary,
@@ -329,126 +503,6 @@ async def _process_single_batch(
     }
 
 
-async def _process_single_item(item: Any, instruction: str) -> Dict[str, Any]:
-    """
-    處理單個數據項目 - 支援真正的文件操作和任務處理
-
-    這個函數根據指令處理單個項目，支援：
-    1. 文件寫入/編輯操作
-    2. 數據分析任務
-    3. 其他重複性任務
-    """
-    import os
-    from datetime import datetime
-
-    try:
-        # 解析指令和項目
-        if isinstance(item, dict):
-            task_data = item
-        else:
-            task_data = {"content": str(item)}
-
-        # 根據指令類型進行不同的處理
-        if "寫入" in instruction or "添加" in instruction or "加寫" in instruction:
-            # 文件寫入任務
-            file_path = task_data.get("file_path", "")
-            content = task_data.get("content", str(item))
-
-            if file_path and os.path.exists(os.path.dirname(file_path)):
-                try:
-                    # 讀取現有內容
-                    if os.path.exists(file_path):
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            existing_content = f.read()
-                    else:
-                        existing_content = ""
-
-                    # 添加新內容
-                    new_content = existing_content + content + "\n"
-
-                    # 寫入文件
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-
-                    return {
-                        "success": True,
-                        "action": "file_write",
-                        "file_path": file_path,
-                        "content_added": content,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                except Exception as e:
-                    return {
-                        "success": False,
-                        "action": "file_write",
-                        "error": str(e),
-                        "file_path": file_path
-                    }
-            else:
-                return {
-                    "success": False,
-                    "action": "file_write",
-                    "error": "Invalid file path",
-                    "file_path": file_path
-                }
-
-        elif "分析" in instruction:
-            # 數據分析任務
-            await asyncio.sleep(0.01)  # 模擬處理時間
-            return {
-                "success": True,
-                "action": "analysis",
-                "analysis_result": f"已分析項目: {item}",
-                "key_insights": ["數據模式識別", "趨勢分析"],
-                "confidence": 0.85,
-                "timestamp": datetime.now().isoformat()
-            }
-
-        elif "分類" in instruction:
-            # 分類任務
-            await asyncio.sleep(0.01)
-            return {
-                "success": True,
-                "action": "classification",
-                "category": "類別A",
-                "confidence": 0.92,
-                "features": ["特徵1", "特徵2"],
-                "timestamp": datetime.now().isoformat()
-            }
-
-        elif "提取" in instruction:
-            # 數據提取任務
-            await asyncio.sleep(0.01)
-            return {
-                "success": True,
-                "action": "extraction",
-                "extracted_data": {"key1": "value1", "key2": "value2"},
-                "extraction_confidence": 0.88,
-                "timestamp": datetime.now().isoformat()
-            }
-
-        else:
-            # 默認處理
-            await asyncio.sleep(0.01)
-            return {
-                "success": True,
-                "action": "default_processing",
-                "result": f"已處理: {item}",
-                "method": "batch_processing",
-                "timestamp": datetime.now().isoformat()
-            }
-
-    except Exception as e:
-        logger.error(f"❌ 處理單個項目失敗: {e}")
-        return {
-            "success": False,
-            "action": "error",
-            "error": str(e),
-            "item": str(item),
-            "timestamp": datetime.now().isoformat()
-        }
-
-
 @tool
 async def get_batch_processing_status_tool(session_id: str, task_id: str) -> str:
     """
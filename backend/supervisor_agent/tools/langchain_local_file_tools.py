@@ -6,7 +6,7 @@ LangChain 兼容的本地文件工具
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain_core.tools import tool
 from pydantic import Field
 import json
@@ -125,7 +125,10 @@ except Exception as e:
 
 @tool
 async def read_file_with_summary_tool(
-    file_path: str, session_id: str = "default"
+    file_path: str,
+    session_id: str = "default",
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
 ) -> str:
     """
     讀取文件並生成摘要
@@ -133,6 +136,8 @@ async def read_file_with_summary_tool(
     Args:
         file_path: 文件路徑
         session_id: 會話ID
+        start_line: 可選，同時返回此行起的內容（1-based）
+        end_line: 可選，內容的結束行號（包含）
 
     Returns:
         包含文件內容和摘要的JSON字符串
@@ -144,7 +149,9 @@ async def read_file_with_summary_tool(
     try:
         # 步驟1: 調用底層工具
         logger.info(f"📋 步驟1: 調用 local_file_tools.read_file_with_summary")
-        result = await local_file_tools.read_file_with_summary(file_path, session_id)
+        result = await local_file_tools.read_file_with_summary(
+            file_path, session_id, start_line, end_line
+        )
 
         # 步驟2: 處理結果
         logger.info(f"📋 步驟2: 處理工具返回結果")
@@ -1199,7 +1206,8 @@ async def filter_and_analyze_tool(
 
 @tool
 async def create_data_file_tool(
-    file_path: str, data: str, file_type: str = "csv", session_id: str = "default"
+    file_path: str, data: str, file_type: str = "csv", session_id: str = "default",
+    append: bool = False
 ) -> str:
     """
     創建新的數據文件
@@ -1209,6 +1217,7 @@ async def create_data_file_tool(
         data: 數據內容的JSON字符串
         file_type: 文件類型 (csv, json, xlsx)
         session_id: 會話ID
+        append: 文件已存在時把數據追加到末尾（CSV 直接追加，不改寫原有內容）
 
     Returns:
         創建結果的JSON字符串
@@ -1221,6 +1230,19 @@ async def create_data_file_tool(
         # 解析數據
         data_dict = json.loads(data)
 
+        if append and os.path.exists(file_path):
+            rows = data_dict if isinstance(data_dict, list) else [data_dict]
+            result = await data_file_tools.append_rows(file_path, rows, session_id)
+            if result.get("success"):
+                result = {
+                    "success": True,
+                    "file_path": file_path,
+                    "file_type": file_type,
+                    "rows_appended": result["added_rows"],
+                    "columns": list(pd.DataFrame(rows).columns),
+                }
+            return json.dumps(result, ensure_ascii=False)
+
         # 確保目錄存在
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
@@ -1275,7 +1297,6 @@ async def update_data_rows_tool(
     """
     try:
         import json
-        import pandas as pd
         import os
 
         if not os.path.exists(file_path):
@@ -1285,60 +1306,21 @@ async def update_data_rows_tool(
         conditions = json.loads(update_conditions)
         values = json.loads(new_values)
 
-        # 讀取數據
-        file_ext = os.path.splitext(file_path)[1].lower()
-
-        if file_ext == ".csv":
-            df = pd.read_csv(file_path)
-        elif file_ext == ".json":
-            df = pd.read_json(file_path)
-        elif file_ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(file_path)
-        else:
-            return f'{{"success": false, "error": "不支持的文件格式: {file_ext}"}}'
-
-        # 應用更新條件
-        mask = pd.Series([True] * len(df))
-
-        for condition in conditions:
-            column = condition.get("column")
-            operator = condition.get("operator")
-            value = condition.get("value")
-
-            if column not in df.columns:
-                continue
-
-            if operator == "==":
-                mask &= df[column] == value
-            elif operator == "!=":
-                mask &= df[column] != value
-            elif operator == ">":
-                mask &= df[column] > value
-            elif operator == "<":
-                mask &= df[column] < value
-            elif operator == "contains":
-                mask &= df[column].str.contains(str(value), na=False)
-
-        # 更新數據
-        updated_rows = mask.sum()
-
-        for column, new_value in values.items():
-            if column in df.columns:
-                df.loc[mask, column] = new_value
-
-        # 保存文件
-        if file_ext == ".csv":
-            df.to_csv(file_path, index=False, encoding="utf-8")
-        elif file_ext == ".json":
-            df.to_json(file_path, orient="records", ensure_ascii=False, indent=2)
-        elif file_ext == ".xlsx":
-            df.to_excel(file_path, index=False)
+        # 所有條件都符合的行才更新；CSV 分塊改寫，不需把整個文件讀入記憶體
+        edit_result = await data_file_tools.edit_data_rows(
+            file_path,
+            [{"operation": "update_row", "conditions": conditions, "values": values, "match": "all"}],
+            session_id,
+        )
+        if not edit_result.get("success"):
+            return json.dumps(edit_result, ensure_ascii=False)
+        updated_rows = edit_result["updated_rows"]
 
         result = {
             "success": True,
             "file_path": file_path,
             "updated_rows": int(updated_rows),
-            "total_rows": len(df),
+            "total_rows": edit_result["remaining_rows"],
             "update_conditions": conditions,
             "new_values": values,
         }
@@ -1367,7 +1349,6 @@ async def delete_data_rows_tool(
     """
     try:
         import json
-        import pandas as pd
         import os
 
         if not os.path.exists(file_path):
@@ -1376,59 +1357,22 @@ async def delete_data_rows_tool(
         # 解析刪除條件
         conditions = json.loads(delete_conditions)
 
-        # 讀取數據
-        file_ext = os.path.splitext(file_path)[1].lower()
-
-        if file_ext == ".csv":
-            df = pd.read_csv(file_path)
-        elif file_ext == ".json":
-            df = pd.read_json(file_path)
-        elif file_ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(file_path)
-        else:
-            return f'{{"success": false, "error": "不支持的文件格式: {file_ext}"}}'
-
-        original_rows = len(df)
-
-        # 應用刪除條件
-        mask = pd.Series([False] * len(df))
-
-        for condition in conditions:
-            column = condition.get("column")
-            operator = condition.get("operator")
-            value = condition.get("value")
-
-            if column not in df.columns:
-                continue
-
-            if operator == "==":
-                mask |= df[column] == value
-            elif operator == "!=":
-                mask |= df[column] != value
-            elif operator == ">":
-                mask |= df[column] > value
-            elif operator == "<":
-                mask |= df[column] < value
-            elif operator == "contains":
-                mask |= df[column].str.contains(str(value), na=False)
-
-        # 刪除數據
-        df_filtered = df[~mask]
-        deleted_rows = original_rows - len(df_filtered)
-
-        # 保存文件
-        if file_ext == '.csv':
-            df_filtered.to_csv(file_path, index=False, encoding='utf-8')
-        elif file_ext == '.json':
-            df_filtered.to_json(file_path, orient='records', indent=2, force_ascii=False)
-        elif file_ext == '.xlsx':
-            df_filtered.to_excel(file_path, index=False)
+        # 任一條件符合即刪除；CSV 分塊改寫，不需把整個文件讀入記憶體
+        edit_result = await data_file_tools.edit_data_rows(
+            file_path,
+            [{"operation": "delete_row", "conditions": conditions, "match": "any"}],
+            session_id,
+        )
+        if not edit_result.get("success"):
+            return json.dumps(edit_result, ensure_ascii=False)
+        deleted_rows = edit_result["deleted_rows"]
+        original_rows = edit_result["total_rows"]
 
         result = {
             "success": True,
             "file_path": file_path,
             "deleted_rows": int(deleted_rows),
-            "remaining_rows": len(df_filtered),
+            "remaining_rows": edit_result["remaining_rows"],
             "original_rows": original_rows,
             "delete_conditions": conditions,
         }
@@ -1590,8 +1534,14 @@ async def edit_data_file_tool(
 
     Args:
         file_path: 數據文件路徑
-        operation: 操作類型 (add_row, delete_row, update_cell, update_row)
+        operation: 操作類型 (add_row, delete_row, update_cell, update_row, batch)
         data: 操作數據的JSON字符串
+            add_row: {"row": {...}} 或 {"rows": [...]}（也可直接傳入行對象或行列表）
+            delete_row: {"row_index": 0} / {"row_indices": [...]} / {"conditions": [...]}
+            update_cell: {"row_index": 0, "column": "列名", "value": 新值}
+            update_row: {"row_index": 0, "values": {...}} 或 {"conditions": [...], "values": {...}}
+            batch: 上述操作的列表，每項帶 "operation" 字段，整批只改寫一次文件
+            行號為 0-based；batch 中的行號都指向編輯前的文件內容
         session_id: 會話ID
 
     Returns:
@@ -1608,7 +1558,7 @@ async def edit_data_file_tool(
     try:
         # 步驟1: 驗證操作類型
         logger.info(f"📋 步驟1: 驗證操作類型")
-        valid_operations = ["add_row", "delete_row", "update_cell", "update_row"]
+        valid_operations = ["add_row", "delete_row", "update_cell", "update_row", "batch"]
         if operation not in valid_operations:
             raise ValueError(
                 f"不支持的操作類型: {operation}，支持的操作: {valid_operations}"
@@ -1625,11 +1575,21 @@ async def edit_data_file_tool(
         except json.JSONDecodeError as e:
             raise ValueError(f"數據格式錯誤: {e}")
 
+        if operation == "batch":
+            if not isinstance(parsed_data, list):
+                raise ValueError("batch 操作的數據必須為操作列表")
+            operations = parsed_data
+        elif operation == "add_row" and (isinstance(parsed_data, list) or
+                                         (isinstance(parsed_data, dict) and not {"row", "rows"} & parsed_data.keys())):
+            operations = [{"operation": "add_row", "rows": parsed_data}]
+        elif isinstance(parsed_data, dict):
+            operations = [{**parsed_data, "operation": operation}]
+        else:
+            raise ValueError(f"{operation} 操作的數據必須為對象")
+
         # 步驟3: 調用編輯工具
-        logger.info(f"📋 步驟3: 調用 data_file_tools.edit_data_file")
-        result = await data_file_tools.edit_data_file(
-            file_path, operation, data, session_id
-        )
+        logger.info(f"📋 步驟3: 調用 data_file_tools.edit_data_rows（{len(operations)} 個操作）")
+        result = await data_file_tools.edit_data_rows(file_path, operations, session_id)
 
         # 步驟4: 處理結果
         logger.info(f"📋 步驟4: 處理編輯結果")
@@ -1679,7 +1639,8 @@ async def gmail_fingerprint_search_tool(
     session_id: str = "default",
     similarity_threshold: float = 0.7,
     max_results: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    explain: bool = False
 ) -> str:
     """
     使用指紋搜尋技術在 Gmail CSV 文件中進行智能文字搜尋
@@ -1696,6 +1657,7 @@ async def gmail_fingerprint_search_tool(
         similarity_threshold: 相似度閾值 (0.0-6.2)，越高越嚴格，預設 0.7
         max_results: 最大返回結果數 (None 表示不限制，根據閾值自然過濾)
         save_results: 是否將結果保存為新的 CSV 檔案
+        explain: 是否為每筆結果附帶分數說明（subject/body BM25、語義、實體、擴展關鍵字貢獻），用於調整排序權重
 
     Returns:
         搜尋結果的JSON字符串，包含匹配數量、結果檔案路徑和樣本數據
@@ -1720,7 +1682,8 @@ async def gmail_fingerprint_search_tool(
             session_id=session_id,
             similarity_threshold=similarity_threshold,
             max_results=max_results,
-            save_results=save_results
+            save_results=save_results,
+            explain=explain
         )
 
         return json.dumps(result, ensure_ascii=False)
@@ -1741,7 +1704,9 @@ async def fingerprint_search_tool(
     session_id: str = "default",
     similarity_threshold: float = 0.7,
     max_results: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    field_weights: str = "",
+    explain: bool = False
 ) -> str:
     """
     使用指紋搜尋技術在 CSV 文件中進行智能文字搜尋（可指定搜尋欄位）
@@ -1760,6 +1725,9 @@ async def fingerprint_search_tool(
         similarity_threshold: 相似度閾值 (0.0-6.2)，越高越嚴格，預設 0.7
         max_results: 最大返回結果數 (None 表示不限制，根據閾值自然過濾)
         save_results: 是否將結果保存為新的 CSV 檔案
+        field_weights: 各欄位的 BM25F 權重，格式 "欄位:權重"，用逗號分隔（例如："title:3,body:1"），
+            未指定的欄位第一欄預設 2.5、其餘 1.2
+        explain: 是否為每筆結果附帶分數說明（各欄位 BM25F、語義、實體、擴展關鍵字貢獻）
 
     Returns:
         搜尋結果的JSON字符串，包含匹配數量、結果檔案路徑和樣本數據
@@ -1787,6 +1755,22 @@ async def fingerprint_search_tool(
                 "error": "請提供有效的搜尋欄位名稱"
             }, ensure_ascii=False)
 
+        # 解析欄位權重
+        field_weights_dict = {}
+        for item in field_weights.split(','):
+            if not item.strip():
+                continue
+            col, sep, weight = item.rpartition(':')
+            try:
+                if not sep or not col.strip():
+                    raise ValueError(item)
+                field_weights_dict[col.strip()] = float(weight)
+            except ValueError:
+                return json.dumps({
+                    "success": False,
+                    "error": f"欄位權重格式錯誤: '{item.strip()}'，應為 欄位:權重"
+                }, ensure_ascii=False)
+
         logger.info(f"🔍 執行靈活指紋搜尋: '{search_query}' in columns {search_columns_list} from {file_path}")
 
         # 檢查是否為合併資料集
@@ -1799,7 +1783,9 @@ async def fingerprint_search_tool(
                 session_id=session_id,
                 similarity_threshold=similarity_threshold,
                 max_results=max_results,
-                save_results=save_results
+                save_results=save_results,
+                field_weights=field_weights_dict or None,
+                explain=explain
             )
         else:
             result = await flexible_fingerprint_search_csv(
@@ -1809,7 +1795,9 @@ async def fingerprint_search_tool(
                 session_id=session_id,
                 similarity_threshold=similarity_threshold,
                 max_results=max_results,
-                save_results=save_results
+                save_results=save_results,
+                field_weights=field_weights_dict or None,
+                explain=explain
             )
 
         return json.dumps(result, ensure_ascii=False)
@@ -1829,7 +1817,9 @@ async def _handle_combined_dataset_search(
     session_id: str = "default",
     similarity_threshold: float = 0.7,
     max_results: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    field_weights: Optional[Dict[str, float]] = None,
+    explain: bool = False
 ) -> Dict[str, Any]:
     """
     處理合併資料集的搜尋
@@ -1842,6 +1832,8 @@ async def _handle_combined_dataset_search(
         similarity_threshold: 相似度閾值
         max_results: 最大返回結果數
         save_results: 是否保存結果
+        field_weights: 各欄位的 BM25F 權重
+        explain: 是否為每筆結果附帶分數說明
 
     Returns:
         搜尋結果的字典
@@ -1919,6 +1911,7 @@ async def _handle_combined_dataset_search(
 
             # 使用靈活指紋搜尋引擎進行搜尋
             from .flexible_fingerprint_search_tool import flexible_search_engine
+            from .search_index import search_index_cache
 
             # 創建臨時CSV檔案進行搜尋
             import tempfile
@@ -1931,7 +1924,8 @@ async def _handle_combined_dataset_search(
             try:
                 # 執行搜尋
                 result_df, search_info = await flexible_search_engine.search_csv_flexible(
-                    temp_path, search_query, valid_columns, similarity_threshold, max_results
+                    temp_path, search_query, valid_columns, similarity_threshold, max_results,
+                    field_weights=field_weights, explain=explain
                 )
 
                 # 為結果添加資料源標識
@@ -1942,13 +1936,16 @@ async def _handle_combined_dataset_search(
 
                     # 添加到總結果中
                     for _, row in result_df.iterrows():
-                        all_results.append({
+                        hit = {
                             "data_source": source,
                             "dataset_date": dataset.get('date', ''),
                             "dataset_time": dataset.get('time', ''),
                             "similarity_score": row.get('_similarity_score', 0),
                             "data": {k: v for k, v in row.items() if not k.startswith('_')}
-                        })
+                        }
+                        if explain:
+                            hit["score_breakdown"] = row.get('_score_breakdown')
+                        all_results.append(hit)
 
                 total_matches += search_info.get('matches_found', 0)
                 total_processed += search_info.get('total_processed', 0)
@@ -1956,7 +1953,8 @@ async def _handle_combined_dataset_search(
                 logger.info(f"✅ {source} 搜尋完成: {search_info.get('matches_found', 0)} 筆匹配")
 
             finally:
-                # 清理臨時檔案
+                # 清理臨時檔案及其索引
+                search_index_cache.invalidate(temp_path)
                 if os.path.exists(temp_path):
                     os.unlink(temp_path)
 
@@ -6,10 +6,12 @@ Task Memory Tools for LangChain Integration
 
 import json
 import asyncio
+import functools
 from typing import Dict, Any, List, Optional
 from langchain_core.tools import tool
 
 from ...src.task_memory.task_memory_manager import TaskMemoryManager
+from ...src.task_memory.item_processor import process_single_item
 from ..utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -190,6 +192,70 @@ async def list_session_tasks_tool(session_id: str) -> str:
         }, ensure_ascii=False)
 
 
+@tool
+async def find_resumable_task_tool(session_id: str, task_description: str) -> str:
+    """
+    依任務描述查找尚未完成、可恢復的任務
+    
+    Args:
+        session_id: 會話ID
+        task_description: 任務描述
+        
+    Returns:
+        任務狀態的JSON字符串
+    """
+    try:
+        task_info = task_memory_manager.find_resumable_task(session_id, task_description)
+        
+        return json.dumps({
+            "success": True,
+            "found": task_info is not None,
+            "task_info": task_info
+        }, ensure_ascii=False)
+        
+    except Exception as e:
+        logger.error(f"❌ 查找可恢復任務失敗: {e}")
+        return json.dumps({
+            "success": False,
+            "error": str(e)
+        }, ensure_ascii=False)
+
+
+@tool
+async def resume_batch_task_tool(session_id: str, task_id: str, processing_instruction: str = "") -> str:
+    """
+    恢復中斷的批次任務，已完成的項目不會重新處理
+
+    通常先以 find_resumable_task_tool 找到任務ID，再以原本的處理指令恢復。
+
+    Args:
+        session_id: 會話ID
+        task_id: 任務ID
+        processing_instruction: 每個項目的處理指令
+
+    Returns:
+        最終結果的JSON字符串
+    """
+    try:
+        final_results = await task_memory_manager.resume_batch_task(
+            session_id, task_id,
+            functools.partial(process_single_item, instruction=processing_instruction)
+        )
+
+        return json.dumps({
+            "success": True,
+            "final_results": final_results,
+            "message": f"批次任務已完成，成功 {final_results.get('successful_results', 0)} 項"
+        }, ensure_ascii=False)
+
+    except Exception as e:
+        logger.error(f"❌ 恢復批次任務失敗: {e}")
+        return json.dumps({
+            "success": False,
+            "error": str(e)
+        }, ensure_ascii=False)
+
+
 @tool
 async def pause_task_tool(session_id: str, task_id: str) -> str:
     """
@@ -290,6 +356,8 @@ def get_langchain_task_memory_tools():
         save_temp_data_tool,
         load_temp_data_tool,
         list_session_tasks_tool,
+        find_resumable_task_tool,
+        resume_batch_task_tool,
         pause_task_tool,
         resume_task_tool,
         generate_task_report_tool
@@ -0,0 +1,460 @@
+"""
+搜尋索引 - 指紋搜尋引擎共用的文件級索引快取
+只依賴文件內容的計算（實體抽取、分欄位詞頻統計、embeddings 等）在建立索引時執行一次，查詢時直接重用；
+CSV 只在尾端追加資料列時，只解析、索引與向量化新增的部分
+"""
+
+import io
+import os
+import math
+import time
+import hashlib
+import logging
+import itertools
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 依序嘗試的 CSV 編碼
+CSV_ENCODINGS = ('utf-8', 'big5', 'cp1252')
+
+# 讀取檔案計算摘要時的區塊大小
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# 語料版本號（全域遞增，語料重新載入後舊索引即失效）
+_generation_counter = itertools.count(1)
+
+
+def file_signature(file_path: str) -> Dict[str, int]:
+    """以檔案大小與修改時間作為內容版本標記"""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_csv_bytes(data: bytes, encoding: Optional[str] = None, **kwargs) -> Tuple[pd.DataFrame, str]:
+    """解析 CSV 內容，未指定編碼時依序嘗試 CSV_ENCODINGS"""
+    if encoding:
+        return pd.read_csv(io.BytesIO(data), encoding=encoding, **kwargs), encoding
+
+    last_error = None
+    for candidate in CSV_ENCODINGS:
+        try:
+            return pd.read_csv(io.BytesIO(data), encoding=candidate, **kwargs), candidate
+        except UnicodeDecodeError as e:
+            last_error = e
+    raise last_error
+
+
+def bm25_component(raw: float, expansion_raw: float, weight: float,
+                   normalizer: float = 8.0, fields: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """組成 BM25 類分數的說明項目（raw 為含擴展關鍵字的原始分數）"""
+    component = {
+        "value": min(1.0, raw / normalizer) if raw > 0 else 0.0,
+        "weight": weight,
+        "raw": round(float(raw), 6),
+        "expansion_raw": round(float(expansion_raw), 6),
+        "normalizer": normalizer
+    }
+    if fields is not None:
+        component["fields"] = {name: round(float(value), 6) for name, value in fields.items()}
+    return component
+
+
+def rescore_breakdown(breakdown: Dict[str, Any], weights: Optional[Dict[str, float]] = None,
+                      include_expansion: bool = True) -> float:
+    """
+    以新的權重重新組合搜尋結果的分數（離線調整權重時使用，不需重新搜尋）
+
+    Args:
+        breakdown: 搜尋結果附帶的 score_breakdown
+        weights: 各項目的新權重，未指定者沿用原權重
+        include_expansion: False 時扣除擴展關鍵字的 BM25 貢獻
+
+    Returns:
+        重新計算的總分
+    """
+    total = 0.0
+    for name, component in breakdown["components"].items():
+        value = component["value"]
+        if not include_expansion and "expansion_raw" in component:
+            raw = component["raw"] - component["expansion_raw"]
+            value = min(1.0, raw / component["normalizer"]) if raw > 0 else 0.0
+        weight = (weights or {}).get(name, component["weight"])
+        total += weight * value
+    return total
+
+
+class CsvCorpus:
+    """CSV 文件內容快取，偵測尾端追加並只解析新增的資料列"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.frame: Optional[pd.DataFrame] = None
+        self.encoding: Optional[str] = None
+        self.signature: Dict[str, int] = {}
+        self.digest: Optional[str] = None
+        self.ends_with_newline = False
+        self.generation = 0
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        同步至目前的檔案內容
+
+        Returns:
+            {"mode": "unchanged" | "append" | "reload", "rows": 本次解析的資料列數}
+        """
+        signature = file_signature(self.file_path)
+        if self.frame is not None and signature == self.signature:
+            return {"mode": "unchanged", "rows": 0}
+
+        if self.frame is not None and self.ends_with_newline and signature["size"] > self.signature["size"]:
+            appended = self._try_append(signature)
+            if appended is not None:
+                return {"mode": "append", "rows": appended}
+
+        self._reload(signature)
+        return {"mode": "reload", "rows": len(self.frame)}
+
+    def _try_append(self, signature: Dict[str, int]) -> Optional[int]:
+        """原內容未變時只解析尾端新增的位元組；無法確認為純追加則返回 None"""
+        old_size = self.signature["size"]
+        hasher = hashlib.blake2b(digest_size=20)
+
+        with open(self.file_path, 'rb') as f:
+            remaining = old_size
+            while remaining > 0:
+                chunk = f.read(min(_HASH_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return None
+                hasher.update(chunk)
+                remaining -= len(chunk)
+
+            if hasher.hexdigest() != self.digest:
+                return None
+            delta = f.read()
+
+        hasher.update(delta)
+        columns = list(self.frame.columns)
+        try:
+            if delta.strip():
+                delta_df, _ = read_csv_bytes(delta, self.encoding, header=None, names=columns)
+            else:
+                delta_df = pd.DataFrame(columns=columns)
+        except Exception as e:
+            logger.warning(f"⚠️ 解析追加內容失敗，改為完整重新載入: {e}")
+            return None
+
+        if len(delta_df.columns) != len(columns):
+            return None
+
+        if not delta_df.empty:
+            self.frame = pd.concat([self.frame, delta_df], ignore_index=True)
+        self.digest = hasher.hexdigest()
+        self.ends_with_newline = delta.endswith(b'\n') if delta else self.ends_with_newline
+        self.signature = signature
+
+        logger.info(f"➕ 偵測到追加資料: {self.file_path} (+{len(delta_df)} 筆)")
+        return len(delta_df)
+
+    def _reload(self, signature: Dict[str, int]) -> None:
+        """完整載入檔案"""
+        with open(self.file_path, 'rb') as f:
+            data = f.read()
+
+        self.frame, self.encoding = read_csv_bytes(data)
+        self.digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        self.ends_with_newline = data.endswith(b'\n')
+        self.signature = signature
+        self.generation = next(_generation_counter)
+
+
+class SearchIndex:
+    """單一 CSV 文件在特定搜尋欄位下的索引"""
+
+    def __init__(self, namespace: str, file_path: str, fields: Tuple[str, ...],
+                 tokenizer: Callable[[str], List[str]],
+                 entity_extractor: Callable[[str], Dict[str, List[str]]]):
+        self.namespace = namespace
+        self.file_path = file_path
+        self.fields = tuple(fields)
+        self.tokenizer = tokenizer
+        self.entity_extractor = entity_extractor
+
+        self.generation = 0
+        self.doc_count = 0
+        self.doc_texts: List[str] = []
+        self.entities: List[Dict[str, List[str]]] = []
+
+        # 文件 embeddings：正規化後存於可成長的 float32 矩陣，未取得或失敗者下次查詢時補齊
+        self._vectors: Optional[np.ndarray] = None
+        self._has_vector = np.zeros(0, dtype=bool)
+
+        # 分欄位統計：倒排表 term -> {doc_id: tf}、每筆文件欄位長度、欄位總長度
+        self.postings: Dict[str, Dict[str, Dict[int, int]]] = {f: {} for f in self.fields}
+        self.field_lengths: Dict[str, List[int]] = {f: [] for f in self.fields}
+        self.field_total_length: Dict[str, int] = {f: 0 for f in self.fields}
+        # 文件層級的 document frequency（任一欄位出現即計）
+        self.doc_freq: Counter = Counter()
+
+        self.built_at = time.time()
+
+    def add_documents(self, field_texts: List[Dict[str, str]], doc_texts: List[str]) -> None:
+        """
+        加入文件並預先計算只依賴文件內容的特徵
+
+        Args:
+            field_texts: 每筆文件各欄位的文本
+            doc_texts: 每筆文件用於實體抽取的完整文本
+        """
+        for fields, text in zip(field_texts, doc_texts):
+            doc_id = self.doc_count
+            doc_terms = set()
+
+            for field_name in self.fields:
+                tokens = self.tokenizer(fields.get(field_name, '') or '')
+                self.field_lengths[field_name].append(len(tokens))
+                self.field_total_length[field_name] += len(tokens)
+
+                field_postings = self.postings[field_name]
+                for term, tf in Counter(tokens).items():
+                    field_postings.setdefault(term, {})[doc_id] = tf
+                    doc_terms.add(term)
+
+            self.doc_freq.update(doc_terms)
+            self.doc_texts.append(text)
+            self.entities.append(self.entity_extractor(text) if text else {})
+            self.doc_count += 1
+
+        self._reserve(self.doc_count)
+
+    def _reserve(self, size: int) -> None:
+        """擴充 embedding 矩陣容量（倍增，追加時攤銷為常數成本）"""
+        capacity = len(self._has_vector)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2, 64)
+
+        has_vector = np.zeros(new_capacity, dtype=bool)
+        has_vector[:capacity] = self._has_vector
+        self._has_vector = has_vector
+
+        if self._vectors is not None:
+            vectors = np.zeros((new_capacity, self._vectors.shape[1]), dtype=np.float32)
+            vectors[:capacity] = self._vectors
+            self._vectors = vectors
+
+    def pending_embeddings(self) -> List[int]:
+        """尚未取得 embedding 的文件（空文本不需要 embedding）"""
+        missing = np.flatnonzero(~self._has_vector[:self.doc_count])
+        return [int(i) for i in missing if self.doc_texts[i]]
+
+    def set_embeddings(self, doc_ids: List[int], vectors: List[Optional[List[float]]]) -> None:
+        """寫入 embeddings，失敗項目保持缺漏"""
+        for doc_id, vector in zip(doc_ids, vectors):
+            if not vector:
+                continue
+            if self._vectors is None:
+                self._vectors = np.zeros((len(self._has_vector), len(vector)), dtype=np.float32)
+            if len(vector) != self._vectors.shape[1]:
+                logger.warning(f"⚠️ embedding 維度不一致 ({len(vector)} != {self._vectors.shape[1]})，略過文件 {doc_id}")
+                continue
+
+            row = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(row)
+            self._vectors[doc_id] = row / norm if norm else row
+            self._has_vector[doc_id] = True
+
+    def semantic_scores(self, query_embedding: Optional[List[float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次計算查詢與所有文件的 cosine 相似度
+
+        Returns:
+            (scores, mask)：mask 為 False 的文件沒有可用的 embedding，分數為 0
+        """
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        mask = self._has_vector[:self.doc_count].copy()
+
+        if not query_embedding or self._vectors is None:
+            return scores, np.zeros(self.doc_count, dtype=bool)
+        if len(query_embedding) != self._vectors.shape[1]:
+            logger.warning(f"⚠️ 查詢 embedding 維度不一致 ({len(query_embedding)} != {self._vectors.shape[1]})")
+            return scores, np.zeros(self.doc_count, dtype=bool)
+
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if not norm:
+            return scores, np.zeros(self.doc_count, dtype=bool)
+
+        scores = self._vectors[:self.doc_count] @ (query_vec / norm)
+        scores[~mask] = 0.0
+        return scores, mask
+
+    def avg_field_length(self, field_name: str) -> float:
+        """欄位平均長度"""
+        if not self.doc_count:
+            return 1.0
+        return (self.field_total_length[field_name] / self.doc_count) or 1.0
+
+    def field_doc_freq(self, field_name: str, term: str) -> int:
+        """欄位層級的 document frequency"""
+        return len(self.postings[field_name].get(term, {}))
+
+    def bm25_field_scores(self, field_name: str, query_terms: List[str],
+                          k1: float = 1.2, b: float = 0.75) -> Dict[int, float]:
+        """
+        單一欄位的傳統 BM25（只走訪查詢詞的倒排表）
+
+        Returns:
+            doc_id -> 原始 BM25 分數（未出現的文件視為 0）
+        """
+        scores: Dict[int, float] = {}
+        field_postings = self.postings[field_name]
+        lengths = self.field_lengths[field_name]
+        avg_length = self.avg_field_length(field_name)
+
+        for term in query_terms:
+            term_postings = field_postings.get(term)
+            if not term_postings:
+                continue
+            df = len(term_postings)
+            idf = math.log((self.doc_count - df + 0.5) / (df + 0.5))
+
+            for doc_id, tf in term_postings.items():
+                denominator = tf + k1 * (1 - b + b * (lengths[doc_id] / avg_length))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (tf * (k1 + 1) / denominator)
+
+        return scores
+
+    def bm25f_scores(self, query_terms: List[str], field_weights: Dict[str, float],
+                     k1: float = 1.2, b: float = 0.75) -> Dict[int, Dict[str, float]]:
+        """
+        BM25F 多欄位評分
+
+        各欄位詞頻先以自身平均長度做長度正規化並乘上欄位權重，合併後再做一次飽和，
+        避免把多個欄位當成同一欄位計算長度。
+
+        Returns:
+            doc_id -> {欄位: 該欄位貢獻的分數}，總分為各欄位貢獻之和
+        """
+        results: Dict[int, Dict[str, float]] = {}
+        avg_lengths = {f: self.avg_field_length(f) for f in self.fields}
+
+        for term in dict.fromkeys(query_terms):
+            df = self.doc_freq.get(term, 0)
+            if not df:
+                continue
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+            # 累計每筆文件各欄位的加權正規化詞頻
+            weighted_tf: Dict[int, Dict[str, float]] = {}
+            for field_name in self.fields:
+                weight = field_weights.get(field_name, 0.0)
+                term_postings = self.postings[field_name].get(term)
+                if not weight or not term_postings:
+                    continue
+                lengths = self.field_lengths[field_name]
+                for doc_id, tf in term_postings.items():
+                    norm = 1 - b + b * (lengths[doc_id] / avg_lengths[field_name])
+                    weighted_tf.setdefault(doc_id, {})[field_name] = weight * tf / norm
+
+            for doc_id, per_field in weighted_tf.items():
+                pseudo_tf = sum(per_field.values())
+                term_score = idf * pseudo_tf * (k1 + 1) / (k1 + pseudo_tf)
+                contributions = results.setdefault(doc_id, {})
+                # 依各欄位在加權詞頻中的比例分攤分數
+                for field_name, value in per_field.items():
+                    contributions[field_name] = contributions.get(field_name, 0.0) + term_score * value / pseudo_tf
+
+        return results
+
+
+class SearchIndexCache:
+    """語料與索引快取（LRU），索引鍵為 (引擎命名空間, 檔案路徑, 搜尋欄位)"""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._corpora: "OrderedDict[str, CsvCorpus]" = OrderedDict()
+        self._indexes: "OrderedDict[Tuple[str, str, Tuple[str, ...]], SearchIndex]" = OrderedDict()
+
+    @staticmethod
+    def _key(namespace: str, file_path: str, fields: Tuple[str, ...]) -> Tuple[str, str, Tuple[str, ...]]:
+        return (namespace, os.path.abspath(file_path), tuple(fields))
+
+    def _touch(self, entries: OrderedDict, key, value) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def load_corpus(self, file_path: str) -> CsvCorpus:
+        """取得 CSV 語料，檔案僅尾端追加時只解析新增資料列"""
+        abs_path = os.path.abspath(file_path)
+        corpus = self._corpora.get(abs_path) or CsvCorpus(abs_path)
+
+        start_time = time.time()
+        status = corpus.refresh()
+        if status["mode"] != "unchanged":
+            logger.info(f"📥 載入語料 ({status['mode']}): {file_path} ({status['rows']} 筆)，"
+                        f"耗時 {time.time() - start_time:.2f} 秒")
+
+        self._touch(self._corpora, abs_path, corpus)
+        return corpus
+
+    def get_or_build(self, namespace: str, corpus: CsvCorpus, fields: List[str],
+                     document_builder: Callable[[pd.DataFrame], Tuple[List[Dict[str, str]], List[str]]],
+                     tokenizer: Callable[[str], List[str]],
+                     entity_extractor: Callable[[str], Dict[str, List[str]]]) -> SearchIndex:
+        """
+        取得與語料同步的索引：語料未變則重用、僅追加則索引新增資料列、否則重新建立
+
+        Args:
+            namespace: 引擎命名空間（不同引擎的分詞與抽取規則不同）
+            corpus: load_corpus 取得的語料
+            fields: 索引欄位
+            document_builder: 由資料列產生 (各欄位文本, 完整文本) 的函數
+            tokenizer: 分詞函數
+            entity_extractor: 實體抽取函數
+
+        Returns:
+            SearchIndex
+        """
+        key = self._key(namespace, corpus.file_path, tuple(fields))
+        total_rows = len(corpus.frame)
+
+        index = self._indexes.get(key)
+        if index is not None and index.generation == corpus.generation and index.doc_count <= total_rows:
+            if index.doc_count < total_rows:
+                start_time = time.time()
+                delta_rows = corpus.frame.iloc[index.doc_count:]
+                index.add_documents(*document_builder(delta_rows))
+                logger.info(f"➕ 增量更新搜尋索引: {corpus.file_path} (+{len(delta_rows)} 筆)，"
+                            f"耗時 {time.time() - start_time:.2f} 秒")
+            else:
+                logger.info(f"♻️ 重用搜尋索引: {corpus.file_path} ({index.doc_count} 筆)")
+            self._touch(self._indexes, key, index)
+            return index
+
+        start_time = time.time()
+        index = SearchIndex(namespace, corpus.file_path, tuple(fields), tokenizer, entity_extractor)
+        index.add_documents(*document_builder(corpus.frame))
+        index.generation = corpus.generation
+        self._touch(self._indexes, key, index)
+
+        logger.info(f"🗂️ 建立搜尋索引: {corpus.file_path} ({index.doc_count} 筆)，"
+                    f"耗時 {time.time() - start_time:.2f} 秒")
+        return index
+
+    def invalidate(self, file_path: str) -> None:
+        """移除某檔案的語料與所有索引"""
+        abs_path = os.path.abspath(file_path)
+        self._corpora.pop(abs_path, None)
+        for key in [k for k in self._indexes if k[1] == abs_path]:
+            del self._indexes[key]
+
+
+# 全局索引快取
+search_index_cache = SearchIndexCache()
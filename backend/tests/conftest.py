@@ -0,0 +1,13 @@
+"""
+測試共用設定
+
+backend 與 backend/src 加入 sys.path，與應用程式執行時的導入方式一致。
+"""
+
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+for path in (BACKEND_DIR, BACKEND_DIR / "src"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
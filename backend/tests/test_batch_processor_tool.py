@@ -0,0 +1,138 @@
+"""
+smart_batch_processor_tool 並發池測試
+
+以與 langchain_local_file_tools 相同的方式按檔案路徑載入工具模組，
+存儲寫入暫存目錄。
+"""
+
+import json
+import time
+import asyncio
+import importlib.util
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+TOOL_PATH = BACKEND_DIR / "supervisor_agent" / "tools" / "langchain_batch_processor_tool.py"
+
+
+@pytest.fixture
+def batch_tool(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TASK_MEMORY_BACKEND", "json")
+    spec = importlib.util.spec_from_file_location("batch_processor_tool", TOOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run_pool(module, items, batch_size, max_concurrency):
+    completed = []
+
+    async def on_batch_complete(batch_num, start_idx, batch_results):
+        completed.append((batch_num, start_idx, batch_results))
+
+    async def run():
+        await module._process_items_pooled(
+            data_items=items,
+            start_index=0,
+            batch_size=batch_size,
+            processing_instruction="處理",
+            task_description="測試",
+            max_concurrency=max_concurrency,
+            on_batch_complete=on_batch_complete
+        )
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return completed, time.perf_counter() - started
+
+
+def test_pool_keeps_order_and_isolates_failures(batch_tool, monkeypatch):
+    async def flaky(item, instruction):
+        await asyncio.sleep(0.001 * ((item * 7) % 5))
+        if item % 13 == 0:
+            raise RuntimeError(f"壞項目 {item}")
+        return {"value": item}
+
+    monkeypatch.setattr(batch_tool, "process_single_item", flaky)
+    completed, _ = _run_pool(batch_tool, list(range(95)), batch_size=10, max_concurrency=8)
+
+    assert [batch_num for batch_num, _, _ in completed] == list(range(1, 11))
+    for batch_num, start_idx, batch_results in completed:
+        assert start_idx == (batch_num - 1) * 10
+        items = batch_results["items"]
+        assert [r["original_item"] for r in items] == list(range(start_idx, min(start_idx + 10, 95)))
+        for result in items:
+            if result["original_item"] % 13 == 0:
+                assert result["status"] == "error"
+            else:
+                assert result["processed_result"] == {"value": result["original_item"]}
+
+
+def test_slow_item_does_not_hold_back_later_batches(batch_tool, monkeypatch):
+    started = []
+    slow_done = []
+
+    async def slow_first(item, instruction):
+        started.append((item, bool(slow_done)))
+        await asyncio.sleep(0.3 if item == 0 else 0.005)
+        if item == 0:
+            slow_done.append(True)
+        return {}
+
+    monkeypatch.setattr(batch_tool, "process_single_item", slow_first)
+    completed, _ = _run_pool(batch_tool, list(range(40)), batch_size=10, max_concurrency=4)
+
+    # 第一批卡在慢項目時，其他工作位置已經處理後續批次
+    assert max(item for item, after_slow in started if not after_slow) >= 10
+    assert [batch_num for batch_num, _, _ in completed] == [1, 2, 3, 4]
+
+
+def test_throughput_scales_with_concurrency_on_10k_items(batch_tool, monkeypatch):
+    item_seconds = 0.002
+
+    async def io_bound(item, instruction):
+        await asyncio.sleep(item_seconds)
+        return {}
+
+    monkeypatch.setattr(batch_tool, "process_single_item", io_bound)
+    items = list(range(10_000))
+
+    timings = {}
+    for workers in (10, 50):
+        completed, elapsed = _run_pool(batch_tool, items, batch_size=50, max_concurrency=workers)
+        assert sum(len(r["items"]) for _, _, r in completed) == len(items)
+        timings[workers] = elapsed
+
+    # 接近線性擴展：並發數提高 5 倍，耗時至少降為一半以下，且達到理想吞吐量的一半以上
+    assert timings[10] / timings[50] > 2.5
+    assert timings[50] < 2 * len(items) * item_seconds / 50
+
+
+def test_tool_checkpoints_and_result_log(batch_tool):
+    async def run():
+        return await batch_tool.smart_batch_processor_tool.coroutine(
+            session_id="s1",
+            task_description="分析測試數據",
+            data_items=[f"item-{i}" for i in range(23)],
+            processing_instruction="分析每個項目",
+            batch_size=5,
+            use_file_backup=False,
+            max_concurrency=4
+        )
+
+    result = json.loads(asyncio.run(run()))
+    assert result["success"]
+    assert result["report"]["success_count"] == 23
+
+    storage = batch_tool.task_memory_manager.storage
+    task_id = result["task_id"]
+    progress = storage.load_temp_data("s1", f"accumulated_results_{task_id}")
+    assert progress["total_processed"] == 23
+    assert progress["completed_batches"] == 5
+
+    records = list(storage.iter_result_log("s1", result["report"]["results_location"]))
+    assert [r["global_index"] for r in records] == list(range(23))
+    assert [r["original_item"] for r in records] == [f"item-{i}" for i in range(23)]
@@ -0,0 +1,28 @@
+"""
+批次結果串流讀取測試：行首格式不同的批次行仍應可讀取
+"""
+
+import json
+
+from task_memory.session_storage import SessionStorage
+
+
+def test_iter_batch_results_reads_lines_from_other_writers(tmp_path):
+    storage = SessionStorage(str(tmp_path / "task_memory"))
+    storage.create_session("s1")
+    assert storage.start_batch_processing("s1", "t1", total_items=4, batch_size=1)
+
+    assert storage.save_batch_result("s1", "t1", 1, {"value": 1})
+    _, batches_file = storage._batch_files("s1", "t1")
+    with open(batches_file, "a", encoding="utf-8") as f:
+        # 鍵順序與分隔符都與 save_batch_result 不同
+        f.write(json.dumps({"data": {"value": 2}, "batch_number": 2, "item_count": 1}) + "\n")
+        f.write(json.dumps({"batch_number": 3, "data": {"value": 3}, "item_count": 1}, separators=(",", ":")) + "\n")
+        f.write("not json\n")
+    assert storage.save_batch_result("s1", "t1", 4, {"value": 4})
+    assert storage.save_batch_result("s1", "t1", 2, {"value": 20})
+
+    results = list(storage.iter_batch_results("s1", "t1"))
+    assert [r["batch_number"] for r in results] == [1, 2, 3, 4]
+    assert [r["data"]["value"] for r in results] == [1, 20, 3, 4]
+    assert [r["batch_number"] for r in storage.iter_batch_results("s1", "t1", 2, 3)] == [2, 3]
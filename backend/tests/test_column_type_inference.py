@@ -0,0 +1,23 @@
+"""
+整列類型推斷測試：預設門檻下，任何無法解析為數字的非空值都讓整列判定為字串
+"""
+
+from file_processor.content_analyzer import ContentAnalyzer
+from file_processor.stream_stats import ColumnTypeStats
+
+
+def test_late_non_numeric_ids_make_column_string():
+    values = [str(100000 + i) for i in range(299000)] + [f"AB{i}" for i in range(1000)]
+    stats = ColumnTypeStats()
+    for start in range(0, len(values), 8192):
+        stats.update(values[start:start + 8192])
+
+    analyzer = ContentAnalyzer()
+    column_type, _ = stats.infer(analyzer.type_confidence, len(set(values)))
+    assert column_type == 'string'
+
+
+def test_single_non_numeric_value_in_small_column():
+    analyzer = ContentAnalyzer()
+    assert analyzer._detect_column_type([str(i) for i in range(199)] + ['A17']) == 'string'
+    assert analyzer._detect_column_type([str(i) for i in range(200)]) == 'integer'
@@ -0,0 +1,79 @@
+"""
+DataFileTools 分塊讀取 CSV 測試：列類型、樣本值與過濾 / limit 後的行數應與整個文件一次讀入相同
+"""
+
+import math
+import asyncio
+
+import pandas as pd
+import pytest
+
+import tools.data_file_tools as data_file_tools
+
+CHUNK_VALUES = {
+    "int": ["1", "2"],
+    "float": ["1.5", "2"],
+    "bool": ["True", "False"],
+    "str": ["x", "y"],
+    "empty": ["", ""],
+    "bool_empty": ["True", ""],
+}
+
+
+def _same(actual, expected):
+    if isinstance(actual, float) and isinstance(expected, float) and math.isnan(actual):
+        return math.isnan(expected)
+    return actual == expected and type(actual) is type(expected)
+
+
+FILTERS = {
+    "none": None,
+    "equals_int": {"c": {"equals": 1}},
+    "equals_bool": {"c": {"equals": True}},
+    "equals_str": {"c": {"equals": "2"}},
+    "contains": {"c": {"contains": "1"}},
+}
+
+
+def _write_chunks(tmp_path, monkeypatch, first, second):
+    monkeypatch.setattr(data_file_tools, "CSV_CHUNK_SIZE", 2)
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text(
+        "k,c\n" + "".join(f"{i},{value}\n" for i, value in enumerate(CHUNK_VALUES[first] + CHUNK_VALUES[second])),
+        encoding="utf-8"
+    )
+    return csv_file
+
+
+def _assert_matches_whole_file(csv_file, filters, limit):
+    result = asyncio.run(data_file_tools.DataFileTools()._read_csv_file(str(csv_file), filters, limit, "s1"))
+
+    whole = pd.read_csv(csv_file)
+    schema = result["schema"]
+    assert schema["types"] == {col: str(dtype) for col, dtype in whole.dtypes.items()}
+
+    # 與分塊讀取前的實作相同：整個文件讀入後過濾，再取前 limit 行
+    filtered = data_file_tools._filter_dataframe(whole, filters)
+    if limit:
+        filtered = filtered.head(limit)
+    assert result["total_rows"] == schema["row_count"] == len(filtered)
+
+    expected = filtered.head(data_file_tools.SAMPLE_ROWS).to_dict("records")
+    assert len(schema["sample_data"]) == len(expected)
+    for actual_row, expected_row in zip(schema["sample_data"], expected):
+        assert all(_same(actual_row[col], expected_row[col]) for col in expected_row)
+
+
+@pytest.mark.parametrize("first", CHUNK_VALUES)
+@pytest.mark.parametrize("second", CHUNK_VALUES)
+def test_chunked_csv_matches_whole_file_read(tmp_path, monkeypatch, first, second):
+    _assert_matches_whole_file(_write_chunks(tmp_path, monkeypatch, first, second), None, None)
+
+
+@pytest.mark.parametrize("first", CHUNK_VALUES)
+@pytest.mark.parametrize("second", CHUNK_VALUES)
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("limit", [None, 1, 3])
+def test_filtered_and_limited_csv_matches_whole_file_read(tmp_path, monkeypatch, first, second, filters, limit):
+    csv_file = _write_chunks(tmp_path, monkeypatch, first, second)
+    _assert_matches_whole_file(csv_file, FILTERS[filters], limit)
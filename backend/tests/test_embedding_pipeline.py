@@ -0,0 +1,147 @@
+"""
+EmbeddingPipeline 測試：以本地 stub server 注入 429 / Retry-After 與錯誤回應
+"""
+
+import time
+import asyncio
+import importlib.util
+
+import pytest
+from aiohttp import web
+
+from conftest import BACKEND_DIR
+
+PIPELINE_PATH = BACKEND_DIR / "supervisor_agent" / "tools" / "embedding_pipeline.py"
+
+
+@pytest.fixture(scope="module")
+def pipeline_module():
+    spec = importlib.util.spec_from_file_location("embedding_pipeline", PIPELINE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StubEmbeddingServer:
+    """
+    模擬 embeddings API 的本地伺服器
+
+    rate_limited: 前幾個請求回應 429（附 retry-after-ms）
+    fail_text: 輸入包含此文字的請求回應 400（不可重試）
+    unavailable_text: 輸入包含此文字的請求一律回應 503（可重試，最終仍失敗）
+    """
+
+    def __init__(self, rate_limited: int = 0, retry_after_ms: int = 50, delay: float = 0.0,
+                 fail_text: str = None, unavailable_text: str = None):
+        self.rate_limited = rate_limited
+        self.retry_after_ms = retry_after_ms
+        self.delay = delay
+        self.fail_text = fail_text
+        self.unavailable_text = unavailable_text
+        self.requests = []          # (時間, 輸入, 狀態碼)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        inputs = payload["input"]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            status = 200
+            if self.rate_limited > 0:
+                self.rate_limited -= 1
+                status = 429
+            elif self.fail_text and any(self.fail_text in text for text in inputs):
+                status = 400
+            elif self.unavailable_text and any(self.unavailable_text in text for text in inputs):
+                status = 503
+            self.requests.append((time.monotonic(), inputs, status))
+
+            if status == 429:
+                return web.json_response({"error": "rate limited"}, status=429,
+                                         headers={"retry-after-ms": str(self.retry_after_ms)})
+            if status != 200:
+                return web.json_response({"error": "failed"}, status=status)
+            # 倒序回傳，驗證結果依 index 還原順序
+            data = [{"index": i, "embedding": [float(len(text)), float(i)]} for i, text in enumerate(inputs)]
+            return web.json_response({"data": data[::-1]})
+        finally:
+            self.in_flight -= 1
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/embeddings", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/embeddings"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+
+def _pipeline(module, server, **kwargs):
+    options = {"max_batch_size": 2, "base_delay": 0.01, "max_delay": 1.0, "timeout": 10.0}
+    options.update(kwargs)
+    return module.EmbeddingPipeline(api_key="test", endpoint="", endpoint_url=server.url, **options)
+
+
+def test_retries_after_rate_limit_and_honours_retry_after(pipeline_module):
+    async def run():
+        async with StubEmbeddingServer(rate_limited=2, retry_after_ms=150) as server:
+            pipeline = _pipeline(pipeline_module, server, max_concurrency=1)
+            result = await pipeline.embed(["alpha", "beta"])
+            return server, result
+
+    server, result = asyncio.run(run())
+
+    assert result.success
+    assert result.retry_count == 2
+    assert result.embeddings == [[5.0, 0.0], [4.0, 1.0]]
+    statuses = [status for _, _, status in server.requests]
+    assert statuses == [429, 429, 200]
+    gaps = [later[0] - earlier[0] for earlier, later in zip(server.requests, server.requests[1:])]
+    assert all(gap >= 0.14 for gap in gaps)
+
+
+def test_concurrency_is_bounded(pipeline_module):
+    async def run():
+        async with StubEmbeddingServer(delay=0.05) as server:
+            pipeline = _pipeline(pipeline_module, server, max_concurrency=3)
+            result = await pipeline.embed([f"text {i}" for i in range(40)])
+            return server, result
+
+    server, result = asyncio.run(run())
+
+    assert result.success and result.batch_count == 20
+    assert server.max_in_flight == 3
+    assert [vector[0] for vector in result.embeddings] == [float(len(f"text {i}")) for i in range(40)]
+
+
+def test_failed_items_are_reported_not_zero_filled(pipeline_module):
+    texts = ["ok 0", "ok 1", "bad 2", "ok 3", "down 4", "ok 5", "", "ok 7"]
+
+    async def run():
+        async with StubEmbeddingServer(fail_text="bad", unavailable_text="down") as server:
+            pipeline = _pipeline(pipeline_module, server, max_concurrency=2, max_retries=2)
+            result = await pipeline.embed(texts)
+            return server, result
+
+    server, result = asyncio.run(run())
+
+    assert not result.success
+    assert result.failed_indices == [2, 3, 4, 5]
+    assert all(result.embeddings[i] is None for i in (2, 3, 4, 5, 6))
+    assert all(result.embeddings[i] is not None for i in (0, 1, 7))
+    assert len(result.errors) == 2
+    # 400 不重試；503 重試 max_retries 次後才放棄
+    assert sum(1 for _, inputs, _ in server.requests if "bad 2" in inputs) == 1
+    assert sum(1 for _, inputs, _ in server.requests if "down 4" in inputs) == 3
+    assert result.summary()["failed"] == 4
@@ -0,0 +1,85 @@
+"""
+SessionStorage 並發寫入壓力測試：多進程與多執行緒同時讀-改-寫，不得遺失更新或讀到不完整的檔案
+"""
+
+import json
+import asyncio
+import multiprocessing
+
+import pytest
+
+from task_memory.session_storage import SessionStorage, create_session_storage
+
+WRITERS = 4
+UPDATES_PER_WRITER = 200
+
+
+def _increment(data):
+    data = data or {"count": 0}
+    data["count"] += 1
+    return data
+
+
+def _writer(base_dir: str, backend: str, updates: int) -> None:
+    storage = create_session_storage(base_dir, backend)
+    for _ in range(updates):
+        assert storage.update_temp_data("s1", "counter", _increment) is not None
+
+
+def _reader(base_dir: str, stop, partial_reads) -> None:
+    """持續直接讀取 JSON 檔，記錄無法解析的次數"""
+    data_file = SessionStorage(base_dir).sessions_dir / "s1" / "temp_data" / "counter.json"
+    while not stop.is_set():
+        try:
+            with open(data_file, 'r', encoding='utf-8') as f:
+                json.load(f)
+        except FileNotFoundError:
+            continue
+        except json.JSONDecodeError:
+            with partial_reads.get_lock():
+                partial_reads.value += 1
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_concurrent_process_writers_lose_no_updates(tmp_path, backend):
+    base_dir = str(tmp_path / "task_memory")
+    create_session_storage(base_dir, backend).create_session("s1")
+
+    stop = multiprocessing.Event()
+    partial_reads = multiprocessing.Value('i', 0)
+    reader = multiprocessing.Process(target=_reader, args=(base_dir, stop, partial_reads)) \
+        if backend == "json" else None
+    if reader:
+        reader.start()
+
+    writers = [
+        multiprocessing.Process(target=_writer, args=(base_dir, backend, UPDATES_PER_WRITER))
+        for _ in range(WRITERS)
+    ]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join(timeout=120)
+
+    stop.set()
+    if reader:
+        reader.join(timeout=10)
+
+    assert all(process.exitcode == 0 for process in writers)
+    data = create_session_storage(base_dir, backend).load_temp_data("s1", "counter")
+    assert data["count"] == WRITERS * UPDATES_PER_WRITER
+    assert partial_reads.value == 0
+
+
+def test_concurrent_async_tasks_lose_no_updates(tmp_path):
+    storage = SessionStorage(str(tmp_path / "task_memory"))
+    storage.create_session("s1")
+
+    async def run():
+        await asyncio.gather(*[
+            asyncio.to_thread(storage.update_temp_data, "s1", "counter", _increment)
+            for _ in range(200)
+        ])
+
+    asyncio.run(run())
+    assert storage.load_temp_data("s1", "counter")["count"] == 200
@@ -0,0 +1,57 @@
+"""
+靈活指紋搜尋測試：BM25F 欄位權重影響排序，欄位權重格式錯誤時返回錯誤 JSON
+"""
+
+import json
+import asyncio
+
+import pytest
+
+from supervisor_agent.tools import search_index
+from supervisor_agent.tools.langchain_local_file_tools import fingerprint_search_tool
+
+DOCUMENTS = [
+    {"title": "apple harvest report", "body": "seasonal notes on weather and soil"},
+    {"title": "seasonal weather notes", "body": "apple harvest report and soil"},
+    {"title": "quarterly budget", "body": "no fruit mentioned here at all"},
+]
+
+
+def _ranking(field_weights):
+    index = search_index.SearchIndex(
+        "test", "documents.csv", ("title", "body"), str.split, lambda text: {}
+    )
+    index.add_documents(DOCUMENTS, [f"{doc['title']} {doc['body']}" for doc in DOCUMENTS])
+    scores = index.bm25f_scores(["apple", "harvest"], field_weights)
+    return sorted(scores, key=lambda doc_id: sum(scores[doc_id].values()), reverse=True)
+
+
+def test_field_weights_change_ranking():
+    assert _ranking({"title": 3.0, "body": 1.0}) == [0, 1]
+    assert _ranking({"title": 1.0, "body": 3.0}) == [1, 0]
+
+
+def test_zero_weight_field_is_ignored():
+    index = search_index.SearchIndex(
+        "test", "documents.csv", ("title", "body"), str.split, lambda text: {}
+    )
+    index.add_documents(DOCUMENTS, [""] * len(DOCUMENTS))
+    scores = index.bm25f_scores(["apple"], {"title": 1.0, "body": 0.0})
+    assert list(scores) == [0]
+    assert set(scores[0]) == {"title"}
+
+
+@pytest.mark.parametrize("field_weights", ["title=3", "title:abc", ":3", "title:3,body"])
+def test_malformed_field_weights_return_error_json(tmp_path, field_weights):
+    csv_file = tmp_path / "documents.csv"
+    csv_file.write_text("title,body\napple,harvest\n", encoding="utf-8")
+
+    result = json.loads(asyncio.run(fingerprint_search_tool.ainvoke({
+        "file_path": str(csv_file),
+        "search_query": "apple",
+        "search_columns": "title,body",
+        "field_weights": field_weights,
+    })))
+
+    assert result["success"] is False
+    assert "欄位權重格式錯誤" in result["error"]
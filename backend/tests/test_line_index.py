@@ -0,0 +1,49 @@
+"""
+LineIndexManager 磁碟快取測試：索引檔數量有上限，來源文件刪除後索引檔會被清除
+"""
+
+from file_processor.line_index import LineIndexManager
+
+
+def _write_files(directory, count):
+    files = []
+    for i in range(count):
+        path = directory / f"data_{i}.csv"
+        path.write_text("id,name\n" + "".join(f"{j},名稱{j}\n" for j in range(i + 1)), encoding="utf-8")
+        files.append(path)
+    return files
+
+
+def test_disk_cache_is_capped(tmp_path):
+    cache_dir = tmp_path / "cache"
+    manager = LineIndexManager(cache_dir, max_cached=4, max_disk_entries=10)
+
+    for i, path in enumerate(_write_files(tmp_path, 30)):
+        assert manager.line_count(path) == i + 2
+
+    assert len(list(cache_dir.glob("*.idx"))) <= 10
+
+
+def test_index_files_of_deleted_sources_are_removed(tmp_path):
+    cache_dir = tmp_path / "cache"
+    manager = LineIndexManager(cache_dir, max_disk_entries=100)
+
+    temp_files = _write_files(tmp_path, 20)
+    for path in temp_files:
+        manager.line_count(path)
+        path.unlink()
+    assert len(list(cache_dir.glob("*.idx"))) == 1
+
+    kept = tmp_path / "kept.csv"
+    kept.write_text("a\nb\n", encoding="utf-8")
+    assert manager.read_lines(kept, 2, 2) == ["b"]
+    assert [p.name for p in cache_dir.glob("*.idx")] == [manager._index_file(str(kept.resolve())).name]
+
+
+def test_persisted_index_is_reused(tmp_path):
+    cache_dir = tmp_path / "cache"
+    path = _write_files(tmp_path, 3)[2]
+    LineIndexManager(cache_dir).line_count(path)
+
+    reloaded = LineIndexManager(cache_dir)
+    assert reloaded.read_lines(path, 2, 4) == ["0,名稱0", "1,名稱1", "2,名稱2"]
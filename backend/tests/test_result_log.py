@@ -0,0 +1,67 @@
+"""
+結果日誌壓縮測試（JSON 與 SQLite 後端）
+"""
+
+import asyncio
+
+import pytest
+
+from task_memory.session_storage import SessionStorage
+from task_memory.sqlite_storage import SqliteSessionStorage
+from task_memory.task_memory_manager import ResultLogCompactor, TaskMemoryManager
+
+
+@pytest.fixture(params=[SessionStorage, SqliteSessionStorage], ids=["json", "sqlite"])
+def storage(request, tmp_path):
+    storage = request.param(str(tmp_path / "task_memory"))
+    storage.create_session("s1")
+    return storage
+
+
+def _expected(records, key_field):
+    """同一鍵只保留最後一筆，位置以首次出現為準"""
+    latest, order = {}, []
+    for record in records:
+        if key_field in record:
+            if record[key_field] not in latest:
+                order.append(("key", record[key_field]))
+            latest[record[key_field]] = record
+        else:
+            order.append(("record", record))
+    return [latest[value] if kind == "key" else value for kind, value in order]
+
+
+def test_keyed_compaction_keeps_last_record_at_first_position(storage):
+    records = [{"index": (i * 37) % 50, "value": i} if i % 11 else {"note": i} for i in range(200)]
+    for start in range(0, len(records), 25):
+        assert storage.append_result_log("s1", "log", records[start:start + 25])
+
+    count = storage.compact_result_log("s1", "log", key_field="index")
+
+    compacted = list(storage.iter_result_log("s1", "log"))
+    assert compacted == _expected(records, "index")
+    assert count == len(compacted)
+
+
+def test_compactor_runs_on_record_threshold(storage):
+    compactor = ResultLogCompactor(storage, "s1", "log", key_field="index", min_records=10)
+    for round_number in range(3):
+        storage.append_result_log("s1", "log", [{"index": i, "round": round_number} for i in range(10)])
+        compactor.record_appended(10)
+        assert len(list(storage.iter_result_log("s1", "log"))) == 10
+
+    assert [r["round"] for r in storage.iter_result_log("s1", "log")] == [2] * 10
+
+
+def test_process_batch_task_keeps_results_preview(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = TaskMemoryManager()
+
+    async def run():
+        await manager.create_batch_task("s1", "t1", list(range(12)), batch_size=5)
+        return await manager.process_batch_task("s1", "t1", lambda item: item * 2)
+
+    final_results = asyncio.run(run())
+    assert [r["result"] for r in final_results["results"]] == [i * 2 for i in range(12)]
+    assert final_results["results_truncated"] is False
+    assert final_results["successful_results"] == 12
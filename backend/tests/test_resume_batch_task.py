@@ -0,0 +1,154 @@
+"""
+批次任務崩潰恢復測試：處理中途強制結束進程，重新啟動後從結果日誌恢復，已完成的項目不重新處理
+"""
+
+import sys
+import time
+import asyncio
+import importlib.util
+import subprocess
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from conftest import BACKEND_DIR
+from task_memory.task_memory_manager import TaskMemoryManager
+
+TOTAL_ITEMS = 60
+BATCH_SIZE = 5
+
+WORKER_SCRIPT = f"""
+import sys, time, asyncio
+sys.path.insert(0, {str(BACKEND_DIR / "src")!r})
+from task_memory.task_memory_manager import TaskMemoryManager
+
+def slow_double(item):
+    time.sleep(0.02)
+    return item * 2
+
+async def main():
+    manager = TaskMemoryManager()
+    await manager.create_batch_task("s1", "t1", list(range({TOTAL_ITEMS})), batch_size={BATCH_SIZE})
+    await manager.process_batch_task("s1", "t1", slow_double)
+
+asyncio.run(main())
+"""
+
+
+def _logged_indices(manager):
+    return [record["index"] for record in manager.storage.iter_result_log("s1", "results_t1")]
+
+
+def _run_until_killed(tmp_path, min_logged: int):
+    """在子進程中處理任務，結果日誌達到 min_logged 筆後強制結束"""
+    process = subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT], cwd=tmp_path)
+    log_file = tmp_path / "task_memory" / "sessions" / "s1" / "temp_data" / "results_t1.jsonl"
+    deadline = time.monotonic() + 60
+    try:
+        while time.monotonic() < deadline and process.poll() is None:
+            if log_file.exists() and log_file.read_bytes().count(b"\n") >= min_logged:
+                break
+            time.sleep(0.005)
+    finally:
+        process.kill()
+        process.wait()
+    assert process.returncode != 0, "子進程在強制結束前已完成全部項目"
+
+
+def test_resume_after_kill_processes_each_item_once(tmp_path, monkeypatch):
+    _run_until_killed(tmp_path, min_logged=20)
+
+    monkeypatch.chdir(tmp_path)
+    manager = TaskMemoryManager()
+    done_before = set(_logged_indices(manager))
+    assert 20 <= len(done_before) < TOTAL_ITEMS
+
+    reprocessed = []
+
+    def double(item):
+        reprocessed.append(item)
+        return item * 2
+
+    final_results = asyncio.run(manager.resume_batch_task("s1", "t1", double))
+
+    assert not done_before & set(reprocessed)
+    assert sorted(done_before | set(reprocessed)) == list(range(TOTAL_ITEMS))
+    assert _logged_indices(manager) == list(range(TOTAL_ITEMS))
+    assert final_results["successful_results"] == TOTAL_ITEMS
+    assert [record["result"] for record in final_results["results"]] == [i * 2 for i in range(TOTAL_ITEMS)]
+
+    # 已完成的任務再次恢復時直接返回保存的結果
+    assert asyncio.run(manager.resume_batch_task("s1", "t1", double))["results_log"] == "results_t1"
+    assert len(reprocessed) == TOTAL_ITEMS - len(done_before)
+
+
+def test_resume_endpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TASK_MEMORY_BACKEND", "json")
+    spec = importlib.util.spec_from_file_location(
+        "task_memory_router", BACKEND_DIR / "api" / "routers" / "task_memory.py"
+    )
+    router_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(router_module)
+
+    manager = router_module.task_memory_manager
+    asyncio.run(manager.create_batch_task("s1", "t1", ["a", "b", "c"], batch_size=2,
+                                          task_description="分析項目"))
+
+    app = FastAPI()
+    app.include_router(router_module.router, prefix="/api/task")
+    client = TestClient(app)
+
+    found = client.post("/api/task/tasks/find-resumable",
+                        json={"session_id": "s1", "task_description": "分析項目"}).json()
+    assert found["found"] and found["task_info"]["task_id"] == "t1"
+
+    response = client.post("/api/task/tasks/resume",
+                           json={"session_id": "s1", "task_id": "t1", "processing_instruction": "分析"})
+    assert response.status_code == 200
+    final_results = response.json()["final_results"]
+    assert final_results["successful_results"] == 3
+    assert [record["result"]["action"] for record in final_results["results"]] == ["analysis"] * 3
+
+    missing = client.post("/api/task/tasks/resume", json={"session_id": "s1", "task_id": "nope"})
+    assert missing.status_code == 404
+
+
+def test_failed_batch_is_retried_on_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = TaskMemoryManager()
+    asyncio.run(manager.create_batch_task("s1", "t1", list(range(12)), batch_size=5,
+                                          task_description="分析項目"))
+
+    real_append = manager.storage.append_result_log
+    appends = []
+
+    def failing_second_append(session_id, log_id, records):
+        appends.append(len(records))
+        if len(appends) == 2:
+            return False
+        return real_append(session_id, log_id, records)
+
+    monkeypatch.setattr(manager.storage, "append_result_log", failing_second_append)
+    partial = asyncio.run(manager.process_batch_task("s1", "t1", lambda item: item * 2))
+
+    assert partial["missing_items"] == 5
+    assert len(partial["errors"]) == 1
+    assert sorted(_logged_indices(manager)) == [0, 1, 2, 3, 4, 10, 11]
+    assert manager.get_task_status("s1", "t1")["status"] == "failed"
+    assert manager.storage.load_temp_data("s1", "final_results_t1") is None
+    assert manager.find_resumable_task("s1", "分析項目")["task_id"] == "t1"
+
+    reprocessed = []
+
+    def double(item):
+        reprocessed.append(item)
+        return item * 2
+
+    final_results = asyncio.run(manager.resume_batch_task("s1", "t1", double))
+
+    assert reprocessed == [5, 6, 7, 8, 9]
+    assert sorted(_logged_indices(manager)) == list(range(12))
+    assert final_results["missing_items"] == 0
+    assert final_results["successful_results"] == 12
+    assert manager.get_task_status("s1", "t1")["status"] == "completed"
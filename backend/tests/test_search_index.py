@@ -0,0 +1,71 @@
+"""
+CsvCorpus 追加偵測測試
+"""
+
+import importlib.util
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+SEARCH_INDEX_PATH = BACKEND_DIR / "supervisor_agent" / "tools" / "search_index.py"
+
+
+@pytest.fixture(scope="module")
+def search_index():
+    spec = importlib.util.spec_from_file_location("search_index", SEARCH_INDEX_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _rows(start, stop):
+    return "".join(f"{i},名稱{i},{'x' * 50}\n" for i in range(start, stop))
+
+
+def test_append_parses_only_new_rows(search_index, tmp_path):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text("id,name,note\n" + _rows(0, 5000), encoding="utf-8")
+    corpus = search_index.CsvCorpus(str(csv_file))
+    assert corpus.refresh()["mode"] == "reload"
+
+    for start in (5000, 5003):
+        with open(csv_file, "a", encoding="utf-8") as f:
+            f.write(_rows(start, start + 3))
+        assert corpus.refresh() == {"mode": "append", "rows": 3}
+
+    assert corpus.frame["id"].tolist() == list(range(5006))
+    assert corpus.refresh()["mode"] == "unchanged"
+
+
+def test_same_length_edit_then_append_reloads(search_index, tmp_path):
+    csv_file = tmp_path / "data.csv"
+    original = "id,name,note\n" + _rows(0, 10000)
+    csv_file.write_text(original, encoding="utf-8")
+    corpus = search_index.CsvCorpus(str(csv_file))
+    corpus.refresh()
+
+    changed = original.replace("5000,名稱5000,", "5000,名稱ABCD,")
+    assert len(changed.encode("utf-8")) == len(original.encode("utf-8"))
+    csv_file.write_text(changed + _rows(10000, 10001), encoding="utf-8")
+
+    assert corpus.refresh()["mode"] == "reload"
+    assert corpus.frame.loc[5000, "name"] == "名稱ABCD"
+    assert len(corpus.frame) == 10001
+
+
+@pytest.mark.parametrize("edit", ["header", "last_row"])
+def test_rewritten_content_reloads(search_index, tmp_path, edit):
+    csv_file = tmp_path / "data.csv"
+    original = "id,name,note\n" + _rows(0, 100)
+    csv_file.write_text(original, encoding="utf-8")
+    corpus = search_index.CsvCorpus(str(csv_file))
+    corpus.refresh()
+
+    if edit == "header":
+        changed = original.replace("id,name,note", "ID,name,note")
+    else:
+        changed = original[:-5] + "yyyy\n"
+    csv_file.write_text(changed + _rows(100, 102), encoding="utf-8")
+
+    assert corpus.refresh()["mode"] == "reload"
@@ -0,0 +1,81 @@
+"""
+增量摘要更新測試：編輯後 update_file_summary 的結果應與完整重新生成相同
+"""
+
+import asyncio
+
+import pytest
+
+import file_processor.summary_generator as summary_generator
+from file_processor.line_index import LineIndexManager
+from file_processor.summary_generator import SummaryGenerator
+
+TOTAL_LINES = 400
+VOLATILE_KEYS = ('processing_time', 'generated_at', 'updated_at')
+
+
+def _original_lines():
+    lines = []
+    for i in range(1, TOTAL_LINES + 1):
+        if i % 9 == 0:
+            lines.append("\n")
+        elif i % 9 == 1:
+            lines.append(f"第 {i // 9 + 1} 章 段落標題\n")
+        else:
+            lines.append(f"這是第 {i} 行的內容，包含一些文字 sample text {i * 7 % 13}。\n")
+    return lines
+
+
+def _apply_edit(lines, start_line, end_line, new_content):
+    """與 LocalFileTools.edit_file 相同的行替換方式"""
+    new_lines = new_content.split('\n')
+    if not new_content.endswith('\n'):
+        new_lines = [line + '\n' for line in new_lines[:-1]] + [new_lines[-1]]
+    else:
+        new_lines = [line + '\n' for line in new_lines]
+    return lines[:start_line - 1] + new_lines + lines[end_line:]
+
+
+def _comparable(summary):
+    return {key: value for key, value in summary.items() if key not in VOLATILE_KEYS}
+
+
+EDITS = {
+    "start_same_count": (1, 2, "新的開頭\n第二行被改寫\n"),
+    "middle_same_count": (200, 202, "中間一\n中間二\n中間三\n"),
+    "end_same_count": (TOTAL_LINES - 1, TOTAL_LINES, "倒數第二行\n最後一行\n"),
+    "start_insert": (1, 1, "插入一\n插入二\n插入三\n原第一行\n"),
+    "middle_delete": (150, 170, "只剩一行\n"),
+    "middle_grow": (100, 101, "".join(f"新增第 {i} 行\n\n" for i in range(30))),
+    "end_shrink": (TOTAL_LINES - 30, TOTAL_LINES, "結尾\n"),
+    "middle_no_trailing_newline": (120, 125, "沒有換行結尾的內容"),
+    "end_no_trailing_newline": (TOTAL_LINES - 2, TOTAL_LINES, "最後\n沒有換行"),
+}
+
+
+@pytest.mark.parametrize("edit", EDITS)
+def test_incremental_update_matches_full_regeneration(tmp_path, monkeypatch, edit):
+    index_manager = LineIndexManager(tmp_path / "line_index")
+    monkeypatch.setattr(summary_generator, "line_index_manager", index_manager)
+
+    text_file = tmp_path / "document.txt"
+    lines = _original_lines()
+    text_file.write_text("".join(lines), encoding="utf-8")
+    start_line, end_line, new_content = EDITS[edit]
+
+    async def run():
+        generator = SummaryGenerator()
+        before = await generator.generate_file_summary(str(text_file))
+        assert len(before['segment_stats']) > 10
+
+        text_file.write_text("".join(_apply_edit(lines, start_line, end_line, new_content)), encoding="utf-8")
+        index_manager.invalidate(text_file)
+
+        updated = await generator.update_file_summary(before, start_line, end_line, new_content, str(text_file))
+        regenerated = await SummaryGenerator().generate_file_summary(str(text_file))
+        return updated, regenerated
+
+    updated, regenerated = asyncio.run(run())
+    # 走增量路徑（完整重新生成不會有 updated_at）
+    assert 'updated_at' in updated
+    assert _comparable(updated) == _comparable(regenerated)